@@ -0,0 +1,74 @@
+# app/aggregate.py
+import re
+from typing import List, Tuple
+
+# Aggregates computed per tag and time bucket inside Postgres
+AGGREGATE_FUNCTIONS = {
+    "min": "min(tag_value)",
+    "max": "max(tag_value)",
+    "avg": "avg(tag_value)",
+    "sum": "sum(tag_value)",
+    "stddev": "stddev_samp(tag_value)",
+    "first": "(array_agg(tag_value ORDER BY timestamp ASC))[1]",
+    "last": "(array_agg(tag_value ORDER BY timestamp DESC))[1]",
+}
+DEFAULT_AGGREGATE_FUNCTIONS = "min,max,avg"
+
+# The same aggregates merged from rollup rows (count/min/max/sum/sumsq); only
+# these can be answered from rollup tables
+ROLLUP_AGGREGATE_FUNCTIONS = {
+    "min": "min(value_min)",
+    "max": "max(value_max)",
+    "avg": "sum(value_sum) / sum(value_count)",
+    "sum": "sum(value_sum)",
+    "stddev": (
+        "CASE WHEN sum(value_count) > 1 THEN sqrt(greatest("
+        "(sum(value_sumsq) - sum(value_sum) ^ 2 / sum(value_count)) / (sum(value_count) - 1), 0)) END"
+    ),
+}
+
+# Buckets start on this origin so the same bucket width always lines up
+BUCKET_ORIGIN = "2000-01-01 00:00:00"
+
+_PERCENTILE_PATTERN = re.compile(r"^p(\d{1,2}(?:\.\d+)?|100)$")
+
+
+def parse_aggregate_functions(fns: str) -> List[str]:
+    """Parse a comma separated list such as 'min,max,avg,p95' into unique names"""
+    names = []
+    for name in (fns or "").split(","):
+        name = name.strip().lower()
+        if not name or name in names:
+            continue
+        if name not in AGGREGATE_FUNCTIONS and not _PERCENTILE_PATTERN.match(name):
+            raise ValueError(
+                f"Unknown aggregate '{name}', expected {', '.join(AGGREGATE_FUNCTIONS)} or a percentile like p95"
+            )
+        names.append(name)
+    if not names:
+        raise ValueError("At least one aggregate function is required")
+    return names
+
+
+def supports_rollup(names: List[str]) -> bool:
+    return all(name in ROLLUP_AGGREGATE_FUNCTIONS for name in names)
+
+
+def aggregate_select(names: List[str], rollup: bool = False) -> Tuple[str, list]:
+    """
+    SELECT list and parameters computing each aggregate as column agg_<index>,
+    over raw rows or, with `rollup`, over rollup rows
+    """
+    columns = []
+    params = []
+    for index, name in enumerate(names):
+        if rollup:
+            expression = ROLLUP_AGGREGATE_FUNCTIONS[name]
+        elif name in AGGREGATE_FUNCTIONS:
+            expression = AGGREGATE_FUNCTIONS[name]
+        else:
+            # Ordered-set aggregate, interpolated between the nearest values
+            expression = "percentile_cont(%s) WITHIN GROUP (ORDER BY tag_value)"
+            params.append(float(name[1:]) / 100)
+        columns.append(f"({expression})::float8 AS agg_{index}")
+    return ", ".join(columns), params
@@ -0,0 +1,509 @@
+# app/benchmark.py
+"""
+Performance benchmarks for the storage and ingest paths.
+
+Usage:
+    python benchmark.py concurrency --requests 50 --query-seconds 0.05
+    python benchmark.py ingest --rows 1000000 --tags 20
+    python benchmark.py upload --rows 1000000 --legacy-rows 20000
+    python benchmark.py stream --rows 5000000 --chunk-rows 100000
+    python benchmark.py serialize --rows 200000
+    python benchmark.py rules --rows 5000000
+    python benchmark.py embed --texts 500 --latency 0.2
+    python benchmark.py vectors --vectors 2000 --latency 0.05
+    python benchmark.py search --vectors 10000 --dimension 1024
+"""
+import os
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+from datetime import datetime
+from typing import List
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from models import TimeSeriesData, Rule
+from rules import evaluate_rule, rule_violations
+from responses import TrustedJSONResponse, orjson
+from local_index import LocalIndex
+from vector_writer import VectorWriter
+from database import get_pool, run_in_db_executor, DB_EXECUTOR_WORKERS
+from ingest import (
+    prepare_time_series_frame,
+    copy_time_series_frame,
+    normalize_upload_frame,
+    iter_upload_chunks,
+    UploadNormalizer,
+)
+
+load_dotenv()
+
+
+def _report(label: str, count: int, elapsed: float) -> None:
+    print(f"{label:<40} {count:>10} in {elapsed:8.3f}s  ({count / elapsed:,.1f}/s)")
+
+
+def _slow_query(pool, seconds: float) -> None:
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_sleep(%s)", (seconds,))
+    finally:
+        pool.putconn(conn)
+
+
+async def _blocking_request(pool, seconds: float) -> None:
+    # What DatabaseStorage used to do: a synchronous query inside `async def`
+    _slow_query(pool, seconds)
+
+
+async def _executor_request(pool, seconds: float) -> None:
+    await run_in_db_executor(_slow_query, pool, seconds)
+
+
+async def _run_concurrently(handler, pool, requests: int, seconds: float) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(pool, seconds) for _ in range(requests)))
+    return time.perf_counter() - started
+
+
+def bench_concurrency(args) -> None:
+    """N parallel requests issuing a slow query, blocking vs. DB executor"""
+    pool = get_pool(os.getenv("DATABASE_URL"))
+    pool.open()
+    print(f"{args.requests} parallel requests, {args.query_seconds}s query, {DB_EXECUTOR_WORKERS} DB workers")
+    for label, handler in [
+        ("blocking call in event loop", _blocking_request),
+        ("run_in_db_executor", _executor_request),
+    ]:
+        elapsed = asyncio.run(_run_concurrently(handler, pool, args.requests, args.query_seconds))
+        _report(label, args.requests, elapsed)
+    print(pool.metrics())
+
+
+def _synthetic_rows(rows: int, tags: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "timestamp": pd.date_range("2024-01-01", periods=rows, freq="s"),
+        "tagId": np.char.add("TAG_", (np.arange(rows) % tags).astype(str)),
+        "tagLabel": np.char.add("Tag ", (np.arange(rows) % tags).astype(str)),
+        "value": rng.normal(50, 20, rows),
+        "unit": "C",
+        "minRange": 0.0,
+        "maxRange": 100.0,
+    })
+
+
+def bench_ingest(args) -> None:
+    """Bulk ingest into a scratch table: COPY vs. execute_values"""
+    pool = get_pool(os.getenv("DATABASE_URL"))
+    raw = _synthetic_rows(args.rows, args.tags)
+
+    started = time.perf_counter()
+    frame = prepare_time_series_frame(raw)
+    _report("vectorized normalization", len(frame), time.perf_counter() - started)
+
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("CREATE TEMP TABLE bench_time_series (LIKE time_series_data INCLUDING DEFAULTS)")
+            cur.execute("ALTER TABLE bench_time_series ALTER COLUMN dataset_id SET DEFAULT 0")
+
+            started = time.perf_counter()
+            copied = copy_time_series_frame(cur, frame, table="bench_time_series")
+            _report("COPY FROM STDIN", copied, time.perf_counter() - started)
+
+            cur.execute("TRUNCATE bench_time_series")
+            values = list(frame.itertuples(index=False, name=None))
+            started = time.perf_counter()
+            execute_values(
+                cur,
+                "INSERT INTO bench_time_series (timestamp, tag_id, tag_label, tag_value, unit, "
+                "min_range, max_range, normalized_value) VALUES %s",
+                values,
+                page_size=1000,
+            )
+            _report("execute_values (page_size=1000)", len(values), time.perf_counter() - started)
+        conn.rollback()
+
+
+def _synthetic_upload(rows: int, tags: int, bad_fraction: float = 0.01) -> pd.DataFrame:
+    """Raw frame shaped like pd.read_csv output, with a share of unparseable rows"""
+    frame = _synthetic_rows(rows, tags)
+    raw = pd.DataFrame({
+        "Timestamp": frame["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "Tag ID": frame["tagId"],
+        "Label": frame["tagLabel"],
+        "Value": frame["value"].round(3).astype(str),
+        "Unit": frame["unit"],
+        "Min": frame["minRange"],
+        "Max": frame["maxRange"],
+    })
+    bad = np.random.default_rng(1).random(rows) < bad_fraction
+    raw.loc[bad, "Value"] = "n/a"
+    return raw
+
+
+def _legacy_normalize_upload(df: pd.DataFrame) -> list:
+    """The former per-row iterrows conversion in upload_file, for comparison"""
+    df = df.copy()
+    df.columns = df.columns.str.strip().str.lower()
+    df = df.rename(columns={"tag id": "tagId", "label": "tagLabel", "min": "minRange", "max": "maxRange"})
+    rows = []
+    for _, row in df.iterrows():
+        try:
+            rows.append({
+                "timestamp": pd.to_datetime(row["timestamp"]),
+                "tagId": str(row["tagId"]),
+                "value": float(row["value"]),
+                "tagLabel": str(row.get("tagLabel", row.get("tag_label", row.get("label", row["tagId"])))),
+                "unit": str(row.get("unit", "")),
+                "minRange": float(row.get("minRange", row.get("min_range", row.get("min", 0))) or 0),
+                "maxRange": float(row.get("maxRange", row.get("max_range", row.get("max", 100))) or 100),
+            })
+        except Exception:
+            continue
+    return rows
+
+
+def bench_upload(args) -> None:
+    """Upload frame normalization: vectorized masks vs. per-row iterrows"""
+    raw = _synthetic_upload(args.rows, args.tags)
+
+    started = time.perf_counter()
+    frame, errors = normalize_upload_frame(raw)
+    _report("normalize_upload_frame", len(raw), time.perf_counter() - started)
+    print(f"  {len(frame)} valid rows, {args.rows - len(frame)} rejected, first error: {errors[:1]}")
+
+    sample = raw.iloc[:args.legacy_rows]
+    started = time.perf_counter()
+    _legacy_normalize_upload(sample)
+    _report("iterrows (legacy)", len(sample), time.perf_counter() - started)
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_stream(args) -> None:
+    """Chunked CSV parse + normalization of a large file, reporting peak RSS"""
+    with tempfile.NamedTemporaryFile(suffix=".csv") as spool:
+        written = 0
+        while written < args.rows:
+            block = min(args.chunk_rows, args.rows - written)
+            _synthetic_upload(block, args.tags).to_csv(spool, header=written == 0, index=False)
+            written += block
+        spool.flush()
+        print(f"{args.rows} rows, {os.path.getsize(spool.name) / 2**20:,.0f} MiB on disk, "
+              f"peak RSS before parsing {_peak_rss_mb():,.0f} MiB")
+
+        started = time.perf_counter()
+        normalizer = UploadNormalizer(iter_upload_chunks(spool.name, spool.name, args.chunk_rows))
+        valid = 0
+        for chunks, frame in enumerate(normalizer, start=1):
+            valid += len(prepare_time_series_frame(frame))
+        _report(f"streamed in {chunks} chunks", normalizer.rows_processed, time.perf_counter() - started)
+        print(f"  {valid} valid rows, peak RSS {_peak_rss_mb():,.0f} MiB")
+
+
+def _api_rows(rows: int, tags: int) -> List[dict]:
+    """Rows shaped like DatabaseStorage._map_time_series_row output"""
+    frame = prepare_time_series_frame(_synthetic_rows(rows, tags))
+    created = datetime.now()
+    return [
+        {
+            "id": index,
+            "timestamp": timestamp.to_pydatetime(),
+            "tagId": tag_id,
+            "value": value,
+            "tagLabel": tag_label,
+            "unit": unit,
+            "minRange": min_range,
+            "maxRange": max_range,
+            "normalizedValue": normalized,
+            "createdAt": created,
+            "datasetId": 1,
+        }
+        for index, (timestamp, tag_id, tag_label, value, unit, min_range, max_range, normalized)
+        in enumerate(frame.itertuples(index=False, name=None), start=1)
+    ]
+
+
+def bench_serialize(args) -> None:
+    """Read response cost per row: pydantic models + response_model vs. trusted dicts + TrustedJSONResponse"""
+    rows = _api_rows(args.rows, args.tags)
+    app = FastAPI()
+
+    @app.get("/models", response_model=List[TimeSeriesData])
+    async def models_route():
+        return [TimeSeriesData(**row) for row in rows]
+
+    @app.get("/trusted", response_model=List[TimeSeriesData])
+    async def trusted_route():
+        return TrustedJSONResponse(rows)
+
+    print(f"{args.rows} rows, orjson {'available' if orjson else 'missing (stdlib json fallback)'}")
+    bodies = []
+    with TestClient(app) as client:
+        for label, path in [
+            ("models + response_model validation", "/models"),
+            ("trusted dicts + TrustedJSONResponse", "/trusted"),
+        ]:
+            client.get(path)
+            started = time.perf_counter()
+            response = client.get(path)
+            elapsed = time.perf_counter() - started
+            _report(label, len(rows), elapsed)
+            print(f"  {elapsed / len(rows) * 1e6:.2f} us/row, {len(response.content) / 2**20:,.1f} MiB")
+            bodies.append(response.json())
+    print("  identical responses" if bodies[0] == bodies[1] else "  RESPONSES DIFFER")
+
+
+def _loop_violations(rule: Rule, timestamps_ms: np.ndarray, values: np.ndarray) -> list:
+    """Row-by-row baseline: compare each reading and grow the open region"""
+    regions, current = [], None
+    for timestamp, value in zip(timestamps_ms.tolist(), values.tolist()):
+        if value > rule.threshold:
+            if current is None:
+                current = {"start": timestamp, "count": 0, "min": value, "max": value}
+            current.update(end=timestamp, count=current["count"] + 1,
+                           min=min(current["min"], value), max=max(current["max"], value))
+        elif current is not None:
+            regions.append(current)
+            current = None
+    if current is not None:
+        regions.append(current)
+    return regions
+
+
+def bench_rules(args) -> None:
+    """Rule evaluation over one tag's series: NumPy masks vs. a per-row loop"""
+    rng = np.random.default_rng(0)
+    timestamps = np.arange(args.rows, dtype=np.int64) * 1000
+    # Slow oscillation plus noise, so violations come in runs of varying
+    # length; more noise means more, shorter runs near each threshold
+    values = 50 + 30 * np.sin(np.arange(args.rows) / 5000) + rng.normal(0, args.noise, args.rows)
+    created = datetime.now()
+    rules = [
+        Rule(id=1, tagId="TAG_0", condition="greater_than", threshold=75, severity="high", createdAt=created),
+        Rule(id=2, tagId="TAG_0", condition="less_than", threshold=25, severity="medium", createdAt=created),
+        Rule(id=3, tagId="TAG_0", condition="between", threshold=45, thresholdMax=55, severity="low",
+             createdAt=created),
+        Rule(id=4, tagId="TAG_0", condition="greater_equal", threshold=90, severity="critical", createdAt=created),
+    ]
+
+    started = time.perf_counter()
+    regions = evaluate_rule(rules[0], timestamps, values)
+    _report("vectorized greater_than", args.rows, time.perf_counter() - started)
+    print(f"  {len(regions)} regions")
+
+    frame = pd.DataFrame({"tag_id": "TAG_0", "timestamp_ms": timestamps, "value": values})
+    started = time.perf_counter()
+    regions = rule_violations(rules, frame)
+    _report(f"vectorized {len(rules)} rules incl. grouping", args.rows, time.perf_counter() - started)
+    print(f"  {len(regions)} regions")
+
+    legacy_rows = min(args.legacy_rows, args.rows)
+    started = time.perf_counter()
+    loop_regions = _loop_violations(rules[0], timestamps[:legacy_rows], values[:legacy_rows])
+    _report("per-row loop greater_than", legacy_rows, time.perf_counter() - started)
+    same = [(r["start"], r["end"], r["count"]) for r in loop_regions] == [
+        (pd.Timestamp(r["startTime"]).value // 10**6, pd.Timestamp(r["endTime"]).value // 10**6, r["pointCount"])
+        for r in evaluate_rule(rules[0], timestamps[:legacy_rows], values[:legacy_rows])
+    ]
+    print("  identical regions" if same else "  REGIONS DIFFER")
+
+
+class _SimulatedBedrock:
+    """invoke_model stand-in with a fixed latency that throttles a fraction of calls"""
+
+    def __init__(self, latency: float, throttle_rate: float):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self.throttled = 0
+        self._rng = np.random.default_rng(0)
+
+    def invoke_model(self, body: str, **kwargs):
+        from botocore.exceptions import ClientError
+        import io, json
+        self.calls += 1
+        time.sleep(self.latency)
+        if self._rng.random() < self.throttle_rate:
+            self.throttled += 1
+            raise ClientError({"Error": {"Code": "ThrottlingException"}}, "InvokeModel")
+        seed = abs(hash(json.loads(body)["inputText"])) % 2**32
+        embedding = np.random.default_rng(seed).random(8).tolist()
+        return {"body": io.BytesIO(json.dumps({"embedding": embedding}).encode())}
+
+
+def bench_embed(args) -> None:
+    """Embedding a document's chunks: sequential embed_text vs. concurrent embed_many"""
+    import embedding
+    from embedding_cache import EmbeddingCache
+
+    texts = [f"Section {i}: pump P-{i % 40} maintenance procedure" for i in range(args.texts)]
+    results = []
+    for label in ("sequential embed_text", f"embed_many ({embedding.EMBEDDING_CONCURRENCY} workers)"):
+        embedding.client = _SimulatedBedrock(args.latency, args.throttle_rate)
+        embedding.embedding_cache = EmbeddingCache(path="")
+
+        async def run():
+            if label.startswith("sequential"):
+                return [await embedding.embed_text(text) for text in texts]
+            return await embedding.embed_many(texts)
+
+        started = time.perf_counter()
+        results.append(asyncio.run(run()))
+        _report(label, len(texts), time.perf_counter() - started)
+        print(f"  {embedding.client.calls} calls, {embedding.client.throttled} throttled")
+    embedding.shutdown_embedding_executor()
+    print("  identical embeddings" if results[0] == results[1] else "  EMBEDDINGS DIFFER")
+
+
+class _SlowIndex(LocalIndex):
+    """LocalIndex whose upserts take a fixed round trip plus time proportional to payload"""
+
+    def __init__(self, latency: float, seconds_per_mb: float):
+        super().__init__("bench")
+        self.latency = latency
+        self.seconds_per_mb = seconds_per_mb
+        self.requests = 0
+
+    def upsert(self, vectors, **kwargs):
+        self.requests += 1
+        time.sleep(self.latency + len(orjson.dumps(vectors)) / 1e6 * self.seconds_per_mb)
+        return super().upsert(vectors, **kwargs)
+
+
+def bench_vectors(args) -> None:
+    """Indexing vectors: one upsert request per vector vs. the batched VectorWriter"""
+    rng = np.random.default_rng(0)
+    vectors = [
+        {"id": f"doc-{i}", "values": rng.random(args.dimension).tolist(), "metadata": {"source": f"manual - Section: {i}"}}
+        for i in range(args.vectors)
+    ]
+    per_request = _SlowIndex(args.latency, args.seconds_per_mb)
+    started = time.perf_counter()
+    for vector in vectors:
+        per_request.upsert(vectors=[vector])
+    _report("one upsert per vector", len(vectors), time.perf_counter() - started)
+    print(f"  {per_request.requests} requests")
+
+    batched = _SlowIndex(args.latency, args.seconds_per_mb)
+    writer = VectorWriter(batched, name="bench")
+    started = time.perf_counter()
+    writer.add(vectors)
+    writer.flush()
+    _report(f"VectorWriter ({writer.concurrency} in flight)", len(vectors), time.perf_counter() - started)
+    writer.close()
+    print(f"  {batched.requests} requests")
+    ids = [vector["id"] for vector in vectors]
+    same = per_request.fetch(ids) == batched.fetch(ids)
+    print("  identical index contents" if same else "  INDEX CONTENTS DIFFER")
+
+
+def bench_search(args) -> None:
+    """LocalIndex query latency: unfiltered and with the filters the RAG paths use"""
+    rng = np.random.default_rng(0)
+    labels = ["Vibration", "Temperature", "Conductivity"]
+    with tempfile.TemporaryDirectory() as path:
+        index = LocalIndex("bench", path)
+        started = time.perf_counter()
+        for offset in range(0, args.vectors, 1000):
+            index.upsert([
+                {
+                    "id": f"chunk-{i}",
+                    "values": rng.random(args.dimension, dtype=np.float32),
+                    "metadata": {"tagLabel": labels[i % 3], "status": "bad" if i % 10 == 0 else "good",
+                                 "user_id": f"user-{i % 20}"},
+                }
+                for i in range(offset, min(offset + 1000, args.vectors))
+            ])
+        _report(f"upsert ({'hnsw' if index.describe_index_stats()['hnsw'] else 'exact'})", args.vectors,
+                time.perf_counter() - started)
+        queries = rng.random((args.queries, args.dimension), dtype=np.float32)
+        for label, filter in (
+            ("unfiltered", None),
+            ("status != bad", {"status": {"$ne": "bad"}}),
+            ("tagLabel + status != bad", {"tagLabel": "Vibration", "status": {"$ne": "bad"}}),
+            ("user_id", {"user_id": "user-3"}),
+        ):
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                index.query(vector=query, top_k=10, include_metadata=True, filter=filter)
+                timings.append(time.perf_counter() - started)
+            print(f"  {label:<28} p50 {np.percentile(timings, 50) * 1e3:7.3f} ms  p99 {np.percentile(timings, 99) * 1e3:7.3f} ms")
+        index.close()
+        started = time.perf_counter()
+        LocalIndex("bench", path)
+        print(f"  reopen {time.perf_counter() - started:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    concurrency = sub.add_parser("concurrency", help=bench_concurrency.__doc__)
+    concurrency.add_argument("--requests", type=int, default=50)
+    concurrency.add_argument("--query-seconds", type=float, default=0.05)
+    concurrency.set_defaults(func=bench_concurrency)
+
+    ingest = sub.add_parser("ingest", help=bench_ingest.__doc__)
+    ingest.add_argument("--rows", type=int, default=1_000_000)
+    ingest.add_argument("--tags", type=int, default=20)
+    ingest.set_defaults(func=bench_ingest)
+
+    upload = sub.add_parser("upload", help=bench_upload.__doc__)
+    upload.add_argument("--rows", type=int, default=1_000_000)
+    upload.add_argument("--tags", type=int, default=20)
+    upload.add_argument("--legacy-rows", type=int, default=20_000)
+    upload.set_defaults(func=bench_upload)
+
+    stream = sub.add_parser("stream", help=bench_stream.__doc__)
+    stream.add_argument("--rows", type=int, default=5_000_000)
+    stream.add_argument("--tags", type=int, default=20)
+    stream.add_argument("--chunk-rows", type=int, default=100_000)
+    stream.set_defaults(func=bench_stream)
+
+    serialize = sub.add_parser("serialize", help=bench_serialize.__doc__)
+    serialize.add_argument("--rows", type=int, default=200_000)
+    serialize.add_argument("--tags", type=int, default=20)
+    serialize.set_defaults(func=bench_serialize)
+
+    rules = sub.add_parser("rules", help=bench_rules.__doc__)
+    rules.add_argument("--rows", type=int, default=5_000_000)
+    rules.add_argument("--legacy-rows", type=int, default=1_000_000)
+    rules.add_argument("--noise", type=float, default=1.0)
+    rules.set_defaults(func=bench_rules)
+
+    embed = sub.add_parser("embed", help=bench_embed.__doc__)
+    embed.add_argument("--texts", type=int, default=500)
+    embed.add_argument("--latency", type=float, default=0.2)
+    embed.add_argument("--throttle-rate", type=float, default=0.05)
+    embed.set_defaults(func=bench_embed)
+
+    vectors = sub.add_parser("vectors", help=bench_vectors.__doc__)
+    vectors.add_argument("--vectors", type=int, default=2000)
+    vectors.add_argument("--dimension", type=int, default=1024)
+    vectors.add_argument("--latency", type=float, default=0.05)
+    vectors.add_argument("--seconds-per-mb", type=float, default=0.1)
+    vectors.set_defaults(func=bench_vectors)
+
+    search = sub.add_parser("search", help=bench_search.__doc__)
+    search.add_argument("--vectors", type=int, default=10_000)
+    search.add_argument("--dimension", type=int, default=1024)
+    search.add_argument("--queries", type=int, default=200)
+    search.set_defaults(func=bench_search)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
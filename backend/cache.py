@@ -0,0 +1,93 @@
+# app/cache.py
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Tuple
+
+# Seconds a cached metadata result is served before it is re-read. Writes made
+# through DatabaseStorage invalidate immediately; the TTL only bounds how long
+# an out-of-band change (another process, a manual SQL fix) goes unseen.
+METADATA_CACHE_TTL = float(os.getenv("METADATA_CACHE_TTL", "60"))
+# Memory bound: cached results, and rows summed over all of them
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "256"))
+METADATA_CACHE_MAX_ROWS = int(os.getenv("METADATA_CACHE_MAX_ROWS", "50000"))
+
+
+class TTLCache:
+    """
+    LRU cache whose entries also expire after `ttl` seconds. Keys are tuples
+    starting with the resource name, so invalidate(resource) drops all of a
+    resource's entries. Size is bounded by entry count and by total rows (a
+    list value weighs its length, anything else 1); least recently used
+    entries are evicted first.
+    """
+
+    def __init__(
+        self,
+        ttl: float = METADATA_CACHE_TTL,
+        max_entries: int = METADATA_CACHE_MAX_ENTRIES,
+        max_rows: int = METADATA_CACHE_MAX_ROWS,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries: "OrderedDict[Tuple, Tuple[Any, float, int]]" = OrderedDict()  # value, expires, rows
+        self._rows = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def _weight(value: Any) -> int:
+        return max(len(value), 1) if isinstance(value, list) else 1
+
+    def _remove(self, key: Tuple) -> None:
+        _, _, rows = self._entries.pop(key)
+        self._rows -= rows
+
+    def get(self, key: Tuple) -> Tuple[bool, Any]:
+        """(True, value) on a live hit, otherwise (False, None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return True, entry[0]
+
+    def put(self, key: Tuple, value: Any) -> None:
+        rows = self._weight(value)
+        if self.ttl <= 0 or rows > self.max_rows:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, rows)
+            self._rows += rows
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate(self, *resources: Hashable) -> None:
+        """Drop every entry of `resources`"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] in resources]:
+                self._remove(key)
+                self._stats["invalidations"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot of cache sizing and counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "rows": self._rows,
+                "max_entries": self.max_entries,
+                "max_rows": self.max_rows,
+                "ttl": self.ttl,
+                **self._stats,
+            }
@@ -0,0 +1,80 @@
+# app/catalog.py
+from typing import List
+from rollup import ROLLUP_TABLES
+
+TAG_CATALOG_TABLE = "tag_info"
+
+# Stable per-tag chart color, as get_available_tags has always computed it
+# (MOD rather than %, which would clash with query placeholders)
+TAG_COLOR_SQL = "'#' || LPAD(CAST(MOD(ABS(HASHTEXT({tag_id})), 16777216) AS TEXT), 6, '0')"
+
+TAG_CATALOG_COLUMNS = '"tagId", "tagLabel", unit, "minRange", "maxRange", color, "firstTimestamp", "lastTimestamp", "numPoints"'
+
+# Adds the columns create_all cannot add to an existing tag_info table
+TAG_CATALOG_MIGRATIONS = [
+    f'ALTER TABLE {TAG_CATALOG_TABLE} ADD COLUMN IF NOT EXISTS "firstTimestamp" timestamp',
+    f'ALTER TABLE {TAG_CATALOG_TABLE} ADD COLUMN IF NOT EXISTS "lastTimestamp" timestamp',
+    f'ALTER TABLE {TAG_CATALOG_TABLE} ADD COLUMN IF NOT EXISTS "numPoints" bigint NOT NULL DEFAULT 0',
+]
+
+# Label, unit and range come from each tag's most recent reading and the
+# point count from its daily rollups, so a refresh costs a few index lookups
+# per tag; run it after refresh_rollups
+_REFRESH = f"""
+    INSERT INTO {TAG_CATALOG_TABLE} ({TAG_CATALOG_COLUMNS})
+    SELECT latest.tag_id, latest.tag_label, latest.unit, latest.min_range, latest.max_range,
+           {TAG_COLOR_SQL.format(tag_id="latest.tag_id")}, earliest.timestamp, latest.timestamp,
+           coalesce(points.num_points, 0)
+    FROM unnest(%s::text[]) AS tags (tag_id)
+    CROSS JOIN LATERAL (
+        SELECT tag_id, tag_label, unit, min_range, max_range, timestamp
+        FROM time_series_data t WHERE t.tag_id = tags.tag_id
+        ORDER BY timestamp DESC LIMIT 1
+    ) latest
+    CROSS JOIN LATERAL (
+        SELECT min(timestamp) AS timestamp FROM time_series_data t WHERE t.tag_id = tags.tag_id
+    ) earliest
+    CROSS JOIN LATERAL (
+        SELECT sum(value_count) AS num_points FROM {ROLLUP_TABLES["1d"]} r WHERE r.tag_id = tags.tag_id
+    ) points
+    ORDER BY 1
+    ON CONFLICT ("tagId") DO UPDATE SET
+        {", ".join(f"{column} = EXCLUDED.{column}" for column in TAG_CATALOG_COLUMNS.split(", ")[1:])}
+"""
+
+
+def refresh_tag_catalog(cur, tag_ids: List[str]) -> None:
+    """Recompute the tag_info rows of `tag_ids`, dropping tags that no longer have data"""
+    if not tag_ids:
+        return
+    tag_ids = sorted(tag_ids)
+    cur.execute(_REFRESH, (tag_ids,))
+    cur.execute(
+        f'DELETE FROM {TAG_CATALOG_TABLE} c WHERE c."tagId" = ANY(%s) '
+        'AND NOT EXISTS (SELECT 1 FROM time_series_data t WHERE t.tag_id = c."tagId")',
+        (tag_ids,),
+    )
+
+
+def clear_tag_catalog(cur) -> None:
+    cur.execute(f"DELETE FROM {TAG_CATALOG_TABLE}")
+
+
+def rebuild_tag_catalog(cur) -> None:
+    """Recompute tag_info from time_series_data"""
+    clear_tag_catalog(cur)
+    cur.execute(f"""
+        INSERT INTO {TAG_CATALOG_TABLE} ({TAG_CATALOG_COLUMNS})
+        SELECT latest.tag_id, latest.tag_label, latest.unit, latest.min_range, latest.max_range,
+               {TAG_COLOR_SQL.format(tag_id="latest.tag_id")}, stats.first_ts, stats.last_ts, stats.num_points
+        FROM (
+            SELECT DISTINCT ON (tag_id) tag_id, tag_label, unit, min_range, max_range
+            FROM time_series_data
+            ORDER BY tag_id, timestamp DESC
+        ) latest
+        JOIN (
+            SELECT tag_id, min(timestamp) AS first_ts, max(timestamp) AS last_ts, count(*) AS num_points
+            FROM time_series_data
+            GROUP BY tag_id
+        ) stats USING (tag_id)
+    """)
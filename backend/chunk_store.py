@@ -0,0 +1,106 @@
+# app/chunk_store.py
+import os
+import hashlib
+from typing import Any, Dict, List, Optional
+from psycopg2.extras import RealDictCursor, execute_values
+from database import get_pool, run_in_db_executor
+
+CHUNK_TABLE = "document_chunks"
+CHUNK_COLUMNS = ("id", "document_name", "document_hash", "section", "source", "text", "user_id")
+
+
+def document_hash(file_path: str) -> str:
+    """SHA-256 of a document's bytes"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(document_name: str, section: int, user_id: Optional[str] = None) -> str:
+    """
+    Id of a document chunk and of its vector. Scoped by owner, so users
+    uploading documents under the same name never overwrite each other's.
+    """
+    return f"{user_id or 'global'}:{document_name}-{section}"
+
+
+class ChunkStore:
+    """
+    Document chunk texts in Postgres, keyed by the id of the chunk's vector.
+    Retrieval hydrates a query's top-k matches with one batched lookup
+    instead of carrying every text in the vector index's metadata.
+    """
+
+    def __init__(self, database_url: Optional[str] = None):
+        self.database_url = database_url or os.getenv("DATABASE_URL")
+        self._pool = None
+
+    @property
+    def pool(self):
+        # Opened on first use, so importing the vector store needs no database
+        if self._pool is None:
+            self._pool = get_pool(self.database_url)
+        return self._pool
+
+    async def replace_document(
+        self, document_name: str, chunks: List[Dict[str, Any]], user_id: Optional[str] = None
+    ) -> List[str]:
+        """
+        Store `chunks` (dicts with CHUNK_COLUMNS keys) as the chunks of
+        `user_id`'s document `document_name`, in one transaction. Returns the
+        ids of the document's previous chunks that were dropped, so their
+        vectors can be deleted.
+        """
+        return await run_in_db_executor(self._replace_document, document_name, chunks, user_id)
+
+    def _replace_document(
+        self, document_name: str, chunks: List[Dict[str, Any]], user_id: Optional[str] = None
+    ) -> List[str]:
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                # Other users may have uploaded a document under the same name
+                cur.execute(
+                    f"DELETE FROM {CHUNK_TABLE} WHERE document_name = %s AND user_id IS NOT DISTINCT FROM %s RETURNING id",
+                    (document_name, user_id),
+                )
+                previous = {row[0] for row in cur.fetchall()}
+                execute_values(
+                    cur,
+                    f"""
+                    INSERT INTO {CHUNK_TABLE} ({", ".join(CHUNK_COLUMNS)}) VALUES %s
+                    ON CONFLICT (id) DO UPDATE SET
+                    {", ".join(f"{column} = EXCLUDED.{column}" for column in CHUNK_COLUMNS[1:])},
+                    created_at = now()
+                    """,
+                    [tuple(chunk.get(column) for column in CHUNK_COLUMNS) for chunk in chunks],
+                    page_size=500,
+                )
+            conn.commit()
+            return sorted(previous - {chunk["id"] for chunk in chunks})
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    async def get_chunks(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Chunks of `ids` by id; ids without a stored chunk are left out"""
+        if not ids:
+            return {}
+        return await run_in_db_executor(self._get_chunks, ids)
+
+    def _get_chunks(self, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(
+                    f"SELECT {', '.join(CHUNK_COLUMNS)} FROM {CHUNK_TABLE} WHERE id = ANY(%s)", (list(ids),)
+                )
+                rows = cur.fetchall()
+            conn.commit()
+            return {row["id"]: dict(row) for row in rows}
+        finally:
+            self.pool.putconn(conn)
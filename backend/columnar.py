@@ -0,0 +1,102 @@
+# app/columnar.py
+import io
+import json
+from typing import Any, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+
+# Optional: only format=arrow needs pyarrow
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+ARROW_AVAILABLE = pa is not None
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Frame read for columnar responses: one row per reading, in timestamp order
+COLUMNAR_FRAME_COLUMNS = ["tag_id", "timestamp_ms", "value"]
+
+
+def read_time_series_frame(cur, query: str, params: list) -> pd.DataFrame:
+    """
+    Read the tag, epoch-ms timestamp and value of each row `query` returns
+    with COPY, parsed in one vectorized pass rather than row by row
+    """
+    select = cur.mogrify(
+        f"SELECT tag_id, (extract(epoch FROM timestamp) * 1000)::bigint, tag_value FROM ({query}) q", params
+    ).decode()
+    buffer = io.StringIO()
+    cur.copy_expert(f"COPY ({select}) TO STDOUT WITH (FORMAT csv)", buffer)
+    buffer.seek(0)
+    return pd.read_csv(
+        buffer,
+        names=COLUMNAR_FRAME_COLUMNS,
+        dtype={"tag_id": str, "timestamp_ms": np.int64, "value": np.float64},
+        keep_default_na=False,
+    )
+
+
+def tag_groups(frame: pd.DataFrame, sort_timestamps: bool = False
+               ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[Tuple[str, int, int]]]:
+    """
+    The frame's rows grouped by tag as (codes, timestamps, values, slices):
+    each row's index into the sorted tag ids, its epoch-ms timestamp and
+    value, and (tag_id, start, stop) of each tag's rows. Rows keep their order
+    within a tag, or are put in timestamp order with `sort_timestamps`.
+    """
+    codes, tags = pd.factorize(frame["tag_id"], sort=True)
+    if len(tags) <= np.iinfo(np.int16).max:
+        # A stable argsort of 16-bit integers is a radix sort
+        codes = codes.astype(np.int16)
+    timestamps = frame["timestamp_ms"].to_numpy()
+    values = frame["value"].to_numpy()
+    if sort_timestamps:
+        # Cheap for rows read in roughly insertion order, which is near time order
+        by_time = np.argsort(timestamps, kind="stable")
+        codes, timestamps, values = codes[by_time], timestamps[by_time], values[by_time]
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes, minlength=len(tags))
+    stops = np.cumsum(counts)
+    slices = list(zip(tags.tolist(), (stops - counts).tolist(), stops.tolist()))
+    return codes[order], timestamps[order], values[order], slices
+
+
+def columnar_payload(frame: pd.DataFrame, tags: Dict[str, Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    {"tags": [...]} with each tag's metadata once and its readings as parallel
+    arrays of epoch-ms timestamps and values
+    """
+    _, timestamps, values, slices = tag_groups(frame)
+    return {
+        "tags": [
+            {
+                **tags.get(tag_id, {"tagId": tag_id}),
+                "timestamps": timestamps[start:stop].tolist(),
+                "values": values[start:stop].tolist(),
+            }
+            for tag_id, start, stop in slices
+        ]
+    }
+
+
+def arrow_ipc_stream(frame: pd.DataFrame, tags: Dict[str, Dict[str, Any]]) -> bytes:
+    """
+    Arrow IPC stream of (tagId, timestamp, value) columns, grouped by tag, with
+    the per-tag metadata as JSON under the schema metadata key "tags"
+    """
+    if pa is None:
+        raise RuntimeError("format=arrow requires the pyarrow package")
+    codes, timestamps, values, slices = tag_groups(frame)
+    metadata = [tags.get(tag_id, {"tagId": tag_id}) for tag_id, _, _ in slices]
+    table = pa.table({
+        "tagId": pa.DictionaryArray.from_arrays(
+            pa.array(codes.astype(np.int32)), pa.array([tag_id for tag_id, _, _ in slices], pa.string())
+        ),
+        "timestamp": pa.array(timestamps, pa.timestamp("ms")),
+        "value": pa.array(values, pa.float64()),
+    }).replace_schema_metadata({"tags": json.dumps(metadata)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,291 @@
+# app/database.py
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, Any, Optional, Callable
+import psycopg2
+from psycopg2 import extensions
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "600"))
+# Threads that run blocking psycopg2 calls; defaults to the pool size so a
+# worker never waits on a connection held by a queued task. Streamed reads
+# hold a connection between fetches without a worker, so their number is
+# capped by STREAM_MAX_CONCURRENT (streaming.py) to keep that true
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_MAX_SIZE)))
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out before the timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of psycopg2 connections.
+
+    Idle connections are reused instead of opening a new TCP+auth session per
+    request. Connections idle for longer than `health_check_interval` are
+    pinged before being handed out, and connections idle for longer than
+    `max_idle` are closed (down to `min_size`).
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = DB_POOL_MIN_SIZE,
+        max_size: int = DB_POOL_MAX_SIZE,
+        timeout: float = DB_POOL_TIMEOUT,
+        health_check_interval: float = DB_POOL_HEALTH_CHECK_INTERVAL,
+        max_idle: float = DB_POOL_MAX_IDLE,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if min_size < 0 or min_size > max_size:
+            raise ValueError("min_size must be between 0 and max_size")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.max_idle = max_idle
+
+        self._idle = deque()  # (connection, last_used) pairs, most recent on the right
+        self._size = 0  # open connections, idle + checked out
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_timeouts": 0,
+            "checkout_wait_seconds": 0.0,
+            "health_check_failures": 0,
+        }
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        with self._cond:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _discard(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["connections_closed"] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _prune_idle(self) -> list:
+        """Pop connections idle for longer than max_idle; caller must hold the lock"""
+        expired = []
+        now = time.monotonic()
+        while self._idle and self._size - len(expired) > self.min_size:
+            conn, last_used = self._idle[0]
+            if now - last_used < self.max_idle:
+                break
+            self._idle.popleft()
+            expired.append(conn)
+        return expired
+
+    def getconn(self, timeout: Optional[float] = None):
+        """Check out a connection, waiting up to `timeout` seconds for one to free up"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn = None
+            last_used = None
+            expired = []
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    expired = self._prune_idle()
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1  # reserve the slot before connecting outside the lock
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["checkout_timeouts"] += 1
+                        raise PoolTimeout(
+                            f"Timed out after {timeout}s waiting for a database connection "
+                            f"(pool size {self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+
+            for stale in expired:
+                self._discard(stale)
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, last_used):
+                with self._cond:
+                    self._stats["health_check_failures"] += 1
+                self._discard(conn)
+                continue
+
+            with self._cond:
+                self._stats["checkouts"] += 1
+                self._stats["checkout_wait_seconds"] += time.monotonic() - started
+            return conn
+
+    def putconn(self, conn) -> None:
+        """Return a connection to the pool, rolling back any open transaction"""
+        if conn.closed or self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self.putconn(conn)
+
+    def open(self) -> None:
+        """Pre-open connections until the pool holds at least `min_size`"""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def close(self) -> None:
+        """Close all idle connections; checked out connections are closed on return"""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot of pool sizing and counters"""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                **self._stats,
+            }
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_pool(dsn: str) -> ConnectionPool:
+    """Return the process-wide pool for `dsn`, creating it on first use"""
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None:
+            pool = ConnectionPool(dsn)
+            _pools[dsn] = pool
+        return pool
+
+
+def close_pools() -> None:
+    """Close every pool created by get_pool"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Return the process-wide executor dedicated to blocking database calls"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db"
+            )
+        return _executor
+
+
+async def run_in_db_executor(func: Callable, *args, **kwargs):
+    """
+    Run a blocking database function on the DB executor so the event loop
+    keeps serving other requests while it waits on Postgres.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), partial(func, *args, **kwargs))
+
+
+def shutdown_db_executor() -> None:
+    """Stop the DB executor after in-flight calls finish"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
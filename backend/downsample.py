@@ -0,0 +1,83 @@
+# app/downsample.py
+import os
+import re
+from datetime import timedelta
+from typing import Optional
+import numpy as np
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+# LTTB runs in NumPy over a min/max pre-aggregate computed in SQL with this
+# many buckets per output point, so only O(maxPoints) rows leave Postgres
+LTTB_PREAGGREGATE_FACTOR = int(os.getenv("LTTB_PREAGGREGATE_FACTOR", "4"))
+
+_INTERVAL_UNITS = {
+    "ms": timedelta(milliseconds=1),
+    "s": timedelta(seconds=1),
+    "m": timedelta(minutes=1),
+    "h": timedelta(hours=1),
+    "d": timedelta(days=1),
+    "w": timedelta(weeks=1),
+}
+_INTERVAL_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(ms|s|m|h|d|w)\s*$")
+
+
+def parse_interval(value: str) -> timedelta:
+    """Parse a compact interval such as '500ms', '30s', '1m', '6h' or '1d'"""
+    match = _INTERVAL_PATTERN.match(value or "")
+    if not match:
+        raise ValueError(f"Invalid interval '{value}', expected e.g. 30s, 1m, 1h, 1d")
+    interval = float(match.group(1)) * _INTERVAL_UNITS[match.group(2)]
+    if interval <= timedelta(0):
+        raise ValueError(f"Interval '{value}' must be positive")
+    return interval
+
+
+def bucket_count(span: timedelta, max_points: Optional[int], resolution: Optional[timedelta],
+                 points_per_bucket: int) -> int:
+    """
+    Number of time buckets per tag so that the output has at most `max_points`
+    points and no bucket is narrower than `resolution`.
+    """
+    counts = []
+    if max_points:
+        counts.append(max_points // points_per_bucket)
+    if resolution:
+        counts.append(int(np.ceil(span / resolution)))
+    return max(min(counts), 1)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points that best
+    preserve the visual shape of (x, y). `x` must be sorted ascending.
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1])[:max(threshold, 0)]
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Interior points split into threshold - 2 buckets; first and last are kept
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    # Averages of each bucket, used as the third triangle vertex
+    counts = np.diff(edges)
+    sum_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sum_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    avg_x = np.append(sum_x / counts, x[-1])
+    avg_y = np.append(sum_y / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        next_x, next_y = avg_x[bucket + 1], avg_y[bucket + 1]
+        ax, ay = x[anchor], y[anchor]
+        # Twice the triangle area, vectorized over the candidates in this bucket
+        area = np.abs((ax - next_x) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y - ay))
+        anchor = lo + int(np.argmax(area))
+        selected[bucket + 1] = anchor
+    return selected
@@ -1,17 +1,119 @@
 # app/embedding.py
 import os
 import json
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from embedding_cache import EmbeddingCache, embedding_key
+
+# Bedrock calls in flight at once, across all requests
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "8"))
+# Retries of a throttled call, backing off base * 2**attempt seconds (capped,
+# full jitter) so parallel workers don't retry in lockstep
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_RETRY_BASE_DELAY = float(os.getenv("EMBEDDING_RETRY_BASE_DELAY", "0.25"))
+EMBEDDING_RETRY_MAX_DELAY = float(os.getenv("EMBEDDING_RETRY_MAX_DELAY", "20"))
+RETRYABLE_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceUnavailableException",
+    "ModelNotReadyException",
+}
 
 # Assume Bedrock embedding model is available
-client = boto3.client("bedrock-runtime", region_name=os.getenv("BEDROCK_REGION"))
+client = boto3.client(
+    "bedrock-runtime",
+    region_name=os.getenv("BEDROCK_REGION"),
+    config=Config(max_pool_connections=max(EMBEDDING_CONCURRENCY, 10)),
+)
 
-async def embed_text(text: str) -> list:
-    response = client.invoke_model(
-        modelId=os.getenv("BEDROCK_EMBEDDING_MODEL"),
-        accept="application/json",
-        contentType="application/json",
-        body=json.dumps({"inputText": text})
-    )
+# Re-uploaded and repeated texts are served from here instead of Bedrock
+embedding_cache = EmbeddingCache()
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_embedding_executor() -> ThreadPoolExecutor:
+    """Return the process-wide executor that bounds concurrent Bedrock calls"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=EMBEDDING_CONCURRENCY, thread_name_prefix="embed"
+            )
+        return _executor
+
+
+def shutdown_embedding_executor() -> None:
+    """Stop the embedding executor after in-flight calls finish"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def _invoke(model_id: Optional[str], text: str) -> list:
+    """Blocking Bedrock call, retried with jittered exponential backoff while throttled"""
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        try:
+            response = client.invoke_model(
+                modelId=model_id,
+                accept="application/json",
+                contentType="application/json",
+                body=json.dumps({"inputText": text})
+            )
+            break
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code not in RETRYABLE_ERROR_CODES or attempt == EMBEDDING_MAX_RETRIES:
+                raise
+            delay = random.uniform(0, min(EMBEDDING_RETRY_MAX_DELAY, EMBEDDING_RETRY_BASE_DELAY * 2 ** attempt))
+            print(f"Bedrock {code}, retrying in {delay:.2f}s ({attempt + 1}/{EMBEDDING_MAX_RETRIES})")
+            time.sleep(delay)
     body = json.loads(response["body"].read().decode())
+    embedding_cache.put(model_id, text, body["embedding"])
     return body["embedding"]
+
+
+async def embed_text(text: str) -> list:
+    model_id = os.getenv("BEDROCK_EMBEDDING_MODEL")
+    # SQLite lookups run in a worker thread, not on the event loop
+    cached = await asyncio.to_thread(embedding_cache.get, model_id, text)
+    if cached is not None:
+        return cached
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_embedding_executor(), _invoke, model_id, text)
+
+
+async def embed_many(texts: List[str]) -> List[list]:
+    """
+    Embed `texts` concurrently (at most EMBEDDING_CONCURRENCY Bedrock calls at
+    a time), returning the embeddings in the order of `texts`. Cached texts
+    and duplicates within the batch are not sent to Bedrock.
+    """
+    model_id = os.getenv("BEDROCK_EMBEDDING_MODEL")
+    embeddings: List[Optional[list]] = await asyncio.to_thread(embedding_cache.get_many, model_id, texts)
+    pending = {}
+    for i, text in enumerate(texts):
+        if embeddings[i] is None:
+            pending.setdefault(embedding_key(model_id, text), []).append(i)
+    if pending:
+        loop = asyncio.get_running_loop()
+        executor = get_embedding_executor()
+        positions = list(pending.values())
+        results = await asyncio.gather(*[
+            loop.run_in_executor(executor, _invoke, model_id, texts[indices[0]])
+            for indices in positions
+        ])
+        for indices, embedding in zip(positions, results):
+            for i in indices:
+                embeddings[i] = list(embedding)
+    return embeddings
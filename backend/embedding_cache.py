@@ -0,0 +1,158 @@
+# app/embedding_cache.py
+import os
+import re
+import time
+import array
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# SQLite file of the persistent tier; empty keeps the cache in memory only
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+# Size bound of the persistent tier; least recently used vectors are evicted
+# down to EMBEDDING_CACHE_LOW_WATER of it once it is exceeded
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 2**20)))
+EMBEDDING_CACHE_LOW_WATER = 0.9
+# Vectors kept in process memory in front of SQLite
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "2048"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """NFC-normalize and collapse whitespace, so trivially different copies of a text share a key"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def embedding_key(model_id: Optional[str], text: str) -> bytes:
+    """SHA-256 of (model id, normalized text)"""
+    return hashlib.sha256(f"{model_id or ''}\0{normalize_text(text)}".encode()).digest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: an in-memory LRU of vectors over a
+    SQLite table keyed by embedding_key. Vectors are stored as float64, so a
+    cached embedding is exactly what the model returned. Safe to share across
+    threads.
+    """
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_bytes: int = EMBEDDING_CACHE_MAX_BYTES,
+        memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._db = None
+        self._bytes = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key BLOB PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+            self._bytes = self._db.execute("SELECT coalesce(sum(length(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def _remember(self, key: bytes, vector: List[float]) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model_id: Optional[str], text: str) -> Optional[List[float]]:
+        """The cached embedding of `text` under `model_id`, or None"""
+        return self.get_many(model_id, [text])[0]
+
+    def get_many(self, model_id: Optional[str], texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        The cached embeddings of `texts` under `model_id`, None where missing.
+        Texts not in memory are looked up with one SELECT per 500 keys.
+        """
+        keys = [embedding_key(model_id, text) for text in texts]
+        vectors: List[Optional[List[float]]] = [None] * len(keys)
+        with self._lock:
+            missing = {}
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is None:
+                    missing.setdefault(key, []).append(i)
+                    continue
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                vectors[i] = list(vector)
+            found = {}
+            if missing and self._db is not None:
+                pending = list(missing)
+                for start in range(0, len(pending), 500):
+                    batch = pending[start:start + 500]
+                    found.update(self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({', '.join('?' * len(batch))})", batch
+                    ).fetchall())
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            for key, positions in missing.items():
+                blob = found.get(key)
+                if blob is None:
+                    self._stats["misses"] += len(positions)
+                    continue
+                vector = array.array("d", blob).tolist()
+                self._remember(key, vector)
+                self._stats["disk_hits"] += len(positions)
+                for i in positions:
+                    vectors[i] = list(vector)
+        return vectors
+
+    def put(self, model_id: Optional[str], text: str, vector: List[float]) -> None:
+        key = embedding_key(model_id, text)
+        blob = array.array("d", vector).tobytes()
+        with self._lock:
+            self._remember(key, list(vector))
+            if self._db is None:
+                return
+            previous = self._db.execute("SELECT length(vector) FROM embeddings WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", (key, blob, time.time())
+            )
+            self._bytes += len(blob) - (previous[0] if previous else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used vectors until the table is under the low-water mark"""
+        target = self.max_bytes * EMBEDDING_CACHE_LOW_WATER
+        rows = self._db.execute("SELECT key, length(vector) FROM embeddings ORDER BY last_used").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._bytes <= target:
+                break
+            evicted.append((key,))
+            self._bytes -= size
+        self._db.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self._stats["evictions"] += len(evicted)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot of cache sizing, hit/miss/eviction counters and hit rate"""
+        with self._lock:
+            lookups = self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            entries = self._db.execute("SELECT count(*) FROM embeddings").fetchone()[0] if self._db else 0
+            return {
+                "memory_entries": len(self._memory),
+                "disk_entries": entries,
+                "disk_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                **self._stats,
+                "hit_rate": (lookups - self._stats["misses"]) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,421 @@
+# app/ingest.py
+import io
+import os
+import shutil
+from collections import deque
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+from schema import dataset_partition
+
+# Rows serialized per COPY chunk; bounds the CSV text held in memory at once
+COPY_CHUNK_ROWS = int(os.getenv("INGEST_COPY_CHUNK_ROWS", "50000"))
+
+# Rows read from an uploaded file per chunk; bounds parser memory per step
+UPLOAD_CHUNK_ROWS = int(os.getenv("INGEST_UPLOAD_CHUNK_ROWS", "100000"))
+
+# Most recent readings quoted per tag in the text embedded for retrieval;
+# embedding models cap their input, so the full series is never embedded
+EMBED_SAMPLE_POINTS = int(os.getenv("INGEST_EMBED_SAMPLE_POINTS", "500"))
+
+# Block size used when spooling an upload to disk
+SPOOL_BLOCK_BYTES = 1 << 20
+
+# Bytes handed to Postgres per COPY read
+COPY_READ_SIZE = 1 << 20
+
+# API field name -> time_series_data column, in COPY column order. created_at
+# is left to the column default so every row of one COPY shares its timestamp.
+TIME_SERIES_COPY_COLUMNS = {
+    "timestamp": "timestamp",
+    "tagId": "tag_id",
+    "tagLabel": "tag_label",
+    "value": "tag_value",
+    "unit": "unit",
+    "minRange": "min_range",
+    "maxRange": "max_range",
+    "normalizedValue": "normalized_value",
+}
+
+COPY_NULL = "\\N"
+
+# How an ingest treats the target dataset's rows with the same (tag_id, timestamp):
+#   append        keep existing rows, insert only new keys
+#   upsert        overwrite existing rows with the uploaded values
+#   replace_range delete each uploaded tag's rows within the time window the
+#                 upload covers for that tag, then insert
+#   replace       truncate the dataset's partition, then insert
+INGEST_MODES = ("append", "upsert", "replace_range", "replace")
+DEFAULT_INGEST_MODE = "append"
+
+# Per-transaction table each chunk is COPYed into before being merged
+TIME_SERIES_STAGING_TABLE = "time_series_staging"
+
+# Per-row error messages returned to the client; the rest are only counted
+MAX_UPLOAD_ERRORS = int(os.getenv("INGEST_MAX_UPLOAD_ERRORS", "100"))
+
+# TimeSeriesDataCreate fields produced from an uploaded file
+UPLOAD_FIELDS = ["timestamp", "tagId", "tagLabel", "value", "unit", "minRange", "maxRange"]
+
+# Map common column name variations
+UPLOAD_COLUMN_MAPPING = {
+    "tag id": "tagId",
+    "tag_id": "tagId",
+    "tag": "tagId",
+    "id": "tagId",
+    "tag label": "tagLabel",
+    "tag_label": "tagLabel",
+    "label": "tagLabel",
+    "name": "tagLabel",
+    "tag value": "value",
+    "tag_value": "value",
+    "val": "value",
+    "value": "value",
+    "min range": "minRange",
+    "min_range": "minRange",
+    "min": "minRange",
+    "max range": "maxRange",
+    "max_range": "maxRange",
+    "max": "maxRange",
+    "time": "timestamp",
+    "datetime": "timestamp",
+    "date": "timestamp",
+    "timestamp": "timestamp",
+}
+
+
+def normalize_values(values: np.ndarray, min_range: np.ndarray, max_range: np.ndarray) -> np.ndarray:
+    """Scale values to 0-100 within [min_range, max_range]; 50 when the range is empty"""
+    values = np.asarray(values, dtype=np.float64)
+    min_range = np.asarray(min_range, dtype=np.float64)
+    max_range = np.asarray(max_range, dtype=np.float64)
+    span = max_range - min_range
+    with np.errstate(divide="ignore", invalid="ignore"):
+        normalized = (values - min_range) / span * 100
+    normalized = np.where(span != 0, normalized, 50.0)
+    return np.clip(normalized, 0, 100)
+
+
+def prepare_time_series_frame(data: Union[pd.DataFrame, List[Dict[str, Any]]]) -> pd.DataFrame:
+    """
+    Build a frame with the API field names used by TimeSeriesDataCreate and a
+    vectorized `normalizedValue` column, ready for copy_time_series_frame.
+    """
+    frame = data if isinstance(data, pd.DataFrame) else pd.DataFrame.from_records(data)
+    if frame.empty:
+        return pd.DataFrame(columns=list(TIME_SERIES_COPY_COLUMNS))
+
+    frame = frame.copy()
+    frame["timestamp"] = pd.to_datetime(frame["timestamp"])
+    frame["tagId"] = frame["tagId"].astype(str)
+    frame["tagLabel"] = frame["tagLabel"].astype(str) if "tagLabel" in frame else frame["tagId"]
+    frame["unit"] = frame["unit"].fillna("").astype(str) if "unit" in frame else ""
+    frame["value"] = frame["value"].astype(np.float64)
+    frame["minRange"] = frame["minRange"].astype(np.float64) if "minRange" in frame else 0.0
+    frame["maxRange"] = frame["maxRange"].astype(np.float64) if "maxRange" in frame else 100.0
+    frame["normalizedValue"] = normalize_values(
+        frame["value"].to_numpy(), frame["minRange"].to_numpy(), frame["maxRange"].to_numpy()
+    )
+    return frame[list(TIME_SERIES_COPY_COLUMNS)]
+
+
+def resolve_upload_columns(columns: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Resolve which source column holds each field, once per file. Known name
+    variations are mapped first, then columns are matched by substring.
+    """
+    columns = [str(c).strip().lower() for c in columns]
+    resolved: Dict[str, Optional[str]] = {}
+    for col in columns:
+        field = UPLOAD_COLUMN_MAPPING.get(col)
+        if field and field not in resolved:
+            resolved[field] = col
+
+    fallbacks = {
+        "timestamp": lambda col: "timestamp" in col or "time" in col or "date" in col,
+        "tagId": lambda col: "tagid" in col or "tag_id" in col or "tag" in col or col == "id",
+        "value": lambda col: "value" in col or "val" in col,
+    }
+    for field, matches in fallbacks.items():
+        if field not in resolved:
+            resolved[field] = next((col for col in columns if matches(col)), None)
+    resolved.setdefault("unit", "unit" if "unit" in columns else None)
+    for field in ("tagLabel", "minRange", "maxRange"):
+        resolved.setdefault(field, None)
+    return resolved
+
+
+def _parse_timestamps(raw: pd.Series) -> pd.Series:
+    """
+    Vectorized datetime parsing, retrying rows in other formats individually.
+    Values with an offset are converted to UTC and naive ones taken as UTC, so
+    a file mixing both parses, and the result is naive UTC like the stored
+    timestamps.
+    """
+    parsed = pd.to_datetime(raw, errors="coerce", utc=True)
+    retry = parsed.isna() & raw.notna()
+    if retry.any() and not pd.api.types.is_datetime64_any_dtype(raw):
+        parsed = parsed.copy()
+        parsed[retry] = pd.to_datetime(raw[retry], errors="coerce", format="mixed", utc=True)
+    return parsed.dt.tz_convert(None)
+
+
+def _format_row_errors(reasons: pd.Series, limit: int, row_offset: int) -> List[str]:
+    """Build 'Row N: reason' messages for the first `limit` invalid rows"""
+    return [
+        f"Row {row_offset + position + 1}: {reason}"
+        for position, reason in reasons.iloc[:max(limit, 0)].items()
+    ]
+
+
+def normalize_upload_frame(df: pd.DataFrame, max_errors: int = MAX_UPLOAD_ERRORS,
+                           row_offset: int = 0) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Convert an uploaded CSV/Excel frame into TimeSeriesDataCreate fields with
+    whole-column operations. Returns the valid rows and up to `max_errors`
+    per-row error messages for the rows that were dropped; `row_offset` is the
+    number of data rows preceding this frame in the file.
+    """
+    df = df.reset_index(drop=True)
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    resolved = resolve_upload_columns(list(df.columns))
+    missing = [field for field in ("timestamp", "tagId", "value") if not resolved[field]]
+    if missing:
+        return pd.DataFrame(columns=UPLOAD_FIELDS), [f"Missing required columns: {', '.join(missing)}"]
+
+    raw_timestamp = df[resolved["timestamp"]]
+    raw_tag = df[resolved["tagId"]]
+    raw_value = df[resolved["value"]]
+
+    timestamp = _parse_timestamps(raw_timestamp)
+    value = pd.to_numeric(raw_value, errors="coerce")
+    tag_missing = raw_tag.isna()
+    tag_id = raw_tag.astype(str).str.strip()
+    tag_missing |= tag_id.eq("")
+
+    def optional(field: str, default):
+        """Resolved column with missing cells filled, or a constant default"""
+        if not resolved[field]:
+            return default
+        column = df[resolved[field]]
+        if isinstance(default, float):
+            return pd.to_numeric(column, errors="coerce").fillna(default).astype(np.float64)
+        return column.astype(object).where(column.notna(), default).astype(str)
+
+    frame = pd.DataFrame({
+        "timestamp": timestamp,
+        "tagId": tag_id,
+        "tagLabel": optional("tagLabel", tag_id),
+        "value": value.astype(np.float64),
+        "unit": optional("unit", ""),
+        "minRange": optional("minRange", 0.0),
+        "maxRange": optional("maxRange", 100.0),
+    })
+
+    # Build one reason per invalid row from boolean masks, first failure wins
+    reasons = pd.Series(None, index=df.index, dtype=object)
+    for mask, reason in [
+        (timestamp.isna(), "invalid timestamp " + raw_timestamp.astype(str).str.slice(0, 40).map(repr)),
+        (tag_missing, pd.Series("missing tag id", index=df.index)),
+        (value.isna() | ~np.isfinite(value.fillna(0)),
+         "invalid value " + raw_value.astype(str).str.slice(0, 40).map(repr)),
+    ]:
+        fill = mask & reasons.isna()
+        if fill.any():
+            reasons[fill] = reason[fill]
+    invalid = reasons.notna()
+    return frame[~invalid], _format_row_errors(reasons[invalid], max_errors, row_offset)
+
+
+def iter_upload_chunks(path: str, filename: str, chunk_rows: int = UPLOAD_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Read an uploaded CSV in `chunk_rows` row chunks. Excel workbooks cannot be
+    read incrementally, so they are loaded once and sliced.
+    """
+    filename = filename.lower()
+    if filename.endswith(".csv"):
+        # Read every cell as text: dtypes inferred per chunk would differ between
+        # chunks (a blank cell turns an integer tag column into float, so tag
+        # 101 reads as "101.0" in that chunk only); columns are converted later
+        with pd.read_csv(path, chunksize=chunk_rows, dtype=str) as reader:
+            yield from reader
+    elif filename.endswith((".xlsx", ".xls")):
+        df = pd.read_excel(path)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+    else:
+        raise ValueError("Unsupported file format. Please upload CSV or Excel files.")
+
+
+class UploadNormalizer:
+    """
+    Iterates normalized chunks of an uploaded file while tallying processed
+    and rejected rows, so the file never has to be held in memory at once.
+    """
+
+    def __init__(self, chunks: Iterable[pd.DataFrame], max_errors: int = MAX_UPLOAD_ERRORS):
+        self._chunks = chunks
+        self.max_errors = max_errors
+        self.rows_processed = 0
+        self.rows_rejected = 0
+        self._errors: List[str] = []
+
+    def __iter__(self) -> Iterator[pd.DataFrame]:
+        for raw in self._chunks:
+            frame, errors = normalize_upload_frame(
+                raw, self.max_errors - len(self._errors), row_offset=self.rows_processed
+            )
+            self.rows_processed += len(raw)
+            self.rows_rejected += len(raw) - len(frame)
+            self._errors.extend(e for e in errors if e not in self._errors)
+            yield frame
+
+    @property
+    def errors(self) -> List[str]:
+        """Collected error messages, with a count of the ones not listed"""
+        unlisted = self.rows_rejected - len(self._errors)
+        if self._errors and unlisted > 0:
+            return self._errors + [f"... and {unlisted} more invalid rows"]
+        return list(self._errors)
+
+
+class TagSummary:
+    """
+    Per-tag metadata and the most recent readings seen across ingest chunks,
+    used to build the text embedded for each tag.
+    """
+
+    def __init__(self, max_lines: int = EMBED_SAMPLE_POINTS):
+        self.max_lines = max_lines
+        self.tags: Dict[str, Dict[str, Any]] = {}
+
+    def update(self, frame: pd.DataFrame) -> None:
+        for tag_id, group in frame.groupby("tagId", sort=False):
+            entry = self.tags.get(tag_id)
+            if entry is None:
+                entry = self.tags[tag_id] = {
+                    "tagLabel": group["tagLabel"].iloc[0],
+                    "unit": group["unit"].iloc[0],
+                    "minRange": float(group["minRange"].iloc[0]),
+                    "maxRange": float(group["maxRange"].iloc[0]),
+                    "numPoints": 0,
+                    "lines": deque(maxlen=self.max_lines),
+                }
+            entry["numPoints"] += len(group)
+            tail = group.iloc[-self.max_lines:]
+            entry["lines"].extend(
+                f"{timestamp}: {entry['tagLabel']} {value} {entry['unit']} (normalized: {normalized}%)"
+                for timestamp, value, normalized in zip(
+                    tail["timestamp"], tail["value"], tail["normalizedValue"]
+                )
+            )
+
+
+def spool_upload(source: BinaryIO, destination: BinaryIO) -> None:
+    """Copy an upload stream to disk in fixed-size blocks"""
+    shutil.copyfileobj(source, destination, SPOOL_BLOCK_BYTES)
+    destination.flush()
+
+
+class CsvChunkReader(io.TextIOBase):
+    """
+    File-like object that serializes a frame to CSV one chunk at a time, so
+    COPY FROM STDIN can stream it without materializing the whole payload.
+    """
+
+    def __init__(self, frame: pd.DataFrame, chunk_rows: int = COPY_CHUNK_ROWS):
+        self._chunks = self._iter_chunks(frame, chunk_rows)
+        self._buffer = ""
+        self._pos = 0
+
+    @staticmethod
+    def _iter_chunks(frame: pd.DataFrame, chunk_rows: int) -> Iterator[str]:
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows].to_csv(
+                header=False, index=False, na_rep=COPY_NULL, date_format="%Y-%m-%d %H:%M:%S.%f"
+            )
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        if size is None or size < 0:
+            data = self._buffer[self._pos:] + "".join(self._chunks)
+            self._buffer, self._pos = "", 0
+            return data
+        while len(self._buffer) - self._pos < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer, self._pos = self._buffer[self._pos:] + chunk, 0
+        data = self._buffer[self._pos:self._pos + size]
+        self._pos += len(data)
+        return data
+
+    def readline(self, size: Optional[int] = -1) -> str:
+        return self.read(size)
+
+
+def copy_time_series_frame(cur, frame: pd.DataFrame, table: str = "time_series_data") -> int:
+    """
+    Stream a prepared frame into `table` with COPY FROM STDIN and return the
+    number of rows Postgres reports as copied.
+    """
+    if frame.empty:
+        return 0
+    columns = ", ".join(TIME_SERIES_COPY_COLUMNS.values())
+    cur.copy_expert(
+        f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+        CsvChunkReader(frame[list(TIME_SERIES_COPY_COLUMNS)]),
+        size=COPY_READ_SIZE,
+    )
+    return cur.rowcount
+
+
+def stage_time_series_frame(cur, frame: pd.DataFrame, truncate: bool = True) -> int:
+    """COPY a prepared frame into the transaction's staging table"""
+    columns = ", ".join(TIME_SERIES_COPY_COLUMNS.values())
+    cur.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {TIME_SERIES_STAGING_TABLE} ON COMMIT DROP AS "
+        f"SELECT {columns} FROM time_series_data WITH NO DATA"
+    )
+    if truncate:
+        cur.execute(f"TRUNCATE {TIME_SERIES_STAGING_TABLE}")
+    return copy_time_series_frame(cur, frame, table=TIME_SERIES_STAGING_TABLE)
+
+
+def merge_staged_time_series(cur, mode: str, dataset_id: int) -> int:
+    """
+    Insert the staged rows into the partition of `dataset_id`, resolving
+    (tag_id, timestamp) conflicts per `mode`, and return the number of rows
+    written. Duplicate keys within the staged rows keep the last one staged.
+    """
+    columns = list(TIME_SERIES_COPY_COLUMNS.values())
+    if mode == "append":
+        conflict = "DO NOTHING"
+    else:
+        updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column not in ("tag_id", "timestamp"))
+        conflict = f"DO UPDATE SET {updates}"
+    # Freshly staged rows are in COPY order, so ctid orders them by arrival
+    cur.execute(f"""
+        INSERT INTO {dataset_partition(dataset_id)} (dataset_id, {", ".join(columns)})
+        SELECT DISTINCT ON (tag_id, timestamp) %s, {", ".join(columns)}
+        FROM {TIME_SERIES_STAGING_TABLE}
+        ORDER BY tag_id, timestamp, ctid DESC
+        ON CONFLICT (tag_id, timestamp, dataset_id) {conflict}
+    """, (dataset_id,))
+    return cur.rowcount
+
+
+def delete_staged_time_ranges(cur, dataset_id: int) -> int:
+    """Delete a dataset's rows within each staged tag's time window (replace_range)"""
+    cur.execute(f"""
+        DELETE FROM {dataset_partition(dataset_id)} t
+        USING (
+            SELECT tag_id, min(timestamp) AS lo, max(timestamp) AS hi
+            FROM {TIME_SERIES_STAGING_TABLE}
+            GROUP BY tag_id
+        ) w
+        WHERE t.tag_id = w.tag_id AND t.timestamp BETWEEN w.lo AND w.hi
+    """)
+    return cur.rowcount
@@ -0,0 +1,162 @@
+# app/jobs.py
+import os
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from models import UploadJob, UploadJobStatus, UploadJobPhase, UploadResult
+
+# Upload jobs allowed to run at once. Each running job holds one DB executor
+# worker for its insert phase, so keep this well below DB_EXECUTOR_WORKERS to
+# leave room for query traffic.
+INGEST_MAX_CONCURRENT_JOBS = int(os.getenv("INGEST_MAX_CONCURRENT_JOBS", "2"))
+# Finished jobs kept in memory for polling
+INGEST_JOB_RETENTION = int(os.getenv("INGEST_JOB_RETENTION", "100"))
+
+FINISHED_STATUSES = (UploadJobStatus.succeeded, UploadJobStatus.failed, UploadJobStatus.cancelled)
+# Phases that run after the ingest transaction has committed; cancelling
+# there would report rows that persist as cancelled, so they run to the end
+COMMITTED_PHASES = (UploadJobPhase.embed, UploadJobPhase.index)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work once cancellation has been requested"""
+
+
+class JobContext:
+    """
+    Handle passed to a job's work for reporting progress. Its methods may be
+    called from executor threads; each call is also a cancellation point,
+    except entering one of the COMMITTED_PHASES.
+    """
+
+    def __init__(self, job: UploadJob):
+        self.job = job
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check_cancelled(self) -> None:
+        if self._cancelled.is_set():
+            raise JobCancelled(f"Upload job {self.job.id} was cancelled")
+
+    def set_phase(self, phase: str) -> None:
+        phase = UploadJobPhase(phase)
+        if phase not in COMMITTED_PHASES:
+            self.check_cancelled()
+        self.job.phase = phase
+
+    def report(self, **progress) -> None:
+        self.check_cancelled()
+        for field, value in progress.items():
+            setattr(self.job, field, value)
+
+
+class UploadJobManager:
+    """In-process runner for upload jobs with a cap on concurrent jobs"""
+
+    def __init__(self, max_concurrent: int = INGEST_MAX_CONCURRENT_JOBS, retention: int = INGEST_JOB_RETENTION):
+        self.max_concurrent = max_concurrent
+        self.retention = retention
+        self._jobs: "OrderedDict[str, UploadJob]" = OrderedDict()
+        self._contexts: Dict[str, JobContext] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def submit(
+        self,
+        filename: str,
+        work: Callable[[JobContext], Awaitable[UploadResult]],
+        cleanup: Optional[Callable[[], None]] = None,
+    ) -> UploadJob:
+        """
+        Queue `work` and return its job immediately. `cleanup` (e.g. removing
+        the spooled upload) runs once the job finishes, however it finishes:
+        also when it is cancelled while queued or at shutdown.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        job = UploadJob(id=str(uuid.uuid4()), filename=filename, createdAt=datetime.now())
+        context = JobContext(job)
+        self._jobs[job.id] = job
+        self._contexts[job.id] = context
+        task = asyncio.create_task(self._run(context, work))
+        task.add_done_callback(lambda task: self._finish(job, cleanup))
+        self._tasks[job.id] = task
+        self._prune()
+        return job
+
+    async def _run(self, context: JobContext, work: Callable[[JobContext], Awaitable[UploadResult]]) -> None:
+        job = context.job
+        try:
+            async with self._semaphore:
+                context.check_cancelled()
+                job.status = UploadJobStatus.running
+                job.startedAt = datetime.now()
+                job.result = await work(context)
+                job.rowsProcessed = job.result.rowsProcessed
+                job.rowsInserted = job.result.rowsInserted
+                job.status = UploadJobStatus.succeeded
+        except (JobCancelled, asyncio.CancelledError):
+            job.status = UploadJobStatus.cancelled
+        except Exception as e:
+            print(f"Upload job {job.id} failed: {e}")
+            job.errors.append(str(e))
+            job.status = UploadJobStatus.failed
+
+    def _finish(self, job: UploadJob, cleanup: Optional[Callable[[], None]]) -> None:
+        # A done callback rather than _run's finally: a task cancelled before
+        # it first runs never executes any of _run
+        if job.status not in FINISHED_STATUSES:
+            job.status = UploadJobStatus.cancelled
+        job.finishedAt = datetime.now()
+        self._tasks.pop(job.id, None)
+        self._contexts.pop(job.id, None)
+        if cleanup is not None:
+            try:
+                cleanup()
+            except Exception as e:
+                print(f"Cleanup of upload job {job.id} failed: {e}")
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATUSES]
+        for job_id in finished[:max(len(finished) - self.retention, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[UploadJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[UploadJob]:
+        return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> Optional[UploadJob]:
+        """
+        Request cancellation. Queued jobs stop immediately; running jobs stop
+        at their next progress report and roll back their transaction. A job
+        whose transaction has already committed runs to completion and
+        reports succeeded.
+        """
+        job = self._jobs.get(job_id)
+        context = self._contexts.get(job_id)
+        if job is None or context is None:
+            return job
+        context.cancel()
+        task = self._tasks.get(job_id)
+        if task is not None and job.status == UploadJobStatus.queued:
+            task.cancel()
+        return job
+
+    async def shutdown(self) -> None:
+        """Cancel outstanding jobs and wait for them to unwind"""
+        for job_id in list(self._contexts):
+            self.cancel(job_id)
+        tasks = list(self._tasks.values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,391 @@
+# app/local_index.py
+import os
+import json
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+from vector_index import VectorIndex
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+HNSW_AVAILABLE = hnswlib is not None
+
+# Live vectors at which queries switch from exact top-k to the HNSW graph
+# (when hnswlib is installed); below it a full scan is already sub-millisecond
+VECTOR_INDEX_HNSW_THRESHOLD = int(os.getenv("VECTOR_INDEX_HNSW_THRESHOLD", "20000"))
+VECTOR_INDEX_HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", "16"))
+VECTOR_INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", "200"))
+VECTOR_INDEX_HNSW_EF = int(os.getenv("VECTOR_INDEX_HNSW_EF", "64"))
+# Filters matching at most this fraction of the index are answered by an exact
+# scan of the matching rows; graph search recall drops on selective filters
+VECTOR_INDEX_EXACT_FILTER_FRACTION = 0.05
+
+_MISSING = object()
+
+
+def _vector_fields(vector: Any):
+    """(id, values, metadata) of a Pinecone upsert dict or tuple"""
+    if isinstance(vector, dict):
+        return vector["id"], vector["values"], vector.get("metadata") or {}
+    id, values, *rest = vector
+    return id, values, (rest[0] if rest else None) or {}
+
+
+def _compare(column: np.ndarray, op: str, value: Any) -> np.ndarray:
+    if op == "$eq":
+        return np.asarray(column == value, dtype=bool)
+    if op == "$ne":
+        return ~np.asarray(column == value, dtype=bool)
+    if op in ("$in", "$nin"):
+        mask = np.zeros(len(column), dtype=bool)
+        for candidate in value:
+            mask |= np.asarray(column == candidate, dtype=bool)
+        return mask if op == "$in" else ~mask
+    if op == "$exists":
+        return np.asarray(column != _MISSING, dtype=bool) == bool(value)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        compare = {
+            "$gt": lambda x: x > value,
+            "$gte": lambda x: x >= value,
+            "$lt": lambda x: x < value,
+            "$lte": lambda x: x <= value,
+        }[op]
+        return np.fromiter(
+            (isinstance(x, (int, float)) and not isinstance(x, bool) and compare(x) for x in column),
+            dtype=bool,
+            count=len(column),
+        )
+    raise ValueError(f"Unsupported metadata filter operator: {op}")
+
+
+class LocalIndex(VectorIndex):
+    """
+    On-prem vector index. Vectors live in a float32 matrix, memory-mapped from
+    `path`/vectors.npy when a path is given, with metadata and ids kept in
+    memory and persisted as an append-only log (`path`/log.jsonl) replayed on
+    open. Queries are exact cosine top-k over the matrix, or go through an
+    HNSW graph once the index holds VECTOR_INDEX_HNSW_THRESHOLD vectors and
+    hnswlib is installed. Supports the Pinecone filter operators $eq, $ne,
+    $in, $nin, $exists, $gt, $gte, $lt, $lte, $and and $or; a field missing
+    from a vector's metadata matches only $ne, $nin and $exists: false.
+    Namespaces are not supported. Safe to share across threads.
+    """
+
+    def __init__(self, name: str = "local", path: Optional[str] = None):
+        self.name = name
+        self.path = path
+        self._lock = threading.RLock()
+        self._dimension = 0
+        self._count = 0  # rows used so far, live or free
+        self._matrix: Optional[np.ndarray] = None
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._ids: List[Optional[str]] = []
+        self._metadata: List[Optional[Dict[str, Any]]] = []
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._columns: Dict[str, np.ndarray] = {}
+        self._log = None
+        self._log_lines = 0
+        self._hnsw = None
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    # Storage
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _load(self) -> None:
+        if os.path.exists(self._file("vectors.npy")):
+            self._matrix = np.load(self._file("vectors.npy"), mmap_mode="r+")
+            self._dimension = self._matrix.shape[1]
+            self._resize_state(len(self._matrix))
+        if os.path.exists(self._file("log.jsonl")):
+            with open(self._file("log.jsonl")) as log:
+                for line in log:
+                    self._replay(json.loads(line))
+                    self._log_lines += 1
+        if self._count:
+            rows = self._matrix[: self._count]
+            self._norms[: self._count] = np.linalg.norm(rows, axis=1)
+        self._free = [row for row in range(self._count) if not self._alive[row]]
+        if self._log_lines > 2 * len(self._rows) + 1000:
+            self._compact()
+        self._log = open(self._file("log.jsonl"), "a")
+        self._load_hnsw()
+
+    def _replay(self, entry: Dict[str, Any]) -> None:
+        op, id = entry["op"], entry["id"]
+        if op == "upsert":
+            row = entry["row"]
+            self._count = max(self._count, row + 1)
+            previous = self._ids[row]
+            if previous is not None and previous != id:
+                self._rows.pop(previous, None)
+            self._ids[row], self._metadata[row], self._alive[row] = id, entry["metadata"], True
+            self._rows[id] = row
+        elif op == "update" and id in self._rows:
+            self._metadata[self._rows[id]].update(entry["metadata"])
+        elif op == "delete" and id in self._rows:
+            row = self._rows.pop(id)
+            self._ids[row], self._metadata[row], self._alive[row] = None, None, False
+
+    def _append(self, entries: List[Dict[str, Any]]) -> None:
+        if self._log is None:
+            return
+        if self._matrix is not None and isinstance(self._matrix, np.memmap):
+            # Vectors reach disk before the log entries that reference them
+            self._matrix.flush()
+        self._log.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._log.flush()
+        self._log_lines += len(entries)
+
+    def _compact(self) -> None:
+        """Rewrite the log as one upsert per live vector"""
+        temporary = self._file("log.jsonl.tmp")
+        with open(temporary, "w") as log:
+            for id, row in self._rows.items():
+                log.write(json.dumps({"op": "upsert", "id": id, "row": row, "metadata": self._metadata[row]}) + "\n")
+        os.replace(temporary, self._file("log.jsonl"))
+        self._log_lines = len(self._rows)
+
+    def _resize_state(self, capacity: int) -> None:
+        grow = capacity - len(self._alive)
+        if grow <= 0:
+            return
+        self._norms = np.concatenate([self._norms, np.zeros(grow, dtype=np.float32)])
+        self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+        self._ids.extend([None] * grow)
+        self._metadata.extend([None] * grow)
+        for field, column in self._columns.items():
+            extension = np.empty(grow, dtype=object)
+            extension[:] = [_MISSING] * grow
+            self._columns[field] = np.concatenate([column, extension])
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the matrix (doubling) to hold `rows` rows"""
+        capacity = 0 if self._matrix is None else len(self._matrix)
+        if rows <= capacity:
+            return
+        capacity = max(rows, 2 * capacity, 1024)
+        if self.path:
+            temporary = self._file("vectors.npy.tmp")
+            matrix = np.lib.format.open_memmap(temporary, mode="w+", dtype=np.float32, shape=(capacity, self._dimension))
+            if self._matrix is not None:
+                matrix[: len(self._matrix)] = self._matrix
+                del self._matrix
+            matrix.flush()
+            del matrix
+            os.replace(temporary, self._file("vectors.npy"))
+            self._matrix = np.load(self._file("vectors.npy"), mmap_mode="r+")
+        else:
+            matrix = np.zeros((capacity, self._dimension), dtype=np.float32)
+            if self._matrix is not None:
+                matrix[: len(self._matrix)] = self._matrix
+            self._matrix = matrix
+        self._resize_state(capacity)
+        if self._hnsw is not None:
+            self._hnsw.resize_index(capacity)
+
+    # HNSW graph
+
+    def _load_hnsw(self) -> None:
+        if not HNSW_AVAILABLE or not os.path.exists(self._file("hnsw.json")):
+            self._maybe_build_hnsw()
+            return
+        with open(self._file("hnsw.json")) as sidecar:
+            saved = json.load(sidecar)
+        # The graph is only reused if nothing was logged after it was saved
+        if saved.get("log_lines") == self._log_lines and saved.get("capacity") == len(self._matrix):
+            self._hnsw = hnswlib.Index(space="cosine", dim=self._dimension)
+            self._hnsw.load_index(self._file("hnsw.bin"), max_elements=len(self._matrix))
+        else:
+            self._maybe_build_hnsw()
+
+    def _maybe_build_hnsw(self) -> None:
+        if not HNSW_AVAILABLE or self._hnsw is not None or len(self._rows) < VECTOR_INDEX_HNSW_THRESHOLD:
+            return
+        hnsw = hnswlib.Index(space="cosine", dim=self._dimension)
+        hnsw.init_index(
+            max_elements=len(self._matrix), ef_construction=VECTOR_INDEX_HNSW_EF_CONSTRUCTION, M=VECTOR_INDEX_HNSW_M
+        )
+        rows = np.flatnonzero(self._alive[: self._count])
+        hnsw.add_items(self._matrix[rows], rows)
+        self._hnsw = hnsw
+        print(f"Built HNSW graph for vector index {self.name} ({len(rows)} vectors)")
+
+    def _save_hnsw(self) -> None:
+        if self._hnsw is None or not self.path:
+            return
+        self._hnsw.save_index(self._file("hnsw.bin"))
+        with open(self._file("hnsw.json"), "w") as sidecar:
+            json.dump({"log_lines": self._log_lines, "capacity": len(self._matrix)}, sidecar)
+
+    # Metadata
+
+    def _set_metadata(self, row: int, metadata: Optional[Dict[str, Any]]) -> None:
+        self._metadata[row] = metadata
+        for field, column in self._columns.items():
+            column[row] = _MISSING if metadata is None else metadata.get(field, _MISSING)
+
+    def _column(self, field: str) -> np.ndarray:
+        column = self._columns.get(field)
+        if column is None:
+            column = np.empty(len(self._metadata), dtype=object)
+            column[:] = [_MISSING if m is None else m.get(field, _MISSING) for m in self._metadata]
+            self._columns[field] = column
+        return column
+
+    def _filter_mask(self, filter: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(self._count, dtype=bool)
+        for key, condition in filter.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._filter_mask(clause)
+            elif key == "$or":
+                either = np.zeros(self._count, dtype=bool)
+                for clause in condition:
+                    either |= self._filter_mask(clause)
+                mask &= either
+            else:
+                column = self._column(key)[: self._count]
+                if not isinstance(condition, dict):
+                    condition = {"$eq": condition}
+                for op, value in condition.items():
+                    mask &= _compare(column, op, value)
+        return mask
+
+    # VectorIndex
+
+    def upsert(self, vectors, **kwargs):
+        with self._lock:
+            entries = []
+            for vector in vectors:
+                id, values, metadata = _vector_fields(vector)
+                values = np.asarray(values, dtype=np.float32)
+                if not self._dimension:
+                    self._dimension = len(values)
+                if len(values) != self._dimension:
+                    raise ValueError(f"Vector {id} has dimension {len(values)}, index {self.name} has {self._dimension}")
+                row = self._rows.get(id)
+                if row is None:
+                    if self._free:
+                        row = self._free.pop()
+                    else:
+                        row = self._count
+                        self._reserve(row + 1)
+                        self._count += 1
+                self._matrix[row] = values
+                self._norms[row] = np.linalg.norm(values)
+                self._alive[row] = True
+                self._ids[row] = id
+                self._rows[id] = row
+                self._set_metadata(row, dict(metadata))
+                if self._hnsw is not None:
+                    self._hnsw.add_items(values[None, :], [row])
+                entries.append({"op": "upsert", "id": id, "row": row, "metadata": self._metadata[row]})
+            self._append(entries)
+            self._maybe_build_hnsw()
+            return {"upserted_count": len(entries)}
+
+    def update(self, id, set_metadata=None, **kwargs):
+        with self._lock:
+            row = self._rows.get(id)
+            if row is None or not set_metadata:
+                return
+            self._set_metadata(row, {**self._metadata[row], **set_metadata})
+            self._append([{"op": "update", "id": id, "metadata": set_metadata}])
+
+    def fetch(self, ids, **kwargs):
+        with self._lock:
+            return {
+                "vectors": {
+                    id: {"id": id, "values": self._matrix[row].tolist(), "metadata": dict(self._metadata[row])}
+                    for id, row in ((id, self._rows.get(id)) for id in ids)
+                    if row is not None
+                }
+            }
+
+    def delete(self, ids, **kwargs):
+        with self._lock:
+            entries = []
+            for id in ids:
+                row = self._rows.pop(id, None)
+                if row is None:
+                    continue
+                self._alive[row] = False
+                self._ids[row] = None
+                self._set_metadata(row, None)
+                self._free.append(row)
+                if self._hnsw is not None:
+                    self._hnsw.mark_deleted(row)
+                entries.append({"op": "delete", "id": id})
+            self._append(entries)
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, filter=None, **kwargs):
+        with self._lock:
+            mask = self._alive[: self._count]
+            if filter:
+                mask = mask & self._filter_mask(filter)
+            candidates = int(np.count_nonzero(mask))
+            if not candidates or top_k <= 0:
+                return {"matches": []}
+            query = np.asarray(vector, dtype=np.float32)
+            query_norm = np.linalg.norm(query) or 1.0
+            rows = scores = None
+            if self._hnsw is not None and candidates > VECTOR_INDEX_EXACT_FILTER_FRACTION * len(self._rows):
+                self._hnsw.set_ef(max(VECTOR_INDEX_HNSW_EF, top_k))
+                try:
+                    labels, distances = self._hnsw.knn_query(
+                        query, k=min(top_k, candidates), filter=(lambda label: bool(mask[label])) if filter else None
+                    )
+                    rows, scores = labels[0].astype(np.int64), 1.0 - distances[0]
+                except RuntimeError:
+                    # Fewer than k reachable matches; fall back to the exact scan
+                    rows = None
+            if rows is None:
+                if candidates < self._count // 2:
+                    rows = np.flatnonzero(mask)
+                    scores = self._matrix[rows] @ query
+                else:
+                    rows = np.arange(self._count)
+                    scores = np.where(mask, self._matrix[: self._count] @ query, -np.inf)
+                norms = self._norms[rows]
+                scores = scores / (np.where(norms == 0, 1.0, norms) * query_norm)
+                k = min(top_k, candidates)
+                top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+                top = top[np.argsort(-scores[top], kind="stable")]
+                rows, scores = rows[top], scores[top]
+            matches = []
+            for row, score in zip(rows.tolist(), scores.tolist()):
+                match = {"id": self._ids[row], "score": score}
+                if include_metadata:
+                    match["metadata"] = dict(self._metadata[row])
+                if include_values:
+                    match["values"] = self._matrix[row].tolist()
+                matches.append(match)
+            return {"matches": matches}
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            return {
+                "dimension": self._dimension,
+                "total_vector_count": len(self._rows),
+                "index_fullness": 0.0,
+                "namespaces": {"": {"vector_count": len(self._rows)}} if self._rows else {},
+                "hnsw": self._hnsw is not None,
+            }
+
+    def close(self) -> None:
+        """Flush the matrix and log and save the HNSW graph, so the next open skips rebuilding it"""
+        with self._lock:
+            if self._matrix is not None and isinstance(self._matrix, np.memmap):
+                self._matrix.flush()
+            if self._log is not None:
+                self._log.flush()
+            self._save_hnsw()
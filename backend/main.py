@@ -1,8 +1,9 @@
 # app/main.py
 
-from fastapi import FastAPI, UploadFile, File, Form, Query, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, Query, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, StreamingResponse
 
 # from fastapi.responses import FileResponse, HTTPResponse, Response
 # from typing import Listt
@@ -11,20 +12,25 @@ from models import (
     QueryRequest,
     QueryResponse,
     TimeSeriesData,
+    TimeSeriesAggregate,
+    Dataset,
     Annotation,
     Rule,
+    RuleViolation,
     SavedGraph,
     AnnotationCreate,
     RuleCreate,
     SavedGraphCreate,
     UploadResult,
+    UploadJob,
     QueryModel,
     FeedbackModel,
 )
-from vector_store import query_pinecone, upsert_document, search_pinecone
+from vector_store import query_pinecone, upsert_document, search_pinecone, get_vector_index, close_vector_indexes
 from llm_client import ask_claude, ask_openai_structured
 from memory import MemoryStore
 import tempfile
+import asyncio
 import mimetypes
 import boto3
 import os
@@ -35,16 +41,25 @@ import pandas as pd
 import sqlite3
 import time
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from pydantic import BaseModel
 import logging
 import subprocess
 from datetime import datetime
 from storage import DatabaseStorage
+from streaming import TIME_SERIES_FORMATS, STREAMING_FORMATS, encode_stream, as_batches
+from responses import TrustedJSONResponse
+from versions import etag_matches
+from columnar import columnar_payload, arrow_ipc_stream, ARROW_AVAILABLE, ARROW_MEDIA_TYPE
+from ingest import UploadNormalizer, iter_upload_chunks, spool_upload, INGEST_MODES, DEFAULT_INGEST_MODE
+from jobs import UploadJobManager, JobContext
+from downsample import DOWNSAMPLE_METHODS, parse_interval
+from aggregate import parse_aggregate_functions, DEFAULT_AGGREGATE_FUNCTIONS
+from database import close_pools, shutdown_db_executor
+from vector_writer import close_vector_writers, vector_writer_metrics
 from sqlalchemy import create_engine
 from sqlalchemy_models import Base
-from embedding import embed_text
-from pinecone import Pinecone
+from embedding import embed_text, embedding_cache, shutdown_embedding_executor
 import uuid
 
 # Load environment variables
@@ -60,8 +75,7 @@ app.add_middleware(
 )
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-phase2_index = pc.Index(name="timeseries")
+phase2_index = get_vector_index("timeseries")
 
 
 DATABASE_URL = os.getenv("DATABASE_URL")  # Default to PostgreSQL URL
@@ -69,12 +83,39 @@ engine = create_engine(DATABASE_URL)
 
 Base.metadata.create_all(bind=engine)
 storage = DatabaseStorage()
+upload_jobs = UploadJobManager()
 
 memory_store = MemoryStore()
 s3_client = boto3.client("s3")
 BUCKET_NAME = os.getenv("S3_BUCKET")
 
 
+@app.on_event("startup")
+async def open_db_pool():
+    try:
+        storage.pool.open()
+    except Exception as e:
+        print(f"Failed to pre-open database connections: {e}")
+    try:
+        await storage.migrate_schema()
+    except Exception as e:
+        print(f"Failed to migrate time-series schema: {e}")
+    try:
+        await storage.rebuild_derived_tables(only_if_empty=True)
+    except Exception as e:
+        print(f"Failed to backfill time-series rollups and tag catalog: {e}")
+
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    await upload_jobs.shutdown()
+    close_vector_writers()
+    close_vector_indexes()
+    shutdown_embedding_executor()
+    shutdown_db_executor()
+    close_pools()
+
+
 @app.post("/rag/feedback")
 async def rag_feedback(feedback: FeedbackModel):
     # Save feedback log
@@ -270,166 +311,168 @@ async def delete_file_by_s3_url(s3_url: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-# File upload endpoint
-@app.post("/api/upload", response_model=UploadResult)
-async def upload_file(file: UploadFile = File(...), description: str = Form(...)):
-    """Upload and process CSV or Excel files"""
+# File upload endpoints
+async def run_upload_job(
+    job: JobContext, path: str, filename: str, description: str, mode: str, dataset: str
+) -> UploadResult:
+    """Parse, insert, embed and index a spooled upload, reporting progress to the job"""
+    # Columns are resolved and converted per chunk in vectorized steps
+    normalizer = UploadNormalizer(iter_upload_chunks(path, filename))
+
+    # Merge the file into the dataset per `mode` in a single transaction
+    summary = await storage.insert_time_series_chunks(
+        normalizer,
+        description,
+        mode=mode,
+        dataset=dataset,
+        on_chunk=lambda progress: job.report(
+            rowsProcessed=normalizer.rows_processed,
+            rowsInserted=progress.rowsInserted,
+            rowsPerSecond=progress.rowsPerSecond,
+        ),
+        on_phase=job.set_phase,
+    )
+
+    print(
+        f"Processing summary: {normalizer.rows_processed} rows processed, {summary.rowsInserted} valid rows, {normalizer.rows_rejected} errors"
+    )
+
+    return UploadResult(
+        success=True,
+        rowsProcessed=normalizer.rows_processed,
+        rowsInserted=summary.rowsInserted,
+        errors=normalizer.errors or None,
+        ingest=summary,
+    )
+
+
+@app.post("/api/upload", response_model=UploadJob, status_code=202)
+async def upload_file(
+    file: UploadFile = File(...),
+    description: str = Form(...),
+    mode: str = Form(DEFAULT_INGEST_MODE),
+    dataset: Optional[str] = Form(None),
+):
+    """
+    Spool a CSV or Excel file to disk and process it as a background job.
+    Rows go to the named `dataset`, created on first use and named after the
+    file by default. `mode` decides how rows with an existing (tag, timestamp)
+    in that dataset are handled: append (default), upsert, replace_range or
+    replace.
+    """
     try:
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file uploaded")
+        if mode not in INGEST_MODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"mode must be one of: {', '.join(INGEST_MODES)}",
+            )
 
-        file_content = await file.read()
         filename = file.filename.lower()
-
-        rows = []
-
-        if filename.endswith(".csv"):
-            # Process CSV file
-            df = pd.read_csv(io.BytesIO(file_content))
-        elif filename.endswith((".xlsx", ".xls")):
-            # Process Excel file
-            df = pd.read_excel(io.BytesIO(file_content))
-        else:
+        if not filename.endswith((".csv", ".xlsx", ".xls")):
             raise HTTPException(
                 status_code=400,
                 detail="Unsupported file format. Please upload CSV or Excel files.",
             )
 
-        # Normalize column names to handle different CSV formats
-        df.columns = df.columns.str.strip().str.lower()
-
-        # Map common column name variations
-        column_mapping = {
-            "tag id": "tagId",
-            "tag_id": "tagId",
-            "tag": "tagId",
-            "id": "tagId",
-            "tag label": "tagLabel",
-            "tag_label": "tagLabel",
-            "label": "tagLabel",
-            "name": "tagLabel",
-            "tag value": "value",
-            "tag_value": "value",
-            "val": "value",
-            "value": "value",
-            "min range": "minRange",
-            "min_range": "minRange",
-            "min": "minRange",
-            "max range": "maxRange",
-            "max_range": "maxRange",
-            "max": "maxRange",
-            "time": "timestamp",
-            "datetime": "timestamp",
-            "date": "timestamp",
-            "timestamp": "timestamp",
-        }
-
-        # Apply column mapping
-        for old_col, new_col in column_mapping.items():
-            if old_col in df.columns:
-                df.rename(columns={old_col: new_col}, inplace=True)
-
-        # Convert DataFrame to list of dictionaries
-        processed_count = 0
-        error_count = 0
-
-        for _, row in df.iterrows():
-            try:
-                processed_count += 1
-
-                # Use direct column names if mapped correctly
-                timestamp_col = "timestamp" if "timestamp" in df.columns else None
-                tagId_col = "tagId" if "tagId" in df.columns else None
-                value_col = "value" if "value" in df.columns else None
-
-                # Fallback to flexible column detection
-                if not timestamp_col:
-                    for col in df.columns:
-                        if "timestamp" in col or "time" in col or "date" in col:
-                            timestamp_col = col
-                            break
-
-                if not tagId_col:
-                    for col in df.columns:
-                        if (
-                            "tagid" in col
-                            or "tag_id" in col
-                            or "tag" in col
-                            or col == "id"
-                        ):
-                            tagId_col = col
-                            break
-
-                if not value_col:
-                    for col in df.columns:
-                        if "value" in col or "val" in col:
-                            value_col = col
-                            break
-
-                if not all([timestamp_col, tagId_col, value_col]):
-                    error_count += 1
-                    print(
-                        f"Row {processed_count}: Missing required columns - timestamp: {timestamp_col}, tagId: {tagId_col}, value: {value_col}"
-                    )
-                    continue
-
-                # Parse timestamp
-                timestamp = pd.to_datetime(row[timestamp_col])
-
-                row_data = {
-                    "timestamp": timestamp,
-                    "tagId": str(row[tagId_col]),
-                    "value": float(row[value_col]),
-                    "tagLabel": str(
-                        row.get(
-                            "tagLabel",
-                            row.get("tag_label", row.get("label", row[tagId_col])),
-                        )
-                    ),
-                    "unit": str(row.get("unit", "")),
-                    "minRange": float(
-                        row.get("minRange", row.get("min_range", row.get("min", 0)))
-                        or 0
-                    ),
-                    "maxRange": float(
-                        row.get("maxRange", row.get("max_range", row.get("max", 100)))
-                        or 100
-                    ),
-                }
-                rows.append(row_data)
-            except Exception as e:
-                error_count += 1
-                print(f"Row {processed_count}: Error processing - {str(e)}")
-                continue  # Skip invalid rows
-
-        print(
-            f"Processing summary: {processed_count} rows processed, {len(rows)} valid rows, {error_count} errors"
-        )
-
-        # Clear existing data before inserting new data
-        await storage.clear_time_series_data()
+        dataset = (dataset or "").strip() or os.path.splitext(file.filename)[0]
 
-        # Insert data into storage
-        inserted_data = await storage.insert_time_series_data(rows, description)
+        # Spool the upload to disk; the job streams it through in row chunks
+        ext = os.path.splitext(filename)[1]
+        with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as spool:
+            await asyncio.to_thread(spool_upload, file.file, spool)
 
-        return UploadResult(
-            success=True, rowsProcessed=processed_count, rowsInserted=len(inserted_data)
+        return upload_jobs.submit(
+            file.filename,
+            lambda job: run_upload_job(job, spool.name, filename, description, mode, dataset),
+            # The manager removes the spool however the job ends
+            cleanup=lambda: os.remove(spool.name),
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process file: {str(e)}")
 
 
+@app.get("/api/upload/jobs", response_model=List[UploadJob])
+async def list_upload_jobs():
+    """List recent upload jobs, newest first"""
+    return upload_jobs.list()
+
+
+@app.get("/api/upload/jobs/{job_id}", response_model=UploadJob)
+async def get_upload_job(job_id: str):
+    """Get an upload job's phase, progress and result"""
+    job = upload_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job
+
+
+@app.delete("/api/upload/jobs/{job_id}", response_model=UploadJob)
+async def cancel_upload_job(job_id: str):
+    """Cancel a queued or running upload job"""
+    job = upload_jobs.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return job
+
+
 # Time-series data endpoints
+def cache_headers(resource: str, if_none_match: Optional[str]) -> Tuple[Dict[str, str], Optional[Response]]:
+    """
+    ETag/Last-Modified headers of `resource`'s current version, plus a 304
+    response when `if_none_match` already names it. Read the version before
+    querying so a concurrent write can only make the ETag stale, not the body.
+    """
+    headers = storage.versions.headers(resource)
+    if etag_matches(if_none_match, headers["ETag"]):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
+
 @app.get("/api/timeseries", response_model=List[TimeSeriesData])
 async def get_timeseries(
     tagIds: Optional[str] = Query(None),
     startTime: Optional[str] = Query(None),
     endTime: Optional[str] = Query(None),
     limit: Optional[int] = Query(None),
+    maxPoints: Optional[int] = Query(None, ge=2),
+    resolution: Optional[str] = Query(None),
+    downsample: str = Query("lttb"),
+    datasetId: Optional[int] = Query(None),
+    format: str = Query("json"),
+    ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match"),
 ):
-    """Get time-series data with optional filtering"""
+    """
+    Get time-series data with optional filtering. `maxPoints` (per tag) and/or
+    `resolution` (e.g. 30s, 1m, 1h) downsample each tag on the server using
+    `downsample` = lttb or minmax. `datasetId` scopes the query to one dataset.
+    `format` = ndjson or json-stream streams rows as they are read instead of
+    building the whole response first; columnar (JSON) and arrow (Arrow IPC
+    stream) return each tag's metadata once with arrays of epoch-ms
+    timestamps and values.
+    """
     try:
+        if format not in TIME_SERIES_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"format must be one of: {', '.join(TIME_SERIES_FORMATS)}",
+            )
+        if format == "arrow" and not ARROW_AVAILABLE:
+            raise HTTPException(status_code=501, detail="format=arrow requires pyarrow on the server")
+        if downsample not in DOWNSAMPLE_METHODS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"downsample must be one of: {', '.join(DOWNSAMPLE_METHODS)}",
+            )
+        try:
+            bucket = parse_interval(resolution) if resolution else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
         tag_id_list = tagIds.split(",") if tagIds else []
         start = (
             datetime.fromisoformat(startTime.replace("Z", "+00:00"))
@@ -439,23 +482,114 @@ async def get_timeseries(
         end = (
             datetime.fromisoformat(endTime.replace("Z", "+00:00")) if endTime else None
         )
+        headers, not_modified = cache_headers("timeseries", ifNoneMatch)
+        if not_modified:
+            return not_modified
+
+        if format in ("columnar", "arrow"):
+            frame, tags = await storage.get_time_series_columns(
+                tag_id_list,
+                start,
+                end,
+                max_points=maxPoints,
+                resolution=bucket,
+                method=downsample,
+                limit=limit,
+                dataset_id=datasetId,
+            )
+            if format == "columnar":
+                return TrustedJSONResponse(columnar_payload(frame, tags), headers=headers)
+            return Response(arrow_ipc_stream(frame, tags), media_type=ARROW_MEDIA_TYPE, headers=headers)
 
-        data = await storage.get_time_series_data(tag_id_list, start, end)
+        if format in STREAMING_FORMATS and not (maxPoints or resolution):
+            batches = storage.stream_time_series_data(
+                tag_id_list, start, end, limit=limit, dataset_id=datasetId
+            )
+            return StreamingResponse(
+                encode_stream(batches, format), media_type=STREAMING_FORMATS[format], headers=headers
+            )
 
-        if limit:
-            data = data[-limit:]
+        data = await storage.get_time_series_data(
+            tag_id_list,
+            start,
+            end,
+            max_points=maxPoints,
+            resolution=bucket,
+            method=downsample,
+            limit=limit,
+            dataset_id=datasetId,
+            as_models=False,
+        )
 
-        return data
+        if format in STREAMING_FORMATS:
+            # Downsampled results are small; only the encoding differs
+            return StreamingResponse(
+                encode_stream(as_batches(data), format),
+                media_type=STREAMING_FORMATS[format],
+                headers=headers,
+            )
+        return TrustedJSONResponse(data, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch time-series data")
 
 
+@app.get("/api/timeseries/aggregate", response_model=List[TimeSeriesAggregate])
+async def get_timeseries_aggregate(
+    bucket: str = Query(...),
+    tagIds: Optional[str] = Query(None),
+    startTime: Optional[str] = Query(None),
+    endTime: Optional[str] = Query(None),
+    fns: str = Query(DEFAULT_AGGREGATE_FUNCTIONS),
+    datasetId: Optional[int] = Query(None),
+    ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match"),
+):
+    """
+    Per tag and time bucket aggregates, e.g. bucket=1m&fns=min,max,avg,p95.
+    Supported: min, max, avg, sum, stddev, first, last and percentiles pNN.
+    `datasetId` scopes the aggregates to one dataset.
+    """
+    try:
+        try:
+            width = parse_interval(bucket)
+            functions = parse_aggregate_functions(fns)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        tag_id_list = tagIds.split(",") if tagIds else []
+        start = (
+            datetime.fromisoformat(startTime.replace("Z", "+00:00"))
+            if startTime
+            else None
+        )
+        end = (
+            datetime.fromisoformat(endTime.replace("Z", "+00:00")) if endTime else None
+        )
+
+        headers, not_modified = cache_headers("timeseries", ifNoneMatch)
+        if not_modified:
+            return not_modified
+        aggregates = await storage.get_time_series_aggregates(
+            tag_id_list, width, functions, start, end, dataset_id=datasetId, as_models=False
+        )
+        return TrustedJSONResponse(aggregates, headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Failed to aggregate time-series data: {e}")
+        raise HTTPException(status_code=500, detail="Failed to aggregate time-series data")
+
+
 @app.get("/api/tags")
-async def get_available_tags():
+async def get_available_tags(ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match")):
     """Get all available tags"""
     try:
-        tags = await storage.get_available_tags()
-        return tags
+        headers, not_modified = cache_headers("tags", ifNoneMatch)
+        if not_modified:
+            return not_modified
+        tags = await storage.get_available_tags(as_models=False)
+        return TrustedJSONResponse(tags, headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch tags")
 
@@ -470,6 +604,57 @@ async def clear_timeseries():
         raise HTTPException(status_code=500, detail="Failed to clear data")
 
 
+# Dataset endpoints
+@app.get("/api/datasets", response_model=List[Dataset])
+async def get_datasets(response: Response, ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match")):
+    """Get all datasets"""
+    try:
+        headers, not_modified = cache_headers("datasets", ifNoneMatch)
+        if not_modified:
+            return not_modified
+        response.headers.update(headers)
+        return await storage.get_datasets()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="Failed to fetch datasets")
+
+
+@app.delete("/api/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: int):
+    """Delete a dataset and all of its time-series data"""
+    try:
+        deleted = await storage.delete_dataset(dataset_id)
+    except Exception as e:
+        print(f"Failed to delete dataset {dataset_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to delete dataset")
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    return {"success": True}
+
+
+@app.get("/api/db/pool")
+async def get_db_pool_metrics():
+    """Get database connection pool metrics"""
+    return storage.pool_metrics()
+
+
+@app.get("/api/cache")
+async def get_cache_metrics():
+    """Get metadata cache metrics"""
+    return storage.cache_metrics()
+
+
+@app.get("/api/embeddings/cache")
+async def get_embedding_cache_metrics():
+    """Get embedding cache metrics"""
+    return embedding_cache.metrics()
+
+
+@app.get("/api/vectors/writers")
+async def get_vector_writer_metrics():
+    """Get buffered and written vector counts per index"""
+    return vector_writer_metrics()
+
+
 # Annotation endpoints
 @app.post("/api/annotations", response_model=Annotation)
 async def create_annotation(annotation: AnnotationCreate):
@@ -482,12 +667,18 @@ async def create_annotation(annotation: AnnotationCreate):
 
 
 @app.get("/api/annotations", response_model=List[Annotation])
-async def get_annotations(tagIds: Optional[str] = Query(None)):
+async def get_annotations(
+    tagIds: Optional[str] = Query(None),
+    ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match"),
+):
     """Get annotations with optional tag filtering"""
     try:
+        headers, not_modified = cache_headers("annotations", ifNoneMatch)
+        if not_modified:
+            return not_modified
         tag_id_list = tagIds.split(",") if tagIds else None
-        annotations = await storage.get_annotations(tag_id_list)
-        return annotations
+        annotations = await storage.get_annotations(tag_id_list, as_models=False)
+        return TrustedJSONResponse(annotations, headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch annotations")
 
@@ -514,15 +705,50 @@ async def create_rule(rule: RuleCreate):
 
 
 @app.get("/api/rules", response_model=List[Rule])
-async def get_rules():
+async def get_rules(response: Response, ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match")):
     """Get all rules"""
     try:
+        headers, not_modified = cache_headers("rules", ifNoneMatch)
+        if not_modified:
+            return not_modified
+        response.headers.update(headers)
         rules = await storage.get_rules()
         return rules
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to fetch rules")
 
 
+@app.get("/api/rules/evaluate", response_model=List[RuleViolation])
+async def evaluate_rules(
+    startTime: Optional[str] = Query(None),
+    endTime: Optional[str] = Query(None),
+    tagIds: Optional[str] = Query(None),
+    datasetId: Optional[int] = Query(None),
+):
+    """
+    Evaluate the active rules over the readings between `startTime` and
+    `endTime`. Consecutive violating readings merge into one region with its
+    time span, point count and value range, ordered by start time.
+    """
+    try:
+        tag_id_list = tagIds.split(",") if tagIds else None
+        start = (
+            datetime.fromisoformat(startTime.replace("Z", "+00:00"))
+            if startTime
+            else None
+        )
+        end = (
+            datetime.fromisoformat(endTime.replace("Z", "+00:00")) if endTime else None
+        )
+        violations = await storage.evaluate_rules(
+            start, end, tag_ids=tag_id_list, dataset_id=datasetId, as_models=False
+        )
+        return TrustedJSONResponse(violations)
+    except Exception as e:
+        print(f"Failed to evaluate rules: {e}")
+        raise HTTPException(status_code=500, detail="Failed to evaluate rules")
+
+
 @app.put("/api/rules/{rule_id}", response_model=Rule)
 async def update_rule(rule_id: int, updates: dict):
     """Update a rule"""
@@ -555,9 +781,13 @@ async def save_graph(graph: SavedGraphCreate):
 
 
 @app.get("/api/saved-graphs", response_model=List[SavedGraph])
-async def get_saved_graphs():
+async def get_saved_graphs(response: Response, ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match")):
     """Get all saved graphs"""
     try:
+        headers, not_modified = cache_headers("saved_graphs", ifNoneMatch)
+        if not_modified:
+            return not_modified
+        response.headers.update(headers)
         graphs = await storage.get_saved_graphs()
         return graphs
     except Exception as e:
@@ -565,9 +795,17 @@ async def get_saved_graphs():
 
 
 @app.get("/api/saved-graphs/{graph_id}", response_model=SavedGraph)
-async def get_saved_graph(graph_id: int):
+async def get_saved_graph(
+    graph_id: int,
+    response: Response,
+    ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match"),
+):
     """Get a specific saved graph"""
     try:
+        headers, not_modified = cache_headers("saved_graphs", ifNoneMatch)
+        if not_modified:
+            return not_modified
+        response.headers.update(headers)
         graph = await storage.get_saved_graph(graph_id)
         if not graph:
             raise HTTPException(status_code=404, detail="Saved graph not found")
@@ -59,6 +59,13 @@ class TimeSeriesData(BaseModel):
     maxRange: float
     normalizedValue: float
     createdAt: datetime
+    datasetId: Optional[int] = None
+
+class TimeSeriesAggregate(BaseModel):
+    tagId: str
+    bucket: datetime
+    count: int
+    values: Dict[str, Optional[float]]
 
 class TimeSeriesDataCreate(BaseModel):
     timestamp: datetime
@@ -106,6 +113,10 @@ class Rule(BaseModel):
     severity: SeverityLevel
     description: Optional[str] = None
     isActive: bool = True
+    # A violation is only recorded once it spans this many readings and
+    # seconds; None uses RULE_MIN_POINTS / RULE_MIN_DURATION_SECONDS
+    minPoints: Optional[int] = Field(None, ge=1)
+    minDurationSeconds: Optional[float] = Field(None, ge=0)
     createdAt: datetime
 
 class RuleCreate(BaseModel):
@@ -116,6 +127,20 @@ class RuleCreate(BaseModel):
     severity: SeverityLevel
     description: Optional[str] = None
     isActive: bool = True
+    minPoints: Optional[int] = Field(None, ge=1)
+    minDurationSeconds: Optional[float] = Field(None, ge=0)
+
+class RuleViolation(BaseModel):
+    ruleId: int
+    tagId: str
+    condition: RuleCondition
+    severity: SeverityLevel
+    description: Optional[str] = None
+    startTime: datetime
+    endTime: datetime
+    pointCount: int
+    minValue: float
+    maxValue: float
 
 # Saved Graph Models
 class SavedGraph(BaseModel):
@@ -142,6 +167,34 @@ class TagInfo(BaseModel):
     minRange: float
     maxRange: float
     color: str
+    firstTimestamp: Optional[datetime] = None
+    lastTimestamp: Optional[datetime] = None
+    numPoints: int = 0
+
+# Dataset Model
+class Dataset(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    createdAt: datetime
+    tagCount: int = 0
+    numPoints: int = 0
+
+# Ingest Summary Model
+class IngestSummary(BaseModel):
+    datasetId: Optional[int] = None
+    dataset: Optional[str] = None
+    rowsReceived: int
+    rowsInserted: int
+    rowsDeleted: int = 0
+    annotationsCreated: int = 0
+    mode: str = "append"
+    tagCount: int
+    startTime: Optional[datetime] = None
+    endTime: Optional[datetime] = None
+    chunks: int = 1
+    elapsedSeconds: float
+    rowsPerSecond: float
 
 # Upload Result Model
 class UploadResult(BaseModel):
@@ -149,6 +202,35 @@ class UploadResult(BaseModel):
     rowsProcessed: int
     rowsInserted: int
     errors: Optional[List[str]] = None
+    ingest: Optional[IngestSummary] = None
+
+# Upload Job Models
+class UploadJobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    cancelled = "cancelled"
+
+class UploadJobPhase(str, Enum):
+    parse = "parse"
+    insert = "insert"
+    embed = "embed"
+    index = "index"
+
+class UploadJob(BaseModel):
+    id: str
+    filename: str
+    status: UploadJobStatus = UploadJobStatus.queued
+    phase: Optional[UploadJobPhase] = None
+    rowsProcessed: int = 0
+    rowsInserted: int = 0
+    rowsPerSecond: float = 0.0
+    errors: List[str] = []
+    result: Optional[UploadResult] = None
+    createdAt: datetime
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
 
 # Chart Data Point Model
 class ChartDataPoint(BaseModel):
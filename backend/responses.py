@@ -0,0 +1,43 @@
+# app/responses.py
+import json
+from datetime import date, datetime
+from typing import Any
+import numpy as np
+from fastapi.responses import JSONResponse
+
+# Optional: orjson encodes several times faster than the stdlib json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    # What orjson's OPT_SERIALIZE_NUMPY covers
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Compact JSON for API rows: dicts, lists, datetimes and NumPy values"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode()
+
+
+class TrustedJSONResponse(JSONResponse):
+    """
+    Response for trusted rows, i.e. dicts storage has already shaped like the
+    route's response_model. Returning it skips FastAPI's per-row validation
+    and model serialization; the response_model still documents the route.
+    Unlike fastapi.responses.ORJSONResponse (deprecated, orjson required),
+    it falls back to the stdlib json module when orjson is missing.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,213 @@
+# app/rollup.py
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+# Rollup resolutions, coarsest first, and the date_trunc field that builds each
+# one from the next finer level
+ROLLUP_RESOLUTIONS = {
+    "1d": timedelta(days=1),
+    "1h": timedelta(hours=1),
+    "1m": timedelta(minutes=1),
+}
+ROLLUP_TRUNC_FIELDS = {"1d": "day", "1h": "hour", "1m": "minute"}
+ROLLUP_TABLES = {name: f"time_series_rollup_{name}" for name in ROLLUP_RESOLUTIONS}
+ROLLUP_COLUMNS = ["tag_id", "bucket", "dataset_id", "value_count", "value_min", "value_max", "value_sum", "value_sumsq"]
+
+# Rollup buckets are aligned to this origin, like date_bin in aggregate queries
+ROLLUP_ORIGIN = datetime(2000, 1, 1)
+
+# Per-transaction set of (dataset_id, tag_id, hour) whose rollups an ingest
+# must refresh
+DIRTY_HOURS_TABLE = "time_series_dirty_hours"
+_DIRTY_KEYS_TABLE = "time_series_dirty_keys"
+
+
+def _upsert_sql(table: str, select: str) -> str:
+    return f"""
+        INSERT INTO {table} ({", ".join(ROLLUP_COLUMNS)})
+        {select}
+        ON CONFLICT (tag_id, bucket, dataset_id) DO UPDATE SET
+            value_count = EXCLUDED.value_count,
+            value_min = EXCLUDED.value_min,
+            value_max = EXCLUDED.value_max,
+            value_sum = EXCLUDED.value_sum,
+            value_sumsq = EXCLUDED.value_sumsq
+    """
+
+
+def _raw_rollup_select(join: str = "") -> str:
+    """1-minute rollup rows computed from time_series_data"""
+    return f"""
+        SELECT t.tag_id, date_trunc('minute', t.timestamp) AS bucket, t.dataset_id, count(*), min(t.tag_value),
+               max(t.tag_value), sum(t.tag_value), sum(t.tag_value * t.tag_value)
+        FROM time_series_data t {join}
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+    """
+
+
+def _rollup_select(source: str, name: str, join: str = "") -> str:
+    """Roll `source` (finer rollup rows) up to resolution `name`, in lock order"""
+    return f"""
+        SELECT r.tag_id, date_trunc('{ROLLUP_TRUNC_FIELDS[name]}', r.bucket) AS bucket, r.dataset_id,
+               sum(r.value_count), min(r.value_min), max(r.value_max), sum(r.value_sum), sum(r.value_sumsq)
+        FROM {source} r {join}
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+    """
+
+
+def mark_dirty_hours(cur, source: str, dataset_id: int, whole_range: bool = False) -> None:
+    """
+    Record the (tag_id, hour) pairs of `dataset_id` covered by the rows in `source`. With
+    `whole_range`, every hour between each tag's first and last row is marked,
+    for ingests that also delete rows in that window.
+    """
+    cur.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {DIRTY_HOURS_TABLE} (dataset_id integer, tag_id text, hour timestamp) "
+        "ON COMMIT DROP"
+    )
+    if whole_range:
+        cur.execute(f"""
+            INSERT INTO {DIRTY_HOURS_TABLE} (dataset_id, tag_id, hour)
+            SELECT %s, tag_id, generate_series(date_trunc('hour', lo), hi, interval '1 hour')
+            FROM (SELECT tag_id, min(timestamp) AS lo, max(timestamp) AS hi FROM {source} GROUP BY tag_id) w
+        """, (dataset_id,))
+    else:
+        cur.execute(f"""
+            INSERT INTO {DIRTY_HOURS_TABLE} (dataset_id, tag_id, hour)
+            SELECT DISTINCT %s, tag_id, date_trunc('hour', timestamp) FROM {source}
+        """, (dataset_id,))
+
+
+def refresh_rollups(cur) -> int:
+    """
+    Recompute the rollups of the hours marked dirty in this transaction from
+    time_series_data: 1m from raw rows, 1h from 1m and 1d from 1h. The cost is
+    proportional to the hours touched, not to the table. Returns the number of
+    dirty (dataset_id, tag_id, hour) keys.
+    """
+    cur.execute(f"SELECT to_regclass('pg_temp.{DIRTY_HOURS_TABLE}') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute(f"""
+        CREATE TEMP TABLE {_DIRTY_KEYS_TABLE} ON COMMIT DROP AS
+        SELECT DISTINCT dataset_id, tag_id, hour FROM {DIRTY_HOURS_TABLE}
+    """)
+    count = cur.rowcount
+    cur.execute(f"DROP TABLE {DIRTY_HOURS_TABLE}")
+
+    hours = f"{_DIRTY_KEYS_TABLE} d"
+    days = f"(SELECT DISTINCT dataset_id, tag_id, date_trunc('day', hour) AS day FROM {_DIRTY_KEYS_TABLE}) d"
+    in_hour = (
+        "r.tag_id = d.tag_id AND r.dataset_id = d.dataset_id "
+        "AND r.bucket >= d.hour AND r.bucket < d.hour + interval '1 hour'"
+    )
+    in_day = (
+        "r.tag_id = d.tag_id AND r.dataset_id = d.dataset_id "
+        "AND r.bucket >= d.day AND r.bucket < d.day + interval '1 day'"
+    )
+    for name, source, window in [("1m", hours, in_hour), ("1h", hours, in_hour), ("1d", days, in_day)]:
+        cur.execute(f"DELETE FROM {ROLLUP_TABLES[name]} r USING {source} WHERE {window}")
+
+    cur.execute(_upsert_sql(ROLLUP_TABLES["1m"], _raw_rollup_select(
+        f"JOIN {hours} ON t.tag_id = d.tag_id AND t.dataset_id = d.dataset_id "
+        "AND t.timestamp >= d.hour AND t.timestamp < d.hour + interval '1 hour'"
+    )))
+    cur.execute(_upsert_sql(ROLLUP_TABLES["1h"], _rollup_select(ROLLUP_TABLES["1m"], "1h", f"JOIN {hours} ON {in_hour}")))
+    cur.execute(_upsert_sql(ROLLUP_TABLES["1d"], _rollup_select(ROLLUP_TABLES["1h"], "1d", f"JOIN {days} ON {in_day}")))
+    cur.execute(f"DROP TABLE {_DIRTY_KEYS_TABLE}")
+    return count
+
+
+def clear_rollups(cur) -> None:
+    for table in ROLLUP_TABLES.values():
+        cur.execute(f"DELETE FROM {table}")
+
+
+def clear_dataset_rollups(cur, dataset_id: int) -> List[str]:
+    """Delete a dataset's rollups and return the tags it had data for"""
+    cur.execute(
+        f"SELECT DISTINCT tag_id FROM {ROLLUP_TABLES['1d']} WHERE dataset_id = %s ORDER BY tag_id", (dataset_id,)
+    )
+    tag_ids = [row[0] for row in cur.fetchall()]
+    for table in ROLLUP_TABLES.values():
+        cur.execute(f"DELETE FROM {table} WHERE tag_id = ANY(%s) AND dataset_id = %s", (tag_ids, dataset_id))
+    return tag_ids
+
+
+def rebuild_rollups(cur) -> None:
+    """Recompute every rollup table from time_series_data"""
+    clear_rollups(cur)
+    cur.execute(_upsert_sql(ROLLUP_TABLES["1m"], _raw_rollup_select()))
+    cur.execute(_upsert_sql(ROLLUP_TABLES["1h"], _rollup_select(ROLLUP_TABLES["1m"], "1h")))
+    cur.execute(_upsert_sql(ROLLUP_TABLES["1d"], _rollup_select(ROLLUP_TABLES["1h"], "1d")))
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _floor(value: datetime, resolution: timedelta) -> datetime:
+    return ROLLUP_ORIGIN + (value - ROLLUP_ORIGIN) // resolution * resolution
+
+
+def _ceil(value: datetime, resolution: timedelta) -> datetime:
+    floored = _floor(value, resolution)
+    return floored if floored == value else floored + resolution
+
+
+def plan_rollup_segments(
+    start_time: Optional[datetime], end_time: Optional[datetime], bucket: timedelta
+) -> Tuple[List[Tuple[str, Optional[datetime], Optional[datetime]]], List[Tuple[Optional[datetime], Optional[datetime], bool]]]:
+    """
+    Split the inclusive range [start_time, end_time] into rollup segments and
+    raw remainders. Whole buckets of the coarsest rollup that evenly divides
+    `bucket` cover the middle, finer rollups cover the edges, and only the
+    partial minutes at either end are read from time_series_data.
+
+    Returns (rollups, raw): rollups holds (name, lo, hi) covering buckets in
+    [lo, hi); raw holds (lo, hi, hi_inclusive). None means unbounded. Both
+    lists are empty when no rollup applies.
+    """
+    levels = [name for name, resolution in ROLLUP_RESOLUTIONS.items() if bucket % resolution == timedelta(0)]
+    rollups, raw = [], []
+
+    def cover(lo, hi, hi_inclusive, remaining):
+        if not remaining:
+            raw.append((lo, hi, hi_inclusive))
+            return
+        name, finer = remaining[0], remaining[1:]
+        resolution = ROLLUP_RESOLUTIONS[name]
+        first = _ceil(lo, resolution) if lo is not None else None
+        last = _floor(hi, resolution) if hi is not None else None
+        if first is not None and last is not None and first >= last:
+            cover(lo, hi, hi_inclusive, finer)
+            return
+        rollups.append((name, first, last))
+        if lo is not None and lo < first:
+            cover(lo, first, False, finer)
+        if hi is not None and (hi_inclusive or last < hi):
+            cover(last, hi, hi_inclusive, finer)
+
+    if levels:
+        cover(_naive_utc(start_time), _naive_utc(end_time), True, levels)
+    if not rollups:
+        return [], []
+    return rollups, raw
+
+
+
+def rollup_bucket_width(width: timedelta) -> Optional[timedelta]:
+    """
+    `width` rounded up to whole buckets of a rollup, so buckets of that width
+    can be read from the rollups: the coarsest rollup that widens it by at
+    most a tenth, else 1m. None when `width` is finer than every rollup.
+    """
+    finest = min(ROLLUP_RESOLUTIONS.values())
+    if width < finest:
+        return None
+    resolution = next((r for r in ROLLUP_RESOLUTIONS.values() if r * 10 <= width), finest)
+    return -(-width // resolution) * resolution
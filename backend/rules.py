@@ -0,0 +1,318 @@
+# app/rules.py
+import os
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from psycopg2.extras import execute_values
+from models import Rule, RuleCondition
+from columnar import tag_groups
+from ingest import normalize_values
+
+
+# Defaults for rules without minPoints / minDurationSeconds: a violation is
+# recorded once it spans this many readings and seconds. The defaults record
+# every violating reading, single-sample spikes included
+RULE_MIN_POINTS = int(os.getenv("RULE_MIN_POINTS", "1"))
+RULE_MIN_DURATION_SECONDS = float(os.getenv("RULE_MIN_DURATION_SECONDS", "0"))
+
+
+def region_qualifies(rule: Rule, count, duration_ms):
+    """Whether regions of `count` readings over `duration_ms` are long enough to record; works on arrays"""
+    min_points = rule.minPoints if rule.minPoints is not None else RULE_MIN_POINTS
+    min_seconds = rule.minDurationSeconds if rule.minDurationSeconds is not None else RULE_MIN_DURATION_SECONDS
+    return (count >= min_points) & (duration_ms >= min_seconds * 1000)
+
+
+def condition_mask(values: np.ndarray, condition: str, threshold: float,
+                   threshold_max: Optional[float] = None) -> np.ndarray:
+    """Boolean mask of the readings that violate a rule, i.e. meet its condition"""
+    condition = RuleCondition(condition)
+    if condition == RuleCondition.greater_than:
+        return values > threshold
+    if condition == RuleCondition.less_than:
+        return values < threshold
+    if condition == RuleCondition.equals:
+        return values == threshold
+    if condition == RuleCondition.greater_equal:
+        return values >= threshold
+    if condition == RuleCondition.less_equal:
+        return values <= threshold
+    if threshold_max is None:
+        raise ValueError("between rules need thresholdMax")
+    low, high = sorted((threshold, threshold_max))
+    return (values >= low) & (values <= high)
+
+
+def violation_runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(starts, stops) of each run of consecutive True values; stops are exclusive"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def violation_regions(rule: Rule, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(starts, stops, mins, maxs) of each run of readings violating `rule`"""
+    mask = condition_mask(values, rule.condition, rule.threshold, rule.thresholdMax)
+    starts, stops = violation_runs(mask)
+    if not len(starts):
+        return starts, stops, np.empty(0), np.empty(0)
+    # Runs are contiguous in the violating readings alone, so reduceat over
+    # their offsets there gives each run's min and max in one pass
+    violating = values[mask]
+    offsets = np.concatenate(([0], np.cumsum(stops - starts)[:-1]))
+    return starts, stops, np.minimum.reduceat(violating, offsets), np.maximum.reduceat(violating, offsets)
+
+
+def evaluate_rule(rule: Rule, timestamps_ms: np.ndarray, values: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Violation regions of `rule` over one tag's readings, in timestamp order:
+    consecutive violating readings merge into one region with its first and
+    last timestamp, point count and value range. Regions shorter than the
+    rule's minimum points or duration are left out.
+    """
+    starts, stops, mins, maxs = violation_regions(rule, values)
+    keep = region_qualifies(rule, stops - starts, timestamps_ms[stops - 1] - timestamps_ms[starts])
+    starts, stops, mins, maxs = starts[keep], stops[keep], mins[keep], maxs[keep]
+    if not len(starts):
+        return []
+    lengths = stops - starts
+    start_times = timestamps_ms[starts].astype("datetime64[ms]").tolist()
+    end_times = timestamps_ms[stops - 1].astype("datetime64[ms]").tolist()
+    rule_id, tag_id, condition, severity, description = (
+        rule.id, rule.tagId, rule.condition.value, rule.severity.value, rule.description
+    )
+    return [
+        {
+            "ruleId": rule_id,
+            "tagId": tag_id,
+            "condition": condition,
+            "severity": severity,
+            "description": description,
+            "startTime": start,
+            "endTime": end,
+            "pointCount": count,
+            "minValue": low,
+            "maxValue": high,
+        }
+        for start, end, count, low, high
+        in zip(start_times, end_times, lengths.tolist(), mins.tolist(), maxs.tolist())
+    ]
+
+
+def rule_violations(rules: List[Rule], frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Evaluate `rules` against a frame of tag_id, timestamp_ms and value rows
+    in any order (see columnar.read_time_series_frame). Returns violation
+    regions ordered by start time.
+    """
+    _, timestamps, values, slices = tag_groups(frame, sort_timestamps=True)
+    series = {tag_id: (start, stop) for tag_id, start, stop in slices}
+    regions = []
+    for rule in rules:
+        if rule.tagId not in series:
+            continue
+        start, stop = series[rule.tagId]
+        try:
+            regions.extend(evaluate_rule(rule, timestamps[start:stop], values[start:stop]))
+        except ValueError as e:
+            print(f"Skipping rule {rule.id}: {e}")
+    regions.sort(key=lambda region: (region["startTime"], region["ruleId"]))
+    return regions
+
+
+RULE_STATE_TABLE = "rule_state"
+
+# Annotations written for rule violations: category by rule severity, so the
+# annotation table colors them like hand-made Warning/Critical annotations
+RULE_ANNOTATION_CATEGORIES = {"low": "Warning", "medium": "Warning", "high": "Critical", "critical": "Critical"}
+
+
+class RuleTracker:
+    """
+    Incremental rule evaluation over ingested chunks. Per rule it keeps the
+    last timestamp evaluated and the region still open there, so a violation
+    that spans chunks or uploads stays one region, recorded once it reaches
+    the rule's minimum points and duration. Readings at or before that
+    timestamp are skipped, which keeps re-uploads from repeating annotations;
+    backfilled history is evaluated on demand by /api/rules/evaluate instead.
+    `states` maps rule ids to {"last": epoch ms, "open": region or None} as
+    load_rule_states returns them.
+    """
+
+    def __init__(self, rules: List[Rule], states: Dict[int, Dict[str, Any]]):
+        self.rules = [rule for rule in rules if rule.condition != RuleCondition.between or rule.thresholdMax is not None]
+        self.states = states
+        # Regions to write: new ones, and open ones that were extended
+        self.pending: List[Dict[str, Any]] = []
+
+    def update(self, frame: pd.DataFrame) -> None:
+        """Evaluate the readings of a prepared ingest chunk (tagId, timestamp, value)"""
+        if not self.rules or frame.empty:
+            return
+        timestamp = frame["timestamp"]
+        if timestamp.dt.tz is not None:
+            timestamp = timestamp.dt.tz_convert(None)
+        _, timestamps, values, slices = tag_groups(pd.DataFrame({
+            "tag_id": frame["tagId"],
+            "timestamp_ms": timestamp.astype("datetime64[ms]").astype(np.int64),
+            "value": frame["value"],
+        }), sort_timestamps=True)
+        series = {tag_id: (start, stop) for tag_id, start, stop in slices}
+        for rule in self.rules:
+            if rule.tagId in series:
+                start, stop = series[rule.tagId]
+                self._advance(rule, timestamps[start:stop], values[start:stop])
+
+    def _advance(self, rule: Rule, timestamps: np.ndarray, values: np.ndarray) -> None:
+        state = self.states.setdefault(rule.id, {"last": None, "open": None})
+        if state["last"] is not None:
+            first_new = np.searchsorted(timestamps, state["last"], side="right")
+            timestamps, values = timestamps[first_new:], values[first_new:]
+        if not len(timestamps):
+            return
+        starts, stops, mins, maxs = violation_regions(rule, values)
+        regions = [
+            {"rule": rule, "start": start, "end": end, "count": count, "min": low, "max": high, "annotationId": None}
+            for start, end, count, low, high in zip(
+                timestamps[starts].tolist(), timestamps[stops - 1].tolist(), (stops - starts).tolist(),
+                mins.tolist(), maxs.tolist(),
+            )
+        ]
+        open_region = state["open"]
+        if open_region is not None and len(starts) and starts[0] == 0:
+            # The region left open by the previous slice continues into this one
+            first = regions[0]
+            open_region.update(
+                end=first["end"], count=open_region["count"] + first["count"],
+                min=min(open_region["min"], first["min"]), max=max(open_region["max"], first["max"]),
+            )
+            regions[0] = open_region
+        for region in regions:
+            # Too short a region is dropped once closed; an open one is kept
+            # in the state and recorded once it has grown long enough
+            if not region.get("pending") and region_qualifies(rule, region["count"], region["end"] - region["start"]):
+                region["pending"] = True
+                self.pending.append(region)
+        # A region reaching the slice's last reading stays open for the next one
+        state["open"] = regions[-1] if len(stops) and stops[-1] == len(values) else None
+        state["last"] = int(timestamps[-1])
+
+
+def load_rule_states(cur, dataset_id: int, rules: List[Rule]) -> Dict[int, Dict[str, Any]]:
+    """RuleTracker states of `rules` in a dataset, with any open region"""
+    by_id = {rule.id: rule for rule in rules}
+    cur.execute(
+        f"""
+        SELECT rule_id, (extract(epoch FROM last_timestamp) * 1000)::bigint, annotation_id,
+               (extract(epoch FROM open_start) * 1000)::bigint, (extract(epoch FROM open_end) * 1000)::bigint,
+               open_count, open_min, open_max
+        FROM {RULE_STATE_TABLE} WHERE dataset_id = %s AND rule_id = ANY(%s)
+        """,
+        (dataset_id, list(by_id)),
+    )
+    states = {}
+    for rule_id, last, annotation_id, start, end, count, low, high in cur.fetchall():
+        open_region = None
+        if start is not None:
+            open_region = {
+                "rule": by_id[rule_id], "start": start, "end": end, "count": count,
+                "min": low, "max": high, "annotationId": annotation_id,
+            }
+        states[rule_id] = {"last": last, "open": open_region}
+    return states
+
+
+def save_rule_states(cur, dataset_id: int, states: Dict[int, Dict[str, Any]]) -> None:
+    """Upsert RuleTracker states; call after write_rule_annotations has set annotation ids"""
+    rows = []
+    for rule_id, state in states.items():
+        if state["last"] is None:
+            continue
+        region = state["open"] or {}
+        rows.append((
+            rule_id, dataset_id, state["last"], region.get("annotationId"), region.get("start"),
+            region.get("end"), region.get("count", 0), region.get("min"), region.get("max"),
+        ))
+    if not rows:
+        return
+    epoch_ms = "to_timestamp(%s / 1000.0) AT TIME ZONE 'UTC'"
+    execute_values(
+        cur,
+        f"""
+        INSERT INTO {RULE_STATE_TABLE} (rule_id, dataset_id, last_timestamp, annotation_id, open_start, open_end,
+                                        open_count, open_min, open_max)
+        VALUES %s
+        ON CONFLICT (rule_id, dataset_id) DO UPDATE SET
+            last_timestamp = EXCLUDED.last_timestamp, annotation_id = EXCLUDED.annotation_id,
+            open_start = EXCLUDED.open_start, open_end = EXCLUDED.open_end, open_count = EXCLUDED.open_count,
+            open_min = EXCLUDED.open_min, open_max = EXCLUDED.open_max
+        """,
+        rows,
+        template=f"(%s, %s, {epoch_ms}, %s, {epoch_ms}, {epoch_ms}, %s, %s, %s)",
+    )
+
+
+def _peak(region: Dict[str, Any]) -> float:
+    """The reading an annotation shows: the lowest for less-than rules, else the highest"""
+    if region["rule"].condition in (RuleCondition.less_than, RuleCondition.less_equal):
+        return region["min"]
+    return region["max"]
+
+
+def _rule_description(rule: Rule) -> str:
+    if rule.description:
+        return f"Rule {rule.id}: {rule.description}"
+    threshold = f"{rule.threshold}..{rule.thresholdMax}" if rule.condition == RuleCondition.between else rule.threshold
+    return f"Rule {rule.id}: {rule.tagId} {rule.condition.value} {threshold}"
+
+
+def write_rule_annotations(cur, regions: List[Dict[str, Any]], ranges: Dict[str, Tuple[float, float]]) -> int:
+    """
+    Write RuleTracker regions as region annotations in bulk: INSERT the new
+    ones (setting their annotationId) and extend the ones already written.
+    `ranges` maps tag ids to (minRange, maxRange) for the normalized value.
+    Returns the number of annotations created.
+    """
+    if not regions:
+        return 0
+    peaks = np.array([_peak(region) for region in regions], dtype=np.float64)
+    default_range = (0.0, 100.0)
+    bounds = np.array([ranges.get(region["rule"].tagId, default_range) for region in regions], dtype=np.float64)
+    normalized = normalize_values(peaks, bounds[:, 0], bounds[:, 1]).tolist()
+    epoch_ms = "to_timestamp(%s / 1000.0) AT TIME ZONE 'UTC'"
+
+    rows = list(zip(regions, peaks.tolist(), normalized))
+    created = [row for row in rows if row[0]["annotationId"] is None]
+    extended = [(region["annotationId"], region["end"], peak, norm)
+                for region, peak, norm in rows if region["annotationId"] is not None]
+    if created:
+        ids = execute_values(
+            cur,
+            """
+            INSERT INTO annotations (timestamp, tagid, type, category, severity, value, normalized_value,
+                                     description, region_start, region_end, created_at)
+            VALUES %s RETURNING id
+            """,
+            [
+                (region["start"], region["rule"].tagId, RULE_ANNOTATION_CATEGORIES[region["rule"].severity.value],
+                 region["rule"].severity.value, peak, norm, _rule_description(region["rule"]), region["start"],
+                 region["end"])
+                for region, peak, norm in created
+            ],
+            template=f"({epoch_ms}, %s, 'region', %s, %s, %s, %s, %s, {epoch_ms}, {epoch_ms}, LOCALTIMESTAMP)",
+            page_size=len(created),
+            fetch=True,
+        )
+        for (region, _, _), (annotation_id,) in zip(created, ids):
+            region["annotationId"] = annotation_id
+
+    if extended:
+        execute_values(
+            cur,
+            """
+            UPDATE annotations a SET region_end = to_timestamp(v.end_ms / 1000.0) AT TIME ZONE 'UTC',
+                                     value = v.value, normalized_value = v.normalized
+            FROM (VALUES %s) v (id, end_ms, value, normalized) WHERE a.id = v.id
+            """,
+            extended,
+        )
+    return len(created)
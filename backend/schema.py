@@ -0,0 +1,341 @@
+# app/schema.py
+"""
+Schema migrations for time_series_data, its rollups and tag_info that
+create_all cannot apply to existing tables, the per-dataset partitions of
+time_series_data, and a query-plan check for the hot time-series queries.
+
+Usage:
+    python schema.py migrate
+    python schema.py check-plans
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+from typing import List, Optional
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+from catalog import TAG_CATALOG_MIGRATIONS, rebuild_tag_catalog
+from rollup import rebuild_rollups, ROLLUP_TABLES
+
+load_dotenv()
+
+TIME_SERIES_TABLE = "time_series_data"
+
+# time_series_data is partitioned by list on dataset_id, one partition per
+# named dataset, so dropping or replacing a dataset never deletes row by row.
+# Rows that predate datasets belong to the default dataset.
+DATASET_TABLE = "datasets"
+DEFAULT_DATASET = "default"
+
+# Optional range sub-partitioning of each dataset partition on timestamp:
+# one of day, week, month or year. Unset keeps one table per dataset.
+TIME_SERIES_PARTITION_INTERVAL = os.getenv("TIME_SERIES_PARTITION_INTERVAL", "").strip().lower() or None
+PARTITION_INTERVALS = ("day", "week", "month", "year")
+
+# Kept in sync with the TimeSeriesData indexes in sqlalchemy_models.py. Unique
+# indexes on a partitioned table must include the partition key, so dataset_id
+# trails the (tag_id, timestamp) key it scopes.
+TIME_SERIES_INDEXES = {
+    "ix_time_series_data_tag_id_timestamp":
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ix_time_series_data_tag_id_timestamp ON {TIME_SERIES_TABLE} (tag_id, timestamp DESC, dataset_id)",
+    "ix_time_series_data_timestamp_brin":
+        f"CREATE INDEX IF NOT EXISTS ix_time_series_data_timestamp_brin ON {TIME_SERIES_TABLE} USING brin (timestamp)",
+}
+
+
+def partition_strategy(cur, table: str = TIME_SERIES_TABLE) -> Optional[str]:
+    """'l' (list) or 'r' (range) for a partitioned table, None otherwise"""
+    cur.execute("SELECT partstrat FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+# Adds the columns create_all cannot add to an existing rules table
+RULE_MIGRATIONS = [
+    "ALTER TABLE rules ADD COLUMN IF NOT EXISTS min_points integer",
+    "ALTER TABLE rules ADD COLUMN IF NOT EXISTS min_duration_seconds double precision",
+]
+
+
+def dataset_partition(dataset_id: int) -> str:
+    return f"{TIME_SERIES_TABLE}_d{int(dataset_id)}"
+
+
+def _attach_partition(cur, parent: str, name: str, bound: str, partition_by: str = "") -> None:
+    """
+    Create `name` as a partition of `parent` unless it exists. The table is
+    created on its own and then attached, which takes a SHARE UPDATE EXCLUSIVE
+    lock on `parent` where CREATE TABLE ... PARTITION OF would take ACCESS
+    EXCLUSIVE, so queries keep running while an ingest adds partitions.
+    Concurrent callers creating the same partition take turns on an advisory
+    lock on its name; the later one finds it attached once the first commits.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (name,))
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    if cur.fetchone()[0]:
+        return
+    cur.execute(f"CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS) {partition_by}")
+    cur.execute(f"ALTER TABLE {parent} ATTACH PARTITION {name} {bound}")
+
+
+def _ensure_day_partitions(cur, partition: str, days: List[datetime]) -> None:
+    """Create the range sub-partitions of a dataset partition holding `days`"""
+    interval = TIME_SERIES_PARTITION_INTERVAL
+    cur.execute(
+        """
+            SELECT DISTINCT date_trunc(%s, day) AS lo, date_trunc(%s, day) + %s::interval AS hi
+            FROM unnest(%s::timestamp[]) day
+            ORDER BY lo
+        """,
+        (interval, interval, f"1 {interval}", days),
+    )
+    for lo, hi in cur.fetchall():
+        _attach_partition(
+            cur, partition, f"{partition}_p{lo:%Y%m%d}",
+            f"FOR VALUES FROM ('{lo:%Y-%m-%d %H:%M:%S}') TO ('{hi:%Y-%m-%d %H:%M:%S}')",
+        )
+
+
+def create_dataset_partition(cur, dataset_id: int, parent: str = TIME_SERIES_TABLE) -> str:
+    """Create the partition holding a dataset's rows, range-partitioned if configured"""
+    partition = dataset_partition(dataset_id)
+    partition_by = "PARTITION BY RANGE (timestamp)" if TIME_SERIES_PARTITION_INTERVAL else ""
+    _attach_partition(cur, parent, partition, f"FOR VALUES IN ({int(dataset_id)})", partition_by)
+    return partition
+
+
+def ensure_dataset(cur, name: str, description: Optional[str] = None) -> int:
+    """
+    Return the id of the dataset called `name`, registering it and creating its
+    partition if needed. A non-empty `description` replaces the stored one.
+    """
+    cur.execute(f"SELECT id FROM {DATASET_TABLE} WHERE name = %s", (name,))
+    row = cur.fetchone()
+    if row is None:
+        cur.execute(
+            f"""
+                INSERT INTO {DATASET_TABLE} (name, description) VALUES (%s, %s)
+                ON CONFLICT (name) DO UPDATE SET description = EXCLUDED.description
+                RETURNING id
+            """,
+            (name, description or None),
+        )
+        row = cur.fetchone()
+    elif description:
+        cur.execute(f"UPDATE {DATASET_TABLE} SET description = %s WHERE id = %s", (description, row[0]))
+    dataset_id = row[0]
+    create_dataset_partition(cur, dataset_id)
+    return dataset_id
+
+
+def lock_dataset(cur, dataset_id: int) -> None:
+    """
+    Hold a dataset's ingest lock until the end of the transaction. Ingests
+    into one dataset take turns, so none of them recomputes rollup hours or
+    rule state from rows another has yet to commit; readers are not blocked.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s), %s)", (DATASET_TABLE, dataset_id))
+
+
+def drop_dataset_partition(cur, dataset_id: int) -> None:
+    """Detach and drop a dataset's partition: metadata only, whatever its size"""
+    partition = dataset_partition(dataset_id)
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (partition,))
+    if cur.fetchone()[0]:
+        cur.execute(f"ALTER TABLE {TIME_SERIES_TABLE} DETACH PARTITION {partition}")
+        cur.execute(f"DROP TABLE {partition}")
+
+
+def ensure_time_partitions(cur, dataset_id: int, timestamps: pd.Series) -> None:
+    """Create the range sub-partitions an ingest chunk needs; no-op for a plain dataset partition"""
+    partition = dataset_partition(dataset_id)
+    if not TIME_SERIES_PARTITION_INTERVAL or timestamps.empty or partition_strategy(cur, partition) != "r":
+        return
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_localize(None)
+    days = [day.to_pydatetime() for day in timestamps.dt.floor("D").unique()]
+    _ensure_day_partitions(cur, partition, days)
+
+
+def _partition_by_dataset(cur, dataset_id: int) -> None:
+    """
+    Rebuild time_series_data as a table partitioned by list on dataset_id,
+    moving existing rows (plain or range-partitioned) into the partition of
+    `dataset_id` along with the id sequence. The primary key becomes
+    (id, dataset_id, timestamp), since it must include every partition key.
+    """
+    table, staging = TIME_SERIES_TABLE, f"{TIME_SERIES_TABLE}_datasets"
+    print(f"Partitioning {table} by dataset")
+    cur.execute(
+        f"CREATE TABLE {staging} (LIKE {table} INCLUDING DEFAULTS, dataset_id integer NOT NULL) "
+        "PARTITION BY LIST (dataset_id)"
+    )
+    cur.execute(f"ALTER TABLE {staging} ADD PRIMARY KEY (id, dataset_id, timestamp)")
+    partition = create_dataset_partition(cur, dataset_id, parent=staging)
+    if TIME_SERIES_PARTITION_INTERVAL:
+        cur.execute(f"SELECT DISTINCT date_trunc('day', timestamp) FROM {table}")
+        _ensure_day_partitions(cur, partition, [row[0] for row in cur.fetchall()])
+    cur.execute(f"INSERT INTO {partition} SELECT *, %s FROM {table}", (dataset_id,))
+    cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+    sequence = cur.fetchone()[0]
+    if sequence:
+        cur.execute(f"ALTER SEQUENCE {sequence} OWNED BY {staging}.id")
+    cur.execute(f"DROP TABLE {table}")
+    cur.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+    cur.execute(f"ALTER TABLE {table} RENAME CONSTRAINT {staging}_pkey TO {table}_pkey")
+
+
+def _add_rollup_dataset_column(cur, dataset_id: int) -> None:
+    """Key rollup rows by dataset too, assigning existing ones to `dataset_id`"""
+    for table in ROLLUP_TABLES.values():
+        cur.execute(
+            "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = 'dataset_id'",
+            (table,),
+        )
+        if cur.fetchone():
+            continue
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN dataset_id integer NOT NULL DEFAULT {int(dataset_id)}")
+        cur.execute(f"ALTER TABLE {table} ALTER COLUMN dataset_id DROP DEFAULT")
+        cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_pkey")
+        cur.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (tag_id, bucket, dataset_id)")
+
+
+def _make_tag_timestamp_unique(cur) -> None:
+    """
+    Remove duplicate (dataset_id, tag_id, timestamp) rows, keeping the most
+    recently inserted one, so the unique index can be built where it is
+    missing or an older non-unique one is in place
+    """
+    cur.execute(
+        "SELECT i.indisunique FROM pg_index i WHERE i.indexrelid = to_regclass('ix_time_series_data_tag_id_timestamp')"
+    )
+    row = cur.fetchone()
+    if row is not None and row[0]:
+        return
+    cur.execute(f"""
+        DELETE FROM {TIME_SERIES_TABLE} a USING {TIME_SERIES_TABLE} b
+        WHERE a.dataset_id = b.dataset_id AND a.tag_id = b.tag_id AND a.timestamp = b.timestamp AND a.id < b.id
+    """)
+    removed = cur.rowcount
+    cur.execute("DROP INDEX IF EXISTS ix_time_series_data_tag_id_timestamp")
+    if removed:
+        print(f"Removed {removed} duplicate (tag_id, timestamp) rows")
+        rebuild_rollups(cur)
+        rebuild_tag_catalog(cur)
+
+
+def migrate(conn) -> None:
+    """
+    Partition time_series_data by dataset, apply its indexes and optional time
+    sub-partitioning, and add the rollup, tag_info and rules columns; idempotent
+    """
+    if TIME_SERIES_PARTITION_INTERVAL and TIME_SERIES_PARTITION_INTERVAL not in PARTITION_INTERVALS:
+        raise ValueError(
+            f"TIME_SERIES_PARTITION_INTERVAL must be one of: {', '.join(PARTITION_INTERVALS)}"
+        )
+    with conn.cursor() as cur:
+        if partition_strategy(cur) != "l":
+            cur.execute(
+                f"INSERT INTO {DATASET_TABLE} (name) VALUES (%s) ON CONFLICT (name) DO NOTHING", (DEFAULT_DATASET,)
+            )
+            cur.execute(f"SELECT id FROM {DATASET_TABLE} WHERE name = %s", (DEFAULT_DATASET,))
+            _partition_by_dataset(cur, cur.fetchone()[0])
+        default_id = ensure_dataset(cur, DEFAULT_DATASET)
+        _add_rollup_dataset_column(cur, default_id)
+        _make_tag_timestamp_unique(cur)
+        for statement in list(TIME_SERIES_INDEXES.values()) + TAG_CATALOG_MIGRATIONS + RULE_MIGRATIONS:
+            cur.execute(statement)
+    conn.commit()
+
+
+# Hot queries that must be served from the indexes above: (sql, sample params,
+# whether a sort step is expected). Merging several tags by timestamp needs a
+# sort; picking the latest row per tag must not.
+HOT_QUERIES = {
+    "get_time_series_data": (
+        f"SELECT * FROM {TIME_SERIES_TABLE} WHERE tag_id = ANY(%s) AND timestamp >= %s AND timestamp <= %s "
+        "ORDER BY timestamp ASC",
+        (["TAG_0", "TAG_1"], datetime(2024, 1, 1), datetime(2024, 1, 2)),
+        True,
+    ),
+    "get_time_series_data (latest)": (
+        f"SELECT * FROM {TIME_SERIES_TABLE} WHERE tag_id = ANY(%s) ORDER BY timestamp DESC LIMIT %s",
+        (["TAG_0"], 100),
+        True,
+    ),
+    "get_time_series_data (dataset)": (
+        f"SELECT * FROM {TIME_SERIES_TABLE} WHERE dataset_id = %s AND tag_id = ANY(%s) AND timestamp >= %s "
+        "ORDER BY timestamp ASC",
+        (1, ["TAG_0"], datetime(2024, 1, 1)),
+        True,
+    ),
+    "time range only": (
+        f"SELECT count(*) FROM {TIME_SERIES_TABLE} WHERE timestamp >= %s AND timestamp <= %s",
+        (datetime(2024, 1, 1), datetime(2024, 1, 2)),
+        False,
+    ),
+    "latest row per tag": (
+        f"SELECT DISTINCT ON (tag_id) tag_id, tag_label, unit, min_range, max_range FROM {TIME_SERIES_TABLE} "
+        "ORDER BY tag_id, timestamp DESC",
+        (),
+        False,
+    ),
+}
+
+
+def _plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def check_query_plans(conn) -> List[str]:
+    """
+    EXPLAIN each hot query with sequential scans disabled and return the
+    problems found: a scan of time_series_data that no index can serve, or
+    a sort the (tag_id, timestamp DESC) index should make unnecessary. Disabling
+    seqscan makes the check independent of table size and statistics.
+    """
+    problems = []
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL enable_seqscan = off")
+        for name, (query, params, sorts) in HOT_QUERIES.items():
+            cur.execute(f"EXPLAIN (FORMAT JSON) {query}", params)
+            plan = cur.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            nodes = list(_plan_nodes(plan[0]["Plan"]))
+            for node in nodes:
+                relation = node.get("Relation Name", "")
+                if node["Node Type"] == "Seq Scan" and relation.startswith(TIME_SERIES_TABLE):
+                    problems.append(f"{name}: sequential scan on {relation}")
+                if node["Node Type"] in ("Sort", "Incremental Sort") and not sorts:
+                    problems.append(f"{name}: sort on {', '.join(node.get('Sort Key', []))}")
+    conn.rollback()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["migrate", "check-plans"])
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+    try:
+        if args.command == "migrate":
+            migrate(conn)
+            print("Migration complete")
+        else:
+            problems = check_query_plans(conn)
+            for problem in problems:
+                print(problem)
+            print("Query plans OK" if not problems else f"{len(problems)} query plan problem(s)")
+            sys.exit(1 if problems else 0)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
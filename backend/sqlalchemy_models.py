@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Enum as SqlEnum, JSON
+from sqlalchemy import Column, Index, Integer, BigInteger, String, Text, Float, Boolean, DateTime, Enum as SqlEnum, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import enum
@@ -24,12 +24,24 @@ class RuleCondition(str, enum.Enum):
     less_equal = "less_equal"
     between = "between"
 
+# Dataset: a named upload target with its own time_series_data partition
+class Dataset(Base):
+    __tablename__ = "datasets"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False, unique=True)
+    description = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
 # TimeSeriesData
 class TimeSeriesData(Base):
     __tablename__ = "time_series_data"
+    # One partition per dataset, created by schema.ensure_dataset
+    __table_args__ = {"postgresql_partition_by": "LIST (dataset_id)"}
 
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    dataset_id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, primary_key=True, nullable=False)
     tag_id = Column(String, nullable=False)
     tag_value = Column(Float, nullable=False)
     tag_label = Column(String, nullable=False)
@@ -39,6 +51,36 @@ class TimeSeriesData(Base):
     normalized_value = Column(Float, nullable=False)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
 
+# Existing databases get these from schema.migrate. One reading per tag and
+# timestamp within a dataset, which ingest relies on for ON CONFLICT; newest
+# first per tag, so the latest row per tag is a forward index scan.
+Index(
+    "ix_time_series_data_tag_id_timestamp",
+    TimeSeriesData.tag_id, TimeSeriesData.timestamp.desc(), TimeSeriesData.dataset_id,
+    unique=True,
+)
+Index("ix_time_series_data_timestamp_brin", TimeSeriesData.timestamp, postgresql_using="brin")
+
+# Time-series rollups: per tag and bucket aggregates maintained at ingest
+class TimeSeriesRollupColumns:
+    tag_id = Column(String, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    dataset_id = Column(Integer, primary_key=True)
+    value_count = Column(BigInteger, nullable=False)
+    value_min = Column(Float, nullable=False)
+    value_max = Column(Float, nullable=False)
+    value_sum = Column(Float, nullable=False)
+    value_sumsq = Column(Float, nullable=False)
+
+class TimeSeriesRollup1m(TimeSeriesRollupColumns, Base):
+    __tablename__ = "time_series_rollup_1m"
+
+class TimeSeriesRollup1h(TimeSeriesRollupColumns, Base):
+    __tablename__ = "time_series_rollup_1h"
+
+class TimeSeriesRollup1d(TimeSeriesRollupColumns, Base):
+    __tablename__ = "time_series_rollup_1d"
+
 # Annotation
 class Annotation(Base):
     __tablename__ = "annotations"
@@ -68,6 +110,37 @@ class Rule(Base):
     severity = Column(SqlEnum(SeverityLevel), nullable=False)
     description = Column(String, nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
+    min_points = Column(Integer, nullable=True)
+    min_duration_seconds = Column(Float, nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+# RuleState: how far incremental evaluation of a rule has got in a dataset,
+# and the violation region still open there (with its annotation once recorded)
+class RuleState(Base):
+    __tablename__ = "rule_state"
+
+    rule_id = Column(Integer, primary_key=True)
+    dataset_id = Column(Integer, primary_key=True)
+    last_timestamp = Column(DateTime, nullable=False)
+    annotation_id = Column(Integer, nullable=True)
+    open_start = Column(DateTime, nullable=True)
+    open_end = Column(DateTime, nullable=True)
+    open_count = Column(BigInteger, nullable=False, default=0)
+    open_min = Column(Float, nullable=True)
+    open_max = Column(Float, nullable=True)
+
+# DocumentChunk: text of an indexed document chunk, looked up by vector id
+# so the vectors themselves only carry small filterable metadata
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+
+    id = Column(String, primary_key=True)
+    document_name = Column(String, nullable=False, index=True)
+    document_hash = Column(String(64), nullable=False, index=True)
+    section = Column(Integer, nullable=False)
+    source = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+    user_id = Column(String, nullable=True)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
 
 # SavedGraph
@@ -92,6 +165,10 @@ class TagInfo(Base):
     minRange = Column(Float, nullable=False)
     maxRange = Column(Float, nullable=False)
     color = Column(String, nullable=False)
+    # Maintained at ingest; existing databases get these from schema.migrate
+    firstTimestamp = Column(DateTime, nullable=True)
+    lastTimestamp = Column(DateTime, nullable=True)
+    numPoints = Column(BigInteger, nullable=False, server_default="0")
 
 # UploadResult (Log-style)
 class UploadResult(Base):
@@ -1,27 +1,81 @@
 import os
+import time
 import asyncio
-from typing import List, Optional, Dict, Any
-from datetime import datetime
+from typing import List, Optional, Dict, Any, Union, Iterable, Callable, AsyncIterator, Tuple
+from datetime import datetime, timedelta
 import psycopg2
 from psycopg2.extras import RealDictCursor, execute_values
 import json
+import numpy as np
+import pandas as pd
 from dotenv import load_dotenv
-from vector_store import upsert_to_pinecone
+from vector_store import upsert_to_pinecone, get_vector_index
 from models import (
     TimeSeriesData, 
+    TimeSeriesAggregate,
     Annotation, 
     Rule, 
+    RuleViolation,
     SavedGraph, 
     TagInfo,
+    Dataset,
     TimeSeriesDataCreate,
     AnnotationCreate,
     RuleCreate,
-    SavedGraphCreate
+    SavedGraphCreate,
+    IngestSummary
 )
-from embedding import embed_text
-from pinecone import Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-phase2_index = pc.Index(name="timeseries")
+from embedding import embed_text, embed_many
+from database import get_pool, run_in_db_executor
+from ingest import (
+    prepare_time_series_frame,
+    stage_time_series_frame,
+    merge_staged_time_series,
+    delete_staged_time_ranges,
+    TagSummary,
+    INGEST_MODES,
+    DEFAULT_INGEST_MODE,
+    TIME_SERIES_STAGING_TABLE,
+)
+from streaming import STREAM_BATCH_ROWS, STREAM_MAX_CONCURRENT
+from columnar import read_time_series_frame
+from rules import (
+    rule_violations,
+    RuleTracker,
+    load_rule_states,
+    save_rule_states,
+    write_rule_annotations,
+    RULE_STATE_TABLE,
+)
+from downsample import bucket_count, lttb_indices, LTTB_PREAGGREGATE_FACTOR
+from aggregate import aggregate_select, supports_rollup, BUCKET_ORIGIN
+from schema import (
+    migrate,
+    ensure_time_partitions,
+    ensure_dataset,
+    lock_dataset,
+    drop_dataset_partition,
+    dataset_partition,
+    DATASET_TABLE,
+    DEFAULT_DATASET,
+)
+from versions import ResourceVersions, bumps, TIME_SERIES_RESOURCES
+from cache import TTLCache
+from vector_writer import get_vector_writer
+from catalog import refresh_tag_catalog, clear_tag_catalog, rebuild_tag_catalog, TAG_CATALOG_TABLE, TAG_CATALOG_COLUMNS
+from rollup import (
+    plan_rollup_segments,
+    rollup_bucket_width,
+    mark_dirty_hours,
+    refresh_rollups,
+    clear_rollups,
+    clear_dataset_rollups,
+    rebuild_rollups,
+    ROLLUP_TABLES,
+    ROLLUP_RESOLUTIONS,
+)
+phase2_index = get_vector_index("timeseries")
+phase2_writer = get_vector_writer("timeseries", phase2_index)
 from collections import defaultdict
 
 load_dotenv()
@@ -31,227 +85,798 @@ class DatabaseStorage:
         self.database_url = os.getenv('DATABASE_URL')
         if not self.database_url:
             raise ValueError("DATABASE_URL environment variable is required")
+        self.pool = get_pool(self.database_url)
+        # Rarely changing metadata reads, keyed by resource version and also
+        # invalidated outright whenever the write methods below bump one
+        self.cache = TTLCache()
+        # Bumped by the write methods below; read endpoints derive ETags from them
+        self.versions = ResourceVersions(on_bump=self.cache.invalidate)
+        # Slots for streamed reads; created on first use, inside the event loop
+        self._stream_slots: Optional[asyncio.Semaphore] = None
     
     def get_connection(self):
-        """Get a database connection"""
-        return psycopg2.connect(self.database_url)
+        """Check out a pooled database connection; pair with release_connection"""
+        return self.pool.getconn()
 
-    async def insert_time_series_data(self, data: List[Dict[str, Any]], description: str) -> List[TimeSeriesData]:
-        """Insert time-series data"""
-        conn = self.get_connection()
+    def release_connection(self, conn) -> None:
+        """Return a connection to the pool"""
+        self.pool.putconn(conn)
+
+    def pool_metrics(self) -> Dict[str, Any]:
+        """Connection pool sizing and counters"""
+        return self.pool.metrics()
+
+    def cache_metrics(self) -> Dict[str, Any]:
+        """Metadata cache sizing and hit/miss/eviction counters"""
+        return self.cache.metrics()
+
+    async def _cached(self, resource: str, key: Tuple, load: Callable, *args) -> list:
+        """
+        Serve `load(*args)` from the metadata cache, running it on the DB
+        executor on a miss. The version is read before loading, so a result
+        that races a write is stored under the old version and never served.
+        """
+        version, _ = self.versions.get(resource)
+        cache_key = (resource, version, key)
+        hit, value = self.cache.get(cache_key)
+        if not hit:
+            value = await run_in_db_executor(load, *args)
+            self.cache.put(cache_key, value)
+        # A fresh list per caller, so the cached one cannot be appended to
+        return list(value)
+
+    async def insert_time_series_data(
+        self,
+        data: Union[pd.DataFrame, List[Dict[str, Any]]],
+        description: str,
+        mode: str = DEFAULT_INGEST_MODE,
+        dataset: Optional[str] = None,
+    ) -> IngestSummary:
+        """Bulk insert time-series data with COPY and index one vector per tag"""
+        return await self.insert_time_series_chunks([data], description, mode=mode, dataset=dataset)
+
+    async def insert_time_series_chunks(
+        self,
+        chunks: Iterable[Union[pd.DataFrame, List[Dict[str, Any]]]],
+        description: str,
+        mode: str = DEFAULT_INGEST_MODE,
+        dataset: Optional[str] = None,
+        on_chunk: Optional[Callable[[IngestSummary], None]] = None,
+        on_phase: Optional[Callable[[str], None]] = None,
+    ) -> IngestSummary:
+        """
+        Stream chunks into the partition of the named `dataset` (created on
+        first use, default "default") inside a single transaction. Each chunk
+        is COPYed to a staging table and merged on (tag_id, timestamp)
+        according to `mode` (see ingest.INGEST_MODES); replace_range merges once
+        all chunks are staged, since it needs each tag's full window. Rollups
+        and the tag_info catalog are then refreshed for the tag-hours touched.
+        Active rules are evaluated over the new readings as they are staged
+        (see rules.RuleTracker) and their violations written as region
+        annotations in the same transaction.
+        `description` is stored on the dataset.
+        `on_chunk` receives the running summary after each chunk and `on_phase`
+        each phase change (parse, insert, embed, index); either may raise to
+        abort, which rolls the transaction back.
+        """
+        if mode not in INGEST_MODES:
+            raise ValueError(f"mode must be one of: {', '.join(INGEST_MODES)}")
+        on_phase = on_phase or (lambda phase: None)
+        tags = TagSummary()
+        dataset = dataset or DEFAULT_DATASET
+        rules = await self.get_active_rules()
         try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Prepare data for insertion
-                values = []
-                for item in data:
-                    # Calculate normalized value (0-100 scale based on min/max range)
-                    min_range = item['minRange']
-                    max_range = item['maxRange']
-                    value = item['value']
-                    normalized_value = ((value - min_range) / (max_range - min_range)) * 100 if max_range != min_range else 50
-                    normalized_value = max(0, min(100, normalized_value))  # Clamp between 0 and 100
-                    createdAt=datetime.now()
-                    values.append((
-                        item['timestamp'],
-                        item['tagId'],
-                        item['tagLabel'],
-                        item['value'],
-                        item['unit'],
-                        item['minRange'],
-                        item['maxRange'],
-                        normalized_value,
-                        createdAt
-                    ))
-                
-                # Insert data
-                query = """
-                    INSERT INTO time_series_data (timestamp, tag_id, tag_label, tag_value, unit, min_range, max_range, normalized_value, created_at)
-                    VALUES %s
-                    RETURNING *
-                """
+            summary = await run_in_db_executor(
+                self._insert_time_series_chunks, chunks, tags, mode, dataset, description, rules, on_chunk, on_phase
+            )
+        finally:
+            # Before indexing: readers should see the committed rows right away
+            self.versions.bump(*TIME_SERIES_RESOURCES, "annotations")
+        await self._index_time_series_tags(tags, on_phase)
+        return summary
 
-                execute_values(cur, query, values, template=None, page_size=1000)
-                conn.commit()
-                
-                # Fetch all inserted records
-                cur.execute("SELECT * FROM time_series_data ORDER BY timestamp DESC LIMIT %s", 
-                           (len(values),))  # Get all recently inserted records
-                results = cur.fetchall()
+    def _insert_time_series_chunks(self, chunks, tags: TagSummary, mode: str, dataset: str, description,
+                                   rules: List[Rule], on_chunk, on_phase) -> IngestSummary:
+        started = time.perf_counter()
+        # Replacing ingests stage every chunk and write only at the end, so the
+        # partition's old rows (and, for replace, its ACCESS EXCLUSIVE TRUNCATE
+        # lock) stay out of the way of readers until just before commit
+        staged_until_end = mode in ("replace", "replace_range")
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                # Registered in its own short transaction, so the ingest holds
+                # no lock on the datasets table or the time_series_data parent
+                dataset_id = ensure_dataset(cur, dataset, description)
                 conn.commit()
-                grouped_data = defaultdict(list)
+                summary = IngestSummary(
+                    datasetId=dataset_id, dataset=dataset, rowsReceived=0, rowsInserted=0, tagCount=0,
+                    chunks=0, elapsedSeconds=0.0, rowsPerSecond=0.0, mode=mode,
+                )
+                replaced_tags = []
+                # Taken before anything is merged, and held until commit
+                lock_dataset(cur, dataset_id)
+                tracker = None
+                if rules:
+                    if mode == "replace":
+                        cur.execute(f'DELETE FROM {RULE_STATE_TABLE} WHERE dataset_id = %s', (dataset_id,))
+                    tracker = RuleTracker(rules, load_rule_states(cur, dataset_id, rules))
+                chunk_iter = iter(chunks)
+                while True:
+                    on_phase("parse")
+                    chunk = next(chunk_iter, None)
+                    if chunk is None:
+                        break
+                    frame = prepare_time_series_frame(chunk)
+                    on_phase("insert")
+                    ensure_time_partitions(cur, dataset_id, frame["timestamp"])
+                    staged = stage_time_series_frame(cur, frame, truncate=not staged_until_end)
+                    if not staged_until_end:
+                        mark_dirty_hours(cur, TIME_SERIES_STAGING_TABLE, dataset_id)
+                        summary.rowsInserted += merge_staged_time_series(cur, mode, dataset_id)
+                    tags.update(frame)
+                    if tracker:
+                        tracker.update(frame)
 
-                # Map database columns to API model fields
-                mapped_results = []
-                for row in results:
-                    mapped_row = {
-                        'id': row['id'],
-                        'timestamp': row['timestamp'],
-                        'tagId': row['tag_id'],
-                        'value': row['tag_value'],
-                        'tagLabel': row['tag_label'],
-                        'unit': row['unit'],
-                        'minRange': row['min_range'],
-                        'maxRange': row['max_range'],
-                        'normalizedValue': row['normalized_value'],
-                        'createdAt': row['created_at']
-                    }
-                    ts_data = TimeSeriesData(**mapped_row)
-                    mapped_results.append(ts_data)
-                    grouped_data[ts_data.tagId].append(ts_data)
-                
-                for tagId, group in grouped_data.items():
-                    tagLabel = group[0].tagLabel
-                    unit = group[0].unit
-                    minRange = group[0].minRange
-                    maxRange = group[0].maxRange
-
-                    # Combine all timestamps and values into one text chunk
-                    chunk_lines = [
-                        f"{row.timestamp}: {tagLabel} {row.value} {unit} (normalized: {row.normalizedValue}%)"
-                        for row in group
-                    ]
-                    description = f"{tagLabel} readings in {unit}, range: {minRange}–{maxRange}"
-                    combined_text = f"{description}\n" + "\n".join(chunk_lines)
-
-                    print("CHUNK TEXT ===>", combined_text)
-
-                    # Step 3: Embed and upsert one vector per tag group
-                    embedding = await embed_text(combined_text)
-
-                    phase2_index.upsert([
-                        {
-                            "id": f"time_series_{tagId}",
-                            "values": embedding,
-                            "metadata": {
-                                "type": "time_series",
-                                "tagId": tagId,
-                                "tagLabel": tagLabel,
-                                "unit": unit,
-                                "minRange": minRange,
-                                "maxRange": maxRange,
-                                "numPoints": len(group)
-                            }
-                        }
-                    ])
-                    # mapped_results.append(TimeSeriesData(**mapped_row))
-                # for row in mapped_results:
-                #     text = f"{row.timestamp}: {row.tagLabel}  {row.value}  {row.unit}   (normalized: {row.normalizedValue}%) {description}"
-                #     print("data text===>", text)
-                #     embedding = await embed_text(text)
-
-                #     phase2_index.upsert([
-                #         {
-                #             "id": f"time_series_{row.id}",
-                #             "values": embedding,
-                #             "metadata": {
-                #                 "type": "time_series",
-                #                 "tagId": row.tagId,
-                #                 "tagLabel": row.tagLabel,
-                #                 "unit": row.unit,
-                #                 "timestamp": str(row.timestamp),
-                #                 "value": row.value,
-                #                 "normalizedValue": row.normalizedValue
-                #             }
-                #         }
-                #     ])
-                return mapped_results
+                    summary.chunks += 1
+                    summary.rowsReceived += len(frame)
+                    if staged:
+                        chunk_start = frame["timestamp"].min().to_pydatetime()
+                        chunk_end = frame["timestamp"].max().to_pydatetime()
+                        summary.startTime = min(summary.startTime or chunk_start, chunk_start)
+                        summary.endTime = max(summary.endTime or chunk_end, chunk_end)
+                    summary.tagCount = len(tags.tags)
+                    summary.elapsedSeconds = time.perf_counter() - started
+                    summary.rowsPerSecond = summary.rowsReceived / summary.elapsedSeconds if summary.elapsedSeconds > 0 else 0.0
+                    print(f"Chunk {summary.chunks}: {staged} rows staged, {summary.rowsInserted} written ({summary.rowsPerSecond:,.0f} rows/s)")
+                    if on_chunk:
+                        on_chunk(summary.copy())
+
+                if mode == "replace":
+                    cur.execute(f'TRUNCATE {dataset_partition(dataset_id)}')
+                    replaced_tags = clear_dataset_rollups(cur, dataset_id)
+                    if summary.rowsReceived:
+                        mark_dirty_hours(cur, TIME_SERIES_STAGING_TABLE, dataset_id)
+                        summary.rowsInserted = merge_staged_time_series(cur, mode, dataset_id)
+                elif staged_until_end and summary.rowsReceived:
+                    summary.rowsDeleted = delete_staged_time_ranges(cur, dataset_id)
+                    mark_dirty_hours(cur, TIME_SERIES_STAGING_TABLE, dataset_id, whole_range=True)
+                    summary.rowsInserted = merge_staged_time_series(cur, mode, dataset_id)
+                refresh_rollups(cur)
+                refresh_tag_catalog(cur, list(set(tags.tags) | set(replaced_tags)))
+                if tracker:
+                    ranges = {tag_id: (entry["minRange"], entry["maxRange"]) for tag_id, entry in tags.tags.items()}
+                    summary.annotationsCreated = write_rule_annotations(cur, tracker.pending, ranges)
+                    save_rule_states(cur, dataset_id, tracker.states)
+            conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+        summary.elapsedSeconds = time.perf_counter() - started
+        summary.rowsPerSecond = summary.rowsReceived / summary.elapsedSeconds if summary.elapsedSeconds > 0 else 0.0
+        print(f"Ingested {summary.rowsInserted}/{summary.rowsReceived} rows into {dataset} ({mode}) in {summary.elapsedSeconds:.2f}s ({summary.rowsPerSecond:,.0f} rows/s)")
+        return summary
+
+    async def _index_time_series_tags(self, tags: TagSummary, on_phase: Callable[[str], None]) -> None:
+        """Embed and upsert one summary vector per ingested tag"""
+        texts = []
+        for entry in tags.tags.values():
+            # Combine the most recent timestamps and values into one text chunk
+            description = f"{entry['tagLabel']} readings in {entry['unit']}, range: {entry['minRange']}–{entry['maxRange']}"
+            texts.append(f"{description}\n" + "\n".join(entry["lines"]))
+
+        # Embed all tag groups concurrently, then upsert one vector per tag group
+        on_phase("embed")
+        embeddings = await embed_many(texts)
+
+        on_phase("index")
+        vectors = []
+        for (tagId, entry), embedding in zip(tags.tags.items(), embeddings):
+            tagLabel = entry["tagLabel"]
+            unit = entry["unit"]
+            minRange = entry["minRange"]
+            maxRange = entry["maxRange"]
+            vectors.append({
+                "id": f"time_series_{tagId}",
+                "values": embedding,
+                "metadata": {
+                    "type": "time_series",
+                    "tagId": tagId,
+                    "tagLabel": tagLabel,
+                    "unit": unit,
+                    "minRange": minRange,
+                    "maxRange": maxRange,
+                    "numPoints": entry["numPoints"]
+                }
+            })
+        # Waits on this ingest's batches only, not on annotation or rule
+        # vectors other requests have buffered in the shared writer
+        await phase2_writer.write_async(vectors)
     
-    async def get_time_series_data(self, tag_ids: List[str], start_time: Optional[datetime] = None, end_time: Optional[datetime] = None) -> List[TimeSeriesData]:
-        """Get time-series data with optional filtering"""
+    async def get_time_series_data(
+        self,
+        tag_ids: List[str],
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        max_points: Optional[int] = None,
+        resolution: Optional[timedelta] = None,
+        method: str = "lttb",
+        limit: Optional[int] = None,
+        dataset_id: Optional[int] = None,
+        as_models: bool = True,
+    ) -> List[Union[TimeSeriesData, Dict[str, Any]]]:
+        """
+        Get time-series data with optional filtering. With `max_points` or
+        `resolution`, each tag is downsampled with `method` (lttb or minmax).
+        `limit` keeps only the most recent rows. `dataset_id` restricts the
+        query to that dataset's partition. With `as_models=False` rows are
+        returned as trusted dicts of the TimeSeriesData fields, unvalidated.
+        """
+        return await run_in_db_executor(
+            self._get_time_series_data, tag_ids, start_time, end_time, max_points, resolution, method, limit,
+            dataset_id, as_models
+        )
+
+    def _get_time_series_data(self, tag_ids, start_time, end_time, max_points, resolution, method, limit,
+                              dataset_id, as_models=True) -> List[Union[TimeSeriesData, Dict[str, Any]]]:
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = 'SELECT * FROM time_series_data WHERE 1=1'
-                params = []
-                
-                if tag_ids:
-                    query += ' AND tag_id = ANY(%s)'
-                    params.append(tag_ids)
-                
-                if start_time:
-                    query += ' AND timestamp >= %s'
-                    params.append(start_time)
-                
-                if end_time:
-                    query += ' AND timestamp <= %s'
-                    params.append(end_time)
-                
-                query += ' ORDER BY timestamp ASC'
-                
-                cur.execute(query, params)
-                results = cur.fetchall()
-                
+                where, params = self._time_series_filter(tag_ids, start_time, end_time, dataset_id)
+
+                if max_points or resolution:
+                    results = self._fetch_downsampled_time_series(
+                        cur, tag_ids, start_time, end_time, dataset_id, max_points, resolution, method
+                    )
+                    if limit:
+                        results = results[-limit:]
+                else:
+                    cur.execute(*self._time_series_query(where, params, limit))
+                    results = cur.fetchall()
+
                 # Map database columns to API model fields
-                mapped_results = []
-                for row in results:
-                    mapped_row = {
-                        'id': row['id'],
-                        'timestamp': row['timestamp'],
-                        'tagId': row['tag_id'],
-                        'value': row['tag_value'],
-                        'tagLabel': row['tag_label'],
-                        'unit': row['unit'],
-                        'minRange': row['min_range'],
-                        'maxRange': row['max_range'],
-                        'normalizedValue': row['normalized_value'],
-                        'createdAt': row['created_at']
-                    }
-                    mapped_results.append(TimeSeriesData(**mapped_row))
-                
-                return mapped_results
+                rows = [self._map_time_series_row(row) for row in results]
+                return [TimeSeriesData(**row) for row in rows] if as_models else rows
         finally:
-            conn.close()
-    
-    async def get_available_tags(self) -> List[TagInfo]:
-        """Get all available tags"""
+            self.release_connection(conn)
+
+    async def get_time_series_columns(
+        self,
+        tag_ids: List[str],
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        max_points: Optional[int] = None,
+        resolution: Optional[timedelta] = None,
+        method: str = "lttb",
+        limit: Optional[int] = None,
+        dataset_id: Optional[int] = None,
+    ) -> Tuple[pd.DataFrame, Dict[str, Dict[str, Any]]]:
+        """
+        The readings get_time_series_data would return as a frame of tag_id,
+        timestamp_ms and value, plus each tag's catalog metadata, for the
+        columnar and Arrow response formats
+        """
+        return await run_in_db_executor(
+            self._get_time_series_columns, tag_ids, start_time, end_time, max_points, resolution, method, limit, dataset_id
+        )
+
+    def _get_time_series_columns(self, tag_ids, start_time, end_time, max_points, resolution, method, limit, dataset_id):
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = """
-                    SELECT DISTINCT ON (tag_id)
-                        tag_id, 
-                        tag_label, 
-                        unit, 
-                        min_range, 
-                        max_range,
-                        '#' || LPAD(CAST((ABS(HASHTEXT(tag_id)) % 16777216) AS TEXT), 6, '0') as color
+                where, params = self._time_series_filter(tag_ids, start_time, end_time, dataset_id)
+                if max_points or resolution:
+                    rows = self._fetch_downsampled_time_series(
+                        cur, tag_ids, start_time, end_time, dataset_id, max_points, resolution, method
+                    )
+                    if limit:
+                        rows = rows[-limit:]
+                    frame = pd.DataFrame({
+                        "tag_id": pd.Series([row['tag_id'] for row in rows], dtype=object),
+                        "timestamp_ms": np.fromiter((round(row['epoch'] * 1000) for row in rows), dtype=np.int64, count=len(rows)),
+                        "value": np.fromiter((row['tag_value'] for row in rows), dtype=np.float64, count=len(rows)),
+                    })
+                else:
+                    frame = read_time_series_frame(cur, *self._time_series_query(where, params, limit))
+
+                cur.execute(
+                    f'SELECT "tagId", "tagLabel", unit, "minRange", "maxRange", color FROM {TAG_CATALOG_TABLE} '
+                    'WHERE "tagId" = ANY(%s)',
+                    (frame["tag_id"].unique().tolist(),),
+                )
+                return frame, {row['tagId']: dict(row) for row in cur.fetchall()}
+        finally:
+            self.release_connection(conn)
+
+    async def stream_time_series_data(
+        self,
+        tag_ids: List[str],
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        dataset_id: Optional[int] = None,
+        batch_size: int = STREAM_BATCH_ROWS,
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield the rows get_time_series_data would return, as API dicts in
+        batches of `batch_size`. Rows are read through a server-side cursor, so
+        memory use and time to the first batch do not grow with the range. One
+        pooled connection is held until the iterator is exhausted or closed;
+        at most STREAM_MAX_CONCURRENT streams hold one at a time, and further
+        streams wait for a slot.
+        """
+        where, params = self._time_series_filter(tag_ids, start_time, end_time, dataset_id)
+        if self._stream_slots is None:
+            self._stream_slots = asyncio.Semaphore(STREAM_MAX_CONCURRENT)
+        async with self._stream_slots:
+            conn = await run_in_db_executor(self.get_connection)
+            try:
+                # A named cursor is a server-side cursor; DECLARE runs on execute
+                # and each fetchmany is one FETCH round trip
+                cur = conn.cursor(name="time_series_stream", cursor_factory=RealDictCursor)
+                cur.itersize = batch_size
+                await run_in_db_executor(cur.execute, *self._time_series_query(where, params, limit))
+                while True:
+                    rows = await run_in_db_executor(cur.fetchmany, batch_size)
+                    if not rows:
+                        break
+                    yield [self._map_time_series_row(row) for row in rows]
+            finally:
+                # Returning the connection rolls back, which closes the cursor
+                await run_in_db_executor(self.release_connection, conn)
+
+    @staticmethod
+    def _time_series_query(where: str, params: list, limit: Optional[int]):
+        """Raw time-series SELECT in timestamp order; with `limit`, only the most recent rows"""
+        if limit:
+            return (
+                f'SELECT * FROM (SELECT * FROM time_series_data WHERE {where} '
+                'ORDER BY timestamp DESC LIMIT %s) latest ORDER BY timestamp ASC',
+                params + [limit],
+            )
+        return f'SELECT * FROM time_series_data WHERE {where} ORDER BY timestamp ASC', params
+
+    @staticmethod
+    def _time_series_filter(tag_ids: List[str], start_time: Optional[datetime], end_time: Optional[datetime],
+                            dataset_id: Optional[int] = None):
+        """
+        WHERE clause and parameters for the dataset, tag and time range filters.
+        The dataset id is bound client-side, so the planner prunes the other
+        datasets' partitions.
+        """
+        where = '1=1'
+        params = []
+
+        if dataset_id is not None:
+            where += ' AND dataset_id = %s'
+            params.append(dataset_id)
+        
+        if tag_ids:
+            where += ' AND tag_id = ANY(%s)'
+            params.append(tag_ids)
+        
+        if start_time:
+            where += ' AND timestamp >= %s'
+            params.append(start_time)
+        
+        if end_time:
+            where += ' AND timestamp <= %s'
+            params.append(end_time)
+
+        return where, params
+
+    @staticmethod
+    def _map_time_series_row(row) -> Dict[str, Any]:
+        return {
+            'id': row['id'],
+            'timestamp': row['timestamp'],
+            'tagId': row['tag_id'],
+            'value': row['tag_value'],
+            'tagLabel': row['tag_label'],
+            'unit': row['unit'],
+            'minRange': row['min_range'],
+            'maxRange': row['max_range'],
+            'normalizedValue': row['normalized_value'],
+            'createdAt': row['created_at'],
+            'datasetId': row['dataset_id'],
+        }
+
+    def _fetch_downsampled_time_series(self, cur, tag_ids, start_time, end_time, dataset_id,
+                                       max_points: Optional[int], resolution: Optional[timedelta],
+                                       method: str) -> List[Dict[str, Any]]:
+        """
+        Min/max bucketing pushed down to SQL: per tag and time bucket only the
+        rows holding the bucket's minimum and maximum value are fetched. For
+        LTTB the buckets are finer and the result is reduced again in NumPy.
+        Buckets of a minute or more are aligned to the rollups, which then
+        locate each bucket's extremes instead of a scan of the raw rows.
+        """
+        where, params = self._time_series_filter(tag_ids, start_time, end_time, dataset_id)
+        cur.execute(
+            f'SELECT extract(epoch FROM min(timestamp))::float8 AS lo, '
+            f'extract(epoch FROM max(timestamp))::float8 AS hi FROM time_series_data WHERE {where}',
+            params,
+        )
+        bounds = cur.fetchone()
+        if bounds['lo'] is None:
+            return []
+        lo = bounds['lo']
+        hi = max(bounds['hi'], lo + 1)
+        span = timedelta(seconds=hi - lo)
+
+        if method == "minmax":
+            buckets = bucket_count(span, max_points, resolution, points_per_bucket=2)
+            width = max(span / buckets, resolution or timedelta(0))
+            if max_points:
+                # Aligned buckets can straddle both ends of the span
+                width = max(width, span / max(max_points // 2 - 1, 1))
+        else:
+            threshold = bucket_count(span, max_points, resolution, points_per_bucket=1)
+            buckets = max(threshold * LTTB_PREAGGREGATE_FACTOR // 2, 1)
+            width = span / buckets
+
+        width = rollup_bucket_width(width)
+        rollups, raw = plan_rollup_segments(start_time, end_time, width) if width else ([], [])
+        if rollups:
+            ids = self._rollup_extreme_ids(cur, tag_ids, dataset_id, width, rollups, raw)
+        else:
+            # Hash-aggregate each (tag, bucket) to the ids of its min and max rows,
+            # earliest first on ties, without sorting the raw rows
+            cur.execute(
+                f"""
+                    SELECT
+                        (min(ARRAY[tag_value, extract(epoch FROM timestamp)::float8, id]))[3]::bigint AS min_id,
+                        (max(ARRAY[tag_value, -extract(epoch FROM timestamp)::float8, id]))[3]::bigint AS max_id
                     FROM time_series_data
-                    ORDER BY tag_id, timestamp DESC
-                """
-                cur.execute(query)
-                results = cur.fetchall()
-                
-                # Map database columns to API model fields
-                mapped_results = []
-                for row in results:
-                    mapped_row = {
+                    WHERE {where}
+                    GROUP BY tag_id, least(width_bucket(extract(epoch FROM timestamp)::float8, %s, %s, %s), %s)
+                """,
+                params + [lo, hi, buckets, buckets],
+            )
+            ids = list({row_id for row in cur.fetchall() for row_id in (row['min_id'], row['max_id'])})
+        cur.execute(
+            'SELECT *, extract(epoch FROM timestamp)::float8 AS epoch FROM time_series_data '
+            'WHERE id = ANY(%s) ORDER BY tag_id, timestamp ASC',
+            (ids,),
+        )
+        results = cur.fetchall()
+
+        if method == "lttb":
+            selected = []
+            by_tag = defaultdict(list)
+            for row in results:
+                by_tag[row['tag_id']].append(row)
+            for rows in by_tag.values():
+                epochs = np.fromiter((row['epoch'] for row in rows), dtype=np.float64, count=len(rows))
+                values = np.fromiter((row['tag_value'] for row in rows), dtype=np.float64, count=len(rows))
+                selected.extend(rows[i] for i in lttb_indices(epochs, values, threshold))
+            results = selected
+
+        return sorted(results, key=lambda row: row['timestamp'])
+    
+    async def get_time_series_aggregates(
+        self,
+        tag_ids: List[str],
+        bucket: timedelta,
+        functions: List[str],
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        dataset_id: Optional[int] = None,
+        as_models: bool = True,
+    ) -> List[Union[TimeSeriesAggregate, Dict[str, Any]]]:
+        """
+        Per tag and time bucket aggregates computed in Postgres with date_bin,
+        so only one row per bucket is transferred. Without `dataset_id`,
+        buckets combine every dataset's readings of a tag. `as_models=False`
+        returns trusted dicts.
+        """
+        return await run_in_db_executor(
+            self._get_time_series_aggregates, tag_ids, bucket, functions, start_time, end_time, dataset_id, as_models
+        )
+
+    def _get_time_series_aggregates(self, tag_ids, bucket, functions, start_time, end_time,
+                                    dataset_id, as_models=True) -> List[Union[TimeSeriesAggregate, Dict[str, Any]]]:
+        conn = self.get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                rollups, raw = plan_rollup_segments(start_time, end_time, bucket) if supports_rollup(functions) else ([], [])
+                if rollups:
+                    self._query_rollup_aggregates(cur, tag_ids, bucket, functions, rollups, raw, dataset_id)
+                else:
+                    where, params = self._time_series_filter(tag_ids, start_time, end_time, dataset_id)
+                    select, select_params = aggregate_select(functions)
+                    cur.execute(
+                        f"""
+                            SELECT tag_id, date_bin(%s, timestamp, %s::timestamp) AS bucket,
+                                   count(*) AS count, {select}
+                            FROM time_series_data
+                            WHERE {where}
+                            GROUP BY tag_id, bucket
+                            ORDER BY tag_id, bucket
+                        """,
+                        [bucket, BUCKET_ORIGIN] + select_params + params,
+                    )
+                rows = [
+                    {
                         'tagId': row['tag_id'],
-                        'tagLabel': row['tag_label'],
-                        'unit': row['unit'],
-                        'minRange': row['min_range'],
-                        'maxRange': row['max_range'],
-                        'color': row['color']
+                        'bucket': row['bucket'],
+                        'count': row['count'],
+                        'values': {name: row[f'agg_{index}'] for index, name in enumerate(functions)},
                     }
-                    mapped_results.append(TagInfo(**mapped_row))
-                
-                return mapped_results
+                    for row in cur.fetchall()
+                ]
+                return [TimeSeriesAggregate(**row) for row in rows] if as_models else rows
         finally:
-            conn.close()
-    
+            self.release_connection(conn)
+
+    def _rollup_segment_filters(self, tag_ids, dataset_id, rollups, raw):
+        """
+        WHERE clauses and parameters selecting the rows of each rollup segment,
+        as (name, where, params), and of each raw remainder, as (where, params)
+        """
+        tag_where, tag_params = self._time_series_filter(tag_ids, None, None, dataset_id)
+        rollup_filters, raw_filters = [], []
+        for name, lo, hi in rollups:
+            where, where_params = tag_where, list(tag_params)
+            if lo is not None:
+                where += ' AND bucket >= %s'
+                where_params.append(lo)
+            if hi is not None:
+                where += ' AND bucket < %s'
+                where_params.append(hi)
+            rollup_filters.append((name, where, where_params))
+        for lo, hi, hi_inclusive in raw:
+            where, where_params = tag_where, list(tag_params)
+            if lo is not None:
+                where += ' AND timestamp >= %s'
+                where_params.append(lo)
+            if hi is not None:
+                where += ' AND timestamp <= %s' if hi_inclusive else ' AND timestamp < %s'
+                where_params.append(hi)
+            raw_filters.append((where, where_params))
+        return rollup_filters, raw_filters
+
+    def _rollup_extreme_ids(self, cur, tag_ids, dataset_id, bucket, rollups, raw) -> List[int]:
+        """
+        Ids of the rows holding each tag and bucket's minimum and maximum value,
+        earliest first on ties. The rollups narrow each extreme down to one
+        rollup bucket, and only that bucket's raw rows are searched for it.
+        """
+        rollup_filters, raw_filters = self._rollup_segment_filters(tag_ids, dataset_id, rollups, raw)
+        parts, params = [], []
+        for name, where, where_params in rollup_filters:
+            parts.append(
+                f'SELECT tag_id, dataset_id, date_bin(%s, bucket, %s::timestamp) AS bucket, bucket AS lo, '
+                f'bucket + %s AS hi, value_min, value_max FROM {ROLLUP_TABLES[name]} WHERE {where}'
+            )
+            params += [bucket, BUCKET_ORIGIN, ROLLUP_RESOLUTIONS[name]] + where_params
+        for where, where_params in raw_filters:
+            parts.append(
+                'SELECT tag_id, dataset_id, date_bin(%s, timestamp, %s::timestamp) AS bucket, timestamp AS lo, '
+                "timestamp + interval '1 microsecond' AS hi, tag_value, tag_value "
+                f'FROM time_series_data WHERE {where}'
+            )
+            params += [bucket, BUCKET_ORIGIN] + where_params
+
+        union = " UNION ALL ".join(parts)
+        cur.execute(
+            f"""
+                WITH segments AS ({union}),
+                extremes AS (
+                    (SELECT DISTINCT ON (tag_id, bucket) tag_id, dataset_id, lo, hi, value_min AS value
+                     FROM segments ORDER BY tag_id, bucket, value_min, lo)
+                    UNION ALL
+                    (SELECT DISTINCT ON (tag_id, bucket) tag_id, dataset_id, lo, hi, value_max AS value
+                     FROM segments ORDER BY tag_id, bucket, value_max DESC, lo)
+                )
+                SELECT DISTINCT t.id
+                FROM extremes e
+                CROSS JOIN LATERAL (
+                    SELECT id FROM time_series_data
+                    WHERE dataset_id = e.dataset_id AND tag_id = e.tag_id
+                      AND timestamp >= e.lo AND timestamp < e.hi AND tag_value = e.value
+                    ORDER BY timestamp, id
+                    LIMIT 1
+                ) t
+            """,
+            params,
+        )
+        return [row['id'] for row in cur.fetchall()]
+
+    def _query_rollup_aggregates(self, cur, tag_ids, bucket, functions, rollups, raw, dataset_id) -> None:
+        """
+        Merge rollup segments and the raw remainders at the range edges into
+        one aggregate per tag and bucket
+        """
+        rollup_filters, raw_filters = self._rollup_segment_filters(tag_ids, dataset_id, rollups, raw)
+        parts, params = [], []
+        for name, where, where_params in rollup_filters:
+            parts.append(
+                f'SELECT tag_id, date_bin(%s, bucket, %s::timestamp) AS bucket, value_count, value_min, '
+                f'value_max, value_sum, value_sumsq FROM {ROLLUP_TABLES[name]} WHERE {where}'
+            )
+            params += [bucket, BUCKET_ORIGIN] + where_params
+        for where, where_params in raw_filters:
+            parts.append(
+                'SELECT tag_id, date_bin(%s, timestamp, %s::timestamp) AS bucket, count(*) AS value_count, '
+                'min(tag_value) AS value_min, max(tag_value) AS value_max, sum(tag_value) AS value_sum, '
+                f'sum(tag_value * tag_value) AS value_sumsq FROM time_series_data WHERE {where} GROUP BY 1, 2'
+            )
+            params += [bucket, BUCKET_ORIGIN] + where_params
+
+        select, _ = aggregate_select(functions, rollup=True)
+        union = " UNION ALL ".join(parts)
+        cur.execute(
+            f"""
+                SELECT tag_id, bucket, sum(value_count)::bigint AS count, {select}
+                FROM ({union}) segments
+                GROUP BY tag_id, bucket
+                ORDER BY tag_id, bucket
+            """,
+            params,
+        )
+
+    async def migrate_schema(self) -> None:
+        """Apply time_series_data indexes and partitioning to an existing database"""
+        await run_in_db_executor(self._migrate_schema)
+
+    def _migrate_schema(self) -> None:
+        conn = self.get_connection()
+        try:
+            migrate(conn)
+        finally:
+            self.release_connection(conn)
+
+    @bumps(*TIME_SERIES_RESOURCES)
+    async def rebuild_derived_tables(self, only_if_empty: bool = False) -> List[str]:
+        """
+        Recompute the rollup tables and the tag catalog from time_series_data.
+        With `only_if_empty`, each is rebuilt only when data exists but the
+        table is empty (e.g. after upgrading). Returns what was rebuilt.
+        """
+        return await run_in_db_executor(self._rebuild_derived_tables, only_if_empty)
+
+    def _rebuild_derived_tables(self, only_if_empty: bool) -> List[str]:
+        rebuilt = []
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                for name, table, rebuild in [
+                    ("rollups", ROLLUP_TABLES["1m"], rebuild_rollups),
+                    ("tag catalog", TAG_CATALOG_TABLE, rebuild_tag_catalog),
+                ]:
+                    if only_if_empty:
+                        cur.execute(
+                            f'SELECT EXISTS (SELECT 1 FROM time_series_data) AND NOT EXISTS (SELECT 1 FROM {table})'
+                        )
+                        if not cur.fetchone()[0]:
+                            continue
+                    started = time.perf_counter()
+                    rebuild(cur)
+                    print(f"Rebuilt {name} in {time.perf_counter() - started:.2f}s")
+                    rebuilt.append(name)
+            conn.commit()
+            return rebuilt
+        finally:
+            self.release_connection(conn)
+
+    async def get_available_tags(self, as_models: bool = True) -> List[Union[TagInfo, Dict[str, Any]]]:
+        """
+        Get all available tags from the tag_info catalog maintained at ingest;
+        its columns are named like the TagInfo fields, so `as_models=False`
+        returns the rows as they come from the cursor
+        """
+        return await self._cached("tags", (as_models,), self._get_available_tags, as_models)
+
+    def _get_available_tags(self, as_models: bool = True) -> List[Union[TagInfo, Dict[str, Any]]]:
+        conn = self.get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(f'SELECT {TAG_CATALOG_COLUMNS} FROM {TAG_CATALOG_TABLE} ORDER BY "tagId"')
+                rows = cur.fetchall()
+                return [TagInfo(**row) for row in rows] if as_models else rows
+        finally:
+            self.release_connection(conn)
+
+    @bumps(*TIME_SERIES_RESOURCES)
     async def clear_time_series_data(self) -> None:
         """Clear all time-series data"""
+        return await run_in_db_executor(self._clear_time_series_data)
+
+    def _clear_time_series_data(self) -> None:
         conn = self.get_connection()
         try:
             with conn.cursor() as cur:
-                cur.execute('DELETE FROM time_series_data')
+                cur.execute(f'TRUNCATE time_series_data, {RULE_STATE_TABLE}')
+                clear_rollups(cur)
+                clear_tag_catalog(cur)
                 conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    async def get_datasets(self) -> List[Dataset]:
+        """Get all datasets with their tag and point counts"""
+        return await run_in_db_executor(self._get_datasets)
+
+    def _get_datasets(self) -> List[Dataset]:
+        conn = self.get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                # Counts come from the daily rollups rather than the partitions
+                cur.execute(f"""
+                    SELECT d.id, d.name, d.description, d.created_at AS "createdAt",
+                           coalesce(s.tag_count, 0) AS "tagCount", coalesce(s.num_points, 0) AS "numPoints"
+                    FROM {DATASET_TABLE} d
+                    LEFT JOIN (
+                        SELECT dataset_id, count(DISTINCT tag_id) AS tag_count, sum(value_count) AS num_points
+                        FROM {ROLLUP_TABLES["1d"]}
+                        GROUP BY dataset_id
+                    ) s ON s.dataset_id = d.id
+                    ORDER BY d.name
+                """)
+                return [Dataset(**row) for row in cur.fetchall()]
+        finally:
+            self.release_connection(conn)
+
+    @bumps(*TIME_SERIES_RESOURCES)
+    async def delete_dataset(self, dataset_id: int) -> bool:
+        """
+        Delete a dataset by detaching and dropping its partition, then refresh
+        the rollups and catalog entries of its tags. Returns False if no such
+        dataset exists.
+        """
+        return await run_in_db_executor(self._delete_dataset, dataset_id)
+
+    def _delete_dataset(self, dataset_id: int) -> bool:
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f'SELECT name FROM {DATASET_TABLE} WHERE id = %s FOR UPDATE', (dataset_id,))
+                row = cur.fetchone()
+                if row is None:
+                    conn.rollback()
+                    return False
+                tag_ids = clear_dataset_rollups(cur, dataset_id)
+                drop_dataset_partition(cur, dataset_id)
+                cur.execute(f'DELETE FROM {DATASET_TABLE} WHERE id = %s', (dataset_id,))
+                cur.execute(f'DELETE FROM {RULE_STATE_TABLE} WHERE dataset_id = %s', (dataset_id,))
+                refresh_tag_catalog(cur, tag_ids)
+            conn.commit()
+            print(f"Dropped dataset {row[0]} ({len(tag_ids)} tags)")
+            return True
+        finally:
+            self.release_connection(conn)
     
+    @bumps("annotations")
     async def create_annotation(self, annotation_data: Dict[str, Any]) -> Annotation:
         """Create a new annotation"""
+        try:
+            mapped_result = await run_in_db_executor(self._create_annotation, annotation_data)
+            print(f"Annotation created: {mapped_result}")
+            text = f"Annotation on {annotation_data['tagId']} at {annotation_data['timestamp']}: {annotation_data['description']} (Category: {annotation_data['category']}, Severity: {annotation_data['severity']})"
+            embedding = await embed_text(text)
+
+            phase2_writer.add([
+                {
+                    "id": f"annotation_{mapped_result['id']}",
+                    "values": embedding,
+                    "metadata": {
+                        "type": "annotation",
+                        "tagId": annotation_data['tagId'],
+                        "timestamp": str(annotation_data['timestamp']),
+                        "description": annotation_data['description'],
+                        "category": annotation_data['category'],
+                        "severity": annotation_data['severity']
+                    }
+                }
+            ])
+            return Annotation(**dict(mapped_result))
+        except Exception as e:
+            print(f"Error creating annotation: {e}")
+            print(f"Annotation data: {annotation_data}")
+            raise ValueError(f"Failed to create annotation: {str(e)}")
+
+    def _create_annotation(self, annotation_data: Dict[str, Any]) -> Dict[str, Any]:
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -268,7 +893,7 @@ class DatabaseStorage:
                 conn.commit()
                 
                 if result:
-                    mapped_result = {
+                    return {
                         'id': result['id'],
                         'timestamp': result['timestamp'],
                         'tagId': result['tagid'],
@@ -282,35 +907,18 @@ class DatabaseStorage:
                         'regionEnd': result['region_end'],
                         'createdAt': result['created_at'],
                     }
-                    print(f"Annotation created: {mapped_result}")
-                    text = f"Annotation on {annotation_data['tagId']} at {annotation_data['timestamp']}: {annotation_data['description']} (Category: {annotation_data['category']}, Severity: {annotation_data['severity']})"
-                    embedding = await embed_text(text)
-
-                    phase2_index.upsert([
-                        {
-                            "id": f"annotation_{result['id']}",
-                            "values": embedding,
-                            "metadata": {
-                                "type": "annotation",
-                                "tagId": annotation_data['tagId'],
-                                "timestamp": str(annotation_data['timestamp']),
-                                "description": annotation_data['description'],
-                                "category": annotation_data['category'],
-                                "severity": annotation_data['severity']
-                            }
-                        }
-                    ])
-                    return Annotation(**dict(mapped_result))
                 raise ValueError("Failed to create annotation")
-        except Exception as e:
-            print(f"Error creating annotation: {e}")
-            print(f"Annotation data: {annotation_data}")
-            raise ValueError(f"Failed to create annotation: {str(e)}")
         finally:
-            conn.close()
+            self.release_connection(conn)
     
-    async def get_annotations(self, tag_ids: Optional[List[str]] = None) -> List[Annotation]:
-        """Get annotations with optional tag filtering"""
+    async def get_annotations(self, tag_ids: Optional[List[str]] = None,
+                              as_models: bool = True) -> List[Union[Annotation, Dict[str, Any]]]:
+        """Get annotations with optional tag filtering; `as_models=False` returns trusted dicts"""
+        key = (tuple(tag_ids) if tag_ids else None, as_models)
+        return await self._cached("annotations", key, self._get_annotations, tag_ids, as_models)
+
+    def _get_annotations(self, tag_ids: Optional[List[str]] = None,
+                         as_models: bool = True) -> List[Union[Annotation, Dict[str, Any]]]:
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -341,23 +949,54 @@ class DatabaseStorage:
                         'regionEnd': row['region_end'],
                         'createdAt': row['created_at'],
                     }
-                    mapped_results.append(Annotation(**dict(mapped_result)))
+                    mapped_results.append(Annotation(**dict(mapped_result)) if as_models else mapped_result)
                 return mapped_results
         finally:
-            conn.close()
+            self.release_connection(conn)
     
+    @bumps("annotations")
     async def delete_annotation(self, annotation_id: int) -> None:
         """Delete an annotation"""
+        return await run_in_db_executor(self._delete_annotation, annotation_id)
+
+    def _delete_annotation(self, annotation_id: int) -> None:
         conn = self.get_connection()
         try:
             with conn.cursor() as cur:
                 cur.execute('DELETE FROM annotations WHERE id = %s', (annotation_id,))
                 conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
     
+    @bumps("rules")
     async def create_rule(self, rule_data: Dict[str, Any]) -> Rule:
         """Create a new rule"""
+        try:
+            mapped_result = await run_in_db_executor(self._create_rule, rule_data)
+            text = f"Rule for {rule_data['tagId']}: {rule_data['description']} (Condition: {rule_data['condition']}, Threshold: {rule_data['threshold']}, Severity: {rule_data['severity']})"
+            embedding = await embed_text(text)
+
+            phase2_writer.add([
+                {
+                    "id": f"rule_{mapped_result['id']}",
+                    "values": embedding,
+                    "metadata": {
+                        "type": "rule",
+                        "tagId": rule_data['tagId'],
+                        "description": rule_data['description'],
+                        "condition": rule_data['condition'],
+                        "threshold": rule_data['threshold'],
+                        "severity": rule_data['severity']
+                    }
+                }
+            ])
+            return Rule(**mapped_result)
+        except Exception as e:
+            print(f"Error creating rule: {e}")
+            
+            raise ValueError(f"Failed to create rule: {str(e)}")
+
+    def _create_rule(self, rule_data: Dict[str, Any]) -> Dict[str, Any]:
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -365,8 +1004,10 @@ class DatabaseStorage:
                 rule_data["createdAt"] = createdAt
                 query = """
                     INSERT INTO rules 
-                    (tag_id, condition, threshold, threshold_max, severity,  description, is_active, created_at)
-                    VALUES (%(tagId)s, %(condition)s, %(threshold)s, %(thresholdMax)s, %(severity)s,  %(description)s,  %(isActive)s, %(createdAt)s)
+                    (tag_id, condition, threshold, threshold_max, severity,  description, is_active,
+                     min_points, min_duration_seconds, created_at)
+                    VALUES (%(tagId)s, %(condition)s, %(threshold)s, %(thresholdMax)s, %(severity)s,  %(description)s,  %(isActive)s,
+                            %(minPoints)s, %(minDurationSeconds)s, %(createdAt)s)
                     RETURNING *
                 """
                 print(f"Rule data: {rule_data}")
@@ -376,7 +1017,7 @@ class DatabaseStorage:
                 
                 if result:
                     # Map database snake_case to API camelCase
-                    mapped_result = {
+                    return {
                         'id': result['id'],
                         'tagId': result['tag_id'],
                         'condition': result['condition'],
@@ -385,36 +1026,19 @@ class DatabaseStorage:
                         'severity': result['severity'],
                         'description': result['description'],
                         'isActive': result['is_active'],
+                        'minPoints': result['min_points'],
+                        'minDurationSeconds': result['min_duration_seconds'],
                         'createdAt': result['created_at']
                     }
-                    text = f"Rule for {rule_data['tagId']}: {rule_data['description']} (Condition: {rule_data['condition']}, Threshold: {rule_data['threshold']}, Severity: {rule_data['severity']})"
-                    embedding = await embed_text(text)
-
-                    phase2_index.upsert([
-                        {
-                            "id": f"rule_{result['id']}",
-                            "values": embedding,
-                            "metadata": {
-                                "type": "rule",
-                                "tagId": rule_data['tagId'],
-                                "description": rule_data['description'],
-                                "condition": rule_data['condition'],
-                                "threshold": rule_data['threshold'],
-                                "severity": rule_data['severity']
-                            }
-                        }
-                    ])
-                    return Rule(**mapped_result)
                 raise ValueError("Failed to create rule")
-        except Exception as e:
-            print(f"Error creating rule: {e}")
-            
-            raise ValueError(f"Failed to create rule: {str(e)}")
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     async def get_rules(self) -> List[Rule]:
         """Get all rules"""
+        return await self._cached("rules", ("all",), self._get_rules)
+
+    def _get_rules(self) -> List[Rule]:
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -432,17 +1056,24 @@ class DatabaseStorage:
                         'threshold': rule_data['threshold'],
                         'thresholdMax': rule_data['threshold_max'],
                         'severity': rule_data['severity'],
+                        'description': rule_data['description'],
                         'isActive': rule_data['is_active'],
+                        'minPoints': rule_data['min_points'],
+                        'minDurationSeconds': rule_data['min_duration_seconds'],
                         'createdAt': rule_data['created_at']
                     }
                     formatted_results.append(Rule(**formatted_rule))
                 
                 return formatted_results
         finally:
-            conn.close()
+            self.release_connection(conn)
     
+    @bumps("rules")
     async def update_rule(self, rule_id: int, updates: Dict[str, Any]) -> Rule:
         """Update a rule"""
+        return await run_in_db_executor(self._update_rule, rule_id, updates)
+
+    def _update_rule(self, rule_id: int, updates: Dict[str, Any]) -> Rule:
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -463,6 +1094,8 @@ class DatabaseStorage:
                 
                 cur.execute(query, params)
                 result = cur.fetchone()
+                # Evaluation restarts from the next ingest under the new condition
+                cur.execute(f'DELETE FROM {RULE_STATE_TABLE} WHERE rule_id = %s', (rule_id,))
                 conn.commit()
                 
                 if not result:
@@ -470,20 +1103,28 @@ class DatabaseStorage:
                 
                 return Rule(**dict(result))
         finally:
-            conn.close()
+            self.release_connection(conn)
     
+    @bumps("rules")
     async def delete_rule(self, rule_id: int) -> None:
         """Delete a rule"""
+        return await run_in_db_executor(self._delete_rule, rule_id)
+
+    def _delete_rule(self, rule_id: int) -> None:
         conn = self.get_connection()
         try:
             with conn.cursor() as cur:
                 cur.execute('DELETE FROM rules WHERE id = %s', (rule_id,))
+                cur.execute(f'DELETE FROM {RULE_STATE_TABLE} WHERE rule_id = %s', (rule_id,))
                 conn.commit()
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     async def get_active_rules(self) -> List[Rule]:
         """Get all active rules"""
+        return await self._cached("rules", ("active",), self._get_active_rules)
+
+    def _get_active_rules(self) -> List[Rule]:
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -501,17 +1142,59 @@ class DatabaseStorage:
                         'threshold': rule_data['threshold'],
                         'thresholdMax': rule_data['threshold_max'],
                         'severity': rule_data['severity'],
+                        'description': rule_data['description'],
                         'isActive': rule_data['is_active'],
+                        'minPoints': rule_data['min_points'],
+                        'minDurationSeconds': rule_data['min_duration_seconds'],
                         'createdAt': rule_data['created_at']
                     }
                     formatted_results.append(Rule(**formatted_rule))
                 
                 return formatted_results
         finally:
-            conn.close()
+            self.release_connection(conn)
     
+    async def evaluate_rules(
+        self,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        tag_ids: Optional[List[str]] = None,
+        dataset_id: Optional[int] = None,
+        as_models: bool = True,
+    ) -> List[Union[RuleViolation, Dict[str, Any]]]:
+        """
+        Evaluate the active rules over the readings in the time range and
+        return their violation regions (see rules.rule_violations). `tag_ids`
+        restricts evaluation to the rules on those tags.
+        """
+        rules = await self.get_active_rules()
+        if tag_ids:
+            rules = [rule for rule in rules if rule.tagId in tag_ids]
+        if not rules:
+            return []
+        regions = await run_in_db_executor(self._evaluate_rules, rules, start_time, end_time, dataset_id)
+        return [RuleViolation(**region) for region in regions] if as_models else regions
+
+    def _evaluate_rules(self, rules: List[Rule], start_time, end_time, dataset_id) -> List[Dict[str, Any]]:
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                where, params = self._time_series_filter(
+                    sorted({rule.tagId for rule in rules}), start_time, end_time, dataset_id
+                )
+                # Unordered: sorting in NumPy is cheaper than in Postgres here
+                frame = read_time_series_frame(cur, f'SELECT * FROM time_series_data WHERE {where}', params)
+        finally:
+            self.release_connection(conn)
+        # The connection goes back to the pool before the CPU-bound part
+        return rule_violations(rules, frame)
+
+    @bumps("saved_graphs")
     async def save_graph(self, graph_data: Dict[str, Any]) -> SavedGraph:
         """Save a graph configuration"""
+        return await run_in_db_executor(self._save_graph, graph_data)
+
+    def _save_graph(self, graph_data: Dict[str, Any]) -> SavedGraph:
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -555,10 +1238,13 @@ class DatabaseStorage:
             print(f"Graph data: {graph_data}")
             raise ValueError(f"Failed to save graph: {str(e)}")
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     async def get_saved_graphs(self) -> List[SavedGraph]:
         """Get all saved graphs"""
+        return await self._cached("saved_graphs", ("all",), self._get_saved_graphs)
+
+    def _get_saved_graphs(self) -> List[SavedGraph]:
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -582,10 +1268,13 @@ class DatabaseStorage:
                 
                 return formatted_results
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     async def get_saved_graph(self, graph_id: int) -> Optional[SavedGraph]:
         """Get a specific saved graph"""
+        return await run_in_db_executor(self._get_saved_graph, graph_id)
+
+    def _get_saved_graph(self, graph_id: int) -> Optional[SavedGraph]:
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -606,14 +1295,18 @@ class DatabaseStorage:
                     return SavedGraph(**mapped_result)
                 return None
         finally:
-            conn.close()
+            self.release_connection(conn)
     
+    @bumps("saved_graphs")
     async def delete_saved_graph(self, graph_id: int) -> None:
         """Delete a saved graph"""
+        return await run_in_db_executor(self._delete_saved_graph, graph_id)
+
+    def _delete_saved_graph(self, graph_id: int) -> None:
         conn = self.get_connection()
         try:
             with conn.cursor() as cur:
                 cur.execute('DELETE FROM saved_graphs WHERE id = %s', (graph_id,))
                 conn.commit()
         finally:
-            conn.close()
\ No newline at end of file
+            self.release_connection(conn)
\ No newline at end of file
@@ -0,0 +1,52 @@
+# app/streaming.py
+import os
+from typing import Any, AsyncIterator, Dict, List
+from responses import dumps
+from database import DB_POOL_MAX_SIZE
+
+# Response formats of /api/timeseries: json builds the whole list before
+# responding; ndjson (one object per line) and json-stream (a JSON array) are
+# written batch by batch as rows arrive from a server-side cursor; columnar
+# (JSON) and arrow (IPC stream) hold per-tag arrays of timestamps and values
+TIME_SERIES_FORMATS = ("json", "ndjson", "json-stream", "columnar", "arrow")
+STREAMING_FORMATS = {"ndjson": "application/x-ndjson", "json-stream": "application/json"}
+
+# Rows fetched from the server-side cursor per round trip, and so the most
+# rows held in memory at once by a streamed response
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "5000"))
+
+# Streams open at once. A stream holds a pooled connection between fetches,
+# for as long as its client takes to read, without holding an executor
+# worker. Capped below the pool size so the other requests, which hold a
+# worker while they wait on getconn, always have connections left to finish
+# with; otherwise they could occupy every worker while the streams' fetches
+# queue behind them. Further streams wait for a slot.
+STREAM_MAX_CONCURRENT = max(
+    min(int(os.getenv("STREAM_MAX_CONCURRENT", str(DB_POOL_MAX_SIZE // 2))), DB_POOL_MAX_SIZE - 1), 1
+)
+
+
+async def as_batches(rows: List[Dict[str, Any]]) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Wrap an already fetched result (e.g. a downsampled series) as one batch"""
+    yield rows
+
+
+async def ndjson_lines(batches: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """Encode batches of rows as newline-delimited JSON, one chunk per batch"""
+    async for rows in batches:
+        if rows:
+            yield b"".join(dumps(row) + b"\n" for row in rows)
+
+
+async def json_array_chunks(batches: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """Encode batches of rows as one JSON array, written one chunk per batch"""
+    separator = b"["
+    async for rows in batches:
+        if rows:
+            yield separator + b",".join(dumps(row) for row in rows)
+            separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
+
+def encode_stream(batches: AsyncIterator[List[Dict[str, Any]]], format: str) -> AsyncIterator[bytes]:
+    return ndjson_lines(batches) if format == "ndjson" else json_array_chunks(batches)
@@ -0,0 +1,22 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+# The app's modules live flat in backend/ and import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def database_url():
+    """DATABASE_URL of a Postgres the test may create tables in; skips without one"""
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        pytest.skip("DATABASE_URL is not set")
+    import psycopg2
+    try:
+        psycopg2.connect(url).close()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres is not reachable: {e}")
+    return url
@@ -0,0 +1,66 @@
+# tests/test_chunk_store.py
+import asyncio
+import uuid
+
+import pytest
+
+from chunk_store import CHUNK_TABLE, ChunkStore, chunk_id
+
+
+def _chunks(document_name, texts, user_id):
+    return [
+        {
+            "id": chunk_id(document_name, i + 1, user_id),
+            "document_name": document_name,
+            "document_hash": "0" * 64,
+            "section": i + 1,
+            "source": f"{document_name} - Section: {i + 1}",
+            "text": text,
+            "user_id": user_id,
+        }
+        for i, text in enumerate(texts)
+    ]
+
+
+@pytest.fixture
+def store(database_url):
+    from sqlalchemy import create_engine
+    from sqlalchemy_models import DocumentChunk
+
+    engine = create_engine(database_url.replace("postgresql://", "postgresql+psycopg2://", 1))
+    DocumentChunk.__table__.create(engine, checkfirst=True)
+    engine.dispose()
+    store = ChunkStore(database_url)
+    yield store
+    conn = store.pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DELETE FROM {CHUNK_TABLE} WHERE document_name LIKE %s", ("test-%",))
+        conn.commit()
+    finally:
+        store.pool.putconn(conn)
+
+
+def test_chunk_ids_are_scoped_by_owner():
+    assert chunk_id("manual.pdf", 1, "alice") != chunk_id("manual.pdf", 1, "bob")
+    assert chunk_id("manual.pdf", 1) != chunk_id("manual.pdf", 1, "alice")
+
+
+def test_same_document_name_from_two_users(store):
+    name = f"test-{uuid.uuid4().hex}.pdf"
+    alice = _chunks(name, ["pump", "valve", "seal"], "alice")
+    bob = _chunks(name, ["motor"], "bob")
+
+    async def run():
+        assert await store.replace_document(name, alice, "alice") == []
+        # Bob's upload leaves Alice's chunks, and so her vectors, alone
+        assert await store.replace_document(name, bob, "bob") == []
+        stored = await store.get_chunks([chunk["id"] for chunk in alice + bob])
+        assert {id_: (row["user_id"], row["text"]) for id_, row in stored.items()} == {
+            chunk["id"]: (chunk["user_id"], chunk["text"]) for chunk in alice + bob
+        }
+        # Re-uploading drops only the re-uploader's own stale sections
+        assert await store.replace_document(name, alice[:1], "alice") == sorted(c["id"] for c in alice[1:])
+        assert set(await store.get_chunks([chunk["id"] for chunk in alice + bob])) == {alice[0]["id"], bob[0]["id"]}
+
+    asyncio.run(run())
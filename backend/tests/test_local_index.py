@@ -0,0 +1,62 @@
+# tests/test_local_index.py
+import numpy as np
+import pytest
+
+hnswlib = pytest.importorskip("hnswlib")
+
+import local_index
+from local_index import LocalIndex
+
+
+@pytest.fixture(autouse=True)
+def small_threshold(monkeypatch):
+    # Build the graph at a size a test can afford
+    monkeypatch.setattr(local_index, "VECTOR_INDEX_HNSW_THRESHOLD", 500)
+
+
+def _vectors(rng, count, dimension=32, offset=0):
+    return [
+        {"id": f"v{offset + i}", "values": rng.normal(size=dimension).tolist(), "metadata": {"group": (offset + i) % 4}}
+        for i in range(count)
+    ]
+
+
+def test_hnsw_graph_matches_exact_search(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = _vectors(rng, 1200)
+    index = LocalIndex("test", str(tmp_path))
+    index.upsert(vectors[:400])
+    assert index.describe_index_stats()["hnsw"] is False
+    index.upsert(vectors[400:])
+    assert index.describe_index_stats()["hnsw"] is True
+
+    for vector in vectors[::97]:
+        matches = index.query(vector["values"], top_k=5)["matches"]
+        assert matches[0]["id"] == vector["id"]
+        assert matches[0]["score"] == pytest.approx(1.0, abs=1e-5)
+        filtered = index.query(vector["values"], top_k=5, filter={"group": {"$eq": 1}}, include_metadata=True)["matches"]
+        assert len(filtered) == 5
+        assert all(match["metadata"]["group"] == 1 for match in filtered)
+
+
+def test_hnsw_graph_follows_deletes_reused_rows_and_reopen(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = _vectors(rng, 600)
+    index = LocalIndex("test", str(tmp_path))
+    index.upsert(vectors)
+    index.delete(ids=["v0", "v1"])
+    assert "v0" not in [match["id"] for match in index.query(vectors[0]["values"], top_k=5)["matches"]]
+
+    # New vectors take the freed rows, and growing the matrix resizes the graph
+    extra = _vectors(rng, 1500, offset=600)
+    index.upsert(extra)
+    for vector in (extra[0], extra[1], extra[-1]):
+        assert index.query(vector["values"], top_k=1)["matches"][0]["id"] == vector["id"]
+    index.close()
+
+    reopened = LocalIndex("test", str(tmp_path))
+    assert reopened.describe_index_stats() == index.describe_index_stats()
+    assert (tmp_path / "hnsw.bin").exists()
+    for vector in (vectors[5], extra[7]):
+        assert reopened.query(vector["values"], top_k=1)["matches"][0]["id"] == vector["id"]
+    assert "v1" not in [match["id"] for match in reopened.query(vectors[1]["values"], top_k=5)["matches"]]
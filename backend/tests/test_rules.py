@@ -0,0 +1,30 @@
+# tests/test_rules.py
+from datetime import datetime
+
+import numpy as np
+
+from models import Rule
+from rules import evaluate_rule
+
+
+def _rule(**limits):
+    return Rule(id=1, tagId="A", condition="greater_than", threshold=75, severity="high",
+                createdAt=datetime(2024, 1, 1), **limits)
+
+
+# One reading per second: a spike, a 3-reading run and a 10-reading run
+VALUES = np.full(40, 50.0)
+VALUES[5] = 90
+VALUES[10:13] = 80
+VALUES[20:30] = 85
+TIMESTAMPS = np.arange(40, dtype=np.int64) * 1000
+
+
+def test_every_violation_is_a_region_by_default():
+    assert [r["pointCount"] for r in evaluate_rule(_rule(), TIMESTAMPS, VALUES)] == [1, 3, 10]
+
+
+def test_short_regions_are_left_out():
+    assert [r["pointCount"] for r in evaluate_rule(_rule(minPoints=3), TIMESTAMPS, VALUES)] == [3, 10]
+    assert [r["pointCount"] for r in evaluate_rule(_rule(minDurationSeconds=5), TIMESTAMPS, VALUES)] == [10]
+    assert evaluate_rule(_rule(minPoints=11), TIMESTAMPS, VALUES) == []
@@ -0,0 +1,78 @@
+# app/vector_index.py
+import os
+from typing import Any, Dict, List, Optional
+
+# Pinecone client shared by every PineconeIndex, created on first use
+_pinecone = None
+
+
+class VectorIndex:
+    """
+    Interface of the vector indexes the app writes to and queries, modelled on
+    the subset of the Pinecone Index API it uses. query() returns
+    {"matches": [{"id", "score", "metadata"?, "values"?}, ...]} best first,
+    with cosine similarity scores; `filter` takes Pinecone metadata filters.
+    """
+
+    def upsert(self, vectors: List[Dict[str, Any]], **kwargs) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def update(self, id: str, set_metadata: Optional[Dict[str, Any]] = None, **kwargs) -> None:
+        raise NotImplementedError
+
+    def fetch(self, ids: List[str], **kwargs) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def delete(self, ids: List[str], **kwargs) -> None:
+        raise NotImplementedError
+
+    def describe_index_stats(self, **kwargs) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Persist the index to disk; a no-op for remote indexes"""
+
+
+class PineconeIndex(VectorIndex):
+    """A Pinecone serverless index"""
+
+    def __init__(self, name: str):
+        global _pinecone
+        if _pinecone is None:
+            from pinecone import Pinecone
+            _pinecone = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        self.name = name
+        self._index = _pinecone.Index(name=name)
+
+    def upsert(self, vectors, **kwargs):
+        return self._index.upsert(vectors=vectors, **kwargs)
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False, filter=None, **kwargs):
+        if filter:
+            kwargs["filter"] = filter
+        return self._index.query(
+            vector=vector, top_k=top_k, include_metadata=include_metadata, include_values=include_values, **kwargs
+        )
+
+    def update(self, id, set_metadata=None, **kwargs):
+        return self._index.update(id=id, set_metadata=set_metadata, **kwargs)
+
+    def fetch(self, ids, **kwargs):
+        return self._index.fetch(ids=ids, **kwargs)
+
+    def delete(self, ids, **kwargs):
+        return self._index.delete(ids=ids, **kwargs)
+
+    def describe_index_stats(self, **kwargs):
+        return self._index.describe_index_stats(**kwargs)
@@ -1,14 +1,51 @@
 # app/vector_store.py
 import os
-from pinecone import Pinecone, ServerlessSpec
-from embedding import embed_text
-from typing import List
+import asyncio
+import threading
+from embedding import embed_text, embed_many
+from typing import Dict, List
 from utils import extract_text_chunks
+from vector_writer import get_vector_writer
+from vector_index import VectorIndex, PineconeIndex
+from local_index import LocalIndex
+from chunk_store import ChunkStore, chunk_id, document_hash
 
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-indexes = pc.list_indexes()
-print("Indexes:", indexes)
-index = pc.Index(name=os.getenv("PINECONE_INDEX_NAME"))
+# "pinecone", or "local" to serve every index from disk under
+# VECTOR_INDEX_PATH/<index name> without network access
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "vector_indexes")
+
+_indexes: Dict[str, VectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_vector_index(name: str) -> VectorIndex:
+    """Return the process-wide index called `name` on VECTOR_BACKEND, opening it on first use"""
+    with _indexes_lock:
+        index = _indexes.get(name)
+        if index is None:
+            if VECTOR_BACKEND == "pinecone":
+                index = PineconeIndex(name)
+            elif VECTOR_BACKEND == "local":
+                index = LocalIndex(name, os.path.join(VECTOR_INDEX_PATH, name) if VECTOR_INDEX_PATH else None)
+            else:
+                raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+            _indexes[name] = index
+        return index
+
+
+def close_vector_indexes() -> None:
+    """Persist every index opened by get_vector_index"""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        index.close()
+
+
+index = get_vector_index(os.getenv("PINECONE_INDEX_NAME", "documents"))
+document_writer = get_vector_writer("documents", index)
+# Chunk texts live here; document vectors only carry filterable metadata
+chunk_store = ChunkStore()
 # pc.create_index(
 #     name="timeseries",
 #     dimension=1024,  # must match your embedding model
@@ -19,7 +56,7 @@ index = pc.Index(name=os.getenv("PINECONE_INDEX_NAME"))
 #     )
 # )
 # a1nnotation-rules-index-1
-pinecone_index = pc.Index(name="timeseries")
+pinecone_index = get_vector_index("timeseries")
 stats = pinecone_index.describe_index_stats()
 print(stats)
 
@@ -44,13 +81,17 @@ async def query_pinecone(request, user_id=None) -> List[dict]:
         # filter=filter_
     )
     print("haharesults:", results)
+    # Hydrate the matches' texts in one lookup; vectors indexed before the
+    # chunk store existed still carry their text in metadata
+    stored = await chunk_store.get_chunks([match["id"] for match in results["matches"]])
     chunks = []
     for match in results["matches"]:
-        meta = match.get("metadata", {})
+        meta = match.get("metadata") or {}
+        chunk = stored.get(match["id"], {})
         chunks.append(
             {
-                "text": meta.get("text", ""),
-                "source": meta.get("source", "unknown"),  # safe default
+                "text": chunk.get("text") or meta.get("text", ""),
+                "source": chunk.get("source") or meta.get("source", "unknown"),  # safe default
                 "score": match.get("score", 0),
             }
         )
@@ -70,29 +111,46 @@ async def upsert_document(file, s3_url, document_name, document_type, user_id=No
     # Extract text chunks
     extracted_chunks = extract_text_chunks(file, s3_url)
     print("extracted_chunks", extract_text_chunks)
-    for i, chunk_text in enumerate(extracted_chunks):
-        section = i + 1
-        embedding = await embed_text(chunk_text)  # <- await the coroutine
+    embeddings = await embed_many(extracted_chunks)
+    file_hash = document_hash(file)
+    records = [
+        {
+            "id": chunk_id(document_name, i + 1, user_id),
+            "document_name": document_name,
+            "document_hash": file_hash,
+            "section": i + 1,
+            "source": f"{document_name} - Section: {i + 1}",
+            "text": chunk_text,
+            "user_id": user_id,
+        }
+        for i, chunk_text in enumerate(extracted_chunks)
+    ]
+    # Texts are stored before the vectors that reference them; sections
+    # dropped since the document was last uploaded lose their vectors too
+    stale_ids = await chunk_store.replace_document(document_name, records, user_id)
+    if stale_ids:
+        await asyncio.to_thread(index.delete, ids=stale_ids)
+    vectors = []
+    for record, embedding in zip(records, embeddings):
         embedding_list = (
             embedding.tolist() if hasattr(embedding, "tolist") else list(embedding)
         )
 
         metadata = {
-            "text": chunk_text,
-            "source": f"{document_name} - Section: {section}",
+            "document": document_name,
+            "section": record["section"],
         }
         if user_id:
             metadata["user_id"] = user_id
 
-        index.upsert(
-            vectors=[
-                {
-                    "id": f"{document_name}-{section}-{i}",
-                    "values": embedding_list,
-                    "metadata": metadata,
-                }
-            ]
+        vectors.append(
+            {
+                "id": record["id"],
+                "values": embedding_list,
+                "metadata": metadata,
+            }
         )
+    await document_writer.write_async(vectors)
 
 
 def upsert_to_pinecone(id: str, text: str, metadata: dict):
@@ -0,0 +1,231 @@
+# app/vector_writer.py
+import os
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from responses import dumps
+
+# Pinecone accepts at most 1000 vectors and 2 MB per upsert request
+VECTOR_WRITE_BATCH_SIZE = int(os.getenv("VECTOR_WRITE_BATCH_SIZE", "200"))
+VECTOR_WRITE_MAX_BYTES = int(os.getenv("VECTOR_WRITE_MAX_BYTES", str(2 * 10**6 - 64 * 1024)))
+# Upsert requests in flight at once per index
+VECTOR_WRITE_CONCURRENCY = int(os.getenv("VECTOR_WRITE_CONCURRENCY", "4"))
+# Seconds a buffered vector waits for a batch to fill before it is sent anyway
+VECTOR_WRITE_FLUSH_INTERVAL = float(os.getenv("VECTOR_WRITE_FLUSH_INTERVAL", "1"))
+VECTOR_WRITE_MAX_RETRIES = int(os.getenv("VECTOR_WRITE_MAX_RETRIES", "4"))
+VECTOR_WRITE_RETRY_BASE_DELAY = float(os.getenv("VECTOR_WRITE_RETRY_BASE_DELAY", "0.5"))
+
+
+class VectorWriter:
+    """
+    Buffers vectors bound for one index and upserts them in batches bounded by
+    vector count and payload size, with up to `concurrency` requests in flight
+    and jittered retries. Buffered vectors are sent once a batch fills, after
+    `flush_interval` seconds, on flush(), and on close(); write() skips the
+    buffer and sends the caller's vectors as batches of their own. The worker
+    threads start on the first add() or write() after creation or close().
+    Safe to share across threads and requests.
+    """
+
+    def __init__(
+        self,
+        index: Any,
+        name: str = "index",
+        batch_size: int = VECTOR_WRITE_BATCH_SIZE,
+        max_batch_bytes: int = VECTOR_WRITE_MAX_BYTES,
+        concurrency: int = VECTOR_WRITE_CONCURRENCY,
+        flush_interval: float = VECTOR_WRITE_FLUSH_INTERVAL,
+        max_retries: int = VECTOR_WRITE_MAX_RETRIES,
+    ):
+        self.index = index
+        self.name = name
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.concurrency = concurrency
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_bytes = 0
+        self._oldest: Optional[float] = None
+        self._in_flight: "set[Future]" = set()
+        self._stopping = False
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._stats = {"batches": 0, "vectors": 0, "bytes": 0, "retries": 0, "failed_batches": 0, "failed_vectors": 0}
+
+    def add(self, vectors: List[Dict[str, Any]]) -> None:
+        """Buffer `vectors` (Pinecone upsert dicts); full batches are sent right away"""
+        with self._lock:
+            for vector in vectors:
+                size = len(dumps(vector))
+                if self._buffer and (
+                    len(self._buffer) >= self.batch_size or self._buffer_bytes + size > self.max_batch_bytes
+                ):
+                    self._submit_buffer()
+                self._buffer.append(vector)
+                self._buffer_bytes += size
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+            if len(self._buffer) >= self.batch_size or self._buffer_bytes >= self.max_batch_bytes:
+                self._submit_buffer()
+            if self._buffer and self._flusher is None:
+                self._stopping = False
+                self._flusher = threading.Thread(target=self._flush_periodically, name=f"vectors-{self.name}-flush", daemon=True)
+                self._flusher.start()
+        self._wakeup.set()
+
+    def _submit_buffer(self) -> None:
+        """Send the buffered batch; call with the lock held"""
+        batch, size = self._buffer, self._buffer_bytes
+        self._buffer, self._buffer_bytes, self._oldest = [], 0, None
+        self._submit(batch, size)
+
+    def _submit(self, batch: List[Dict[str, Any]], size: int) -> Future:
+        """Queue one upsert request; call with the lock held"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"vectors-{self.name}")
+        future = self._executor.submit(self._write, batch, size)
+        self._in_flight.add(future)
+        future.add_done_callback(self._in_flight.discard)
+        return future
+
+    def write(self, vectors: List[Dict[str, Any]]) -> List[Future]:
+        """
+        Send `vectors` right away in batches of their own, bypassing the
+        buffer, and return the futures of just those batches. For callers that
+        must know their own vectors were written without waiting on (or
+        failing with) batches other callers added.
+        """
+        futures = []
+        batch, size = [], 0
+        with self._lock:
+            for vector in vectors:
+                vector_size = len(dumps(vector))
+                if batch and (len(batch) >= self.batch_size or size + vector_size > self.max_batch_bytes):
+                    futures.append(self._submit(batch, size))
+                    batch, size = [], 0
+                batch.append(vector)
+                size += vector_size
+            if batch:
+                futures.append(self._submit(batch, size))
+        return futures
+
+    async def write_async(self, vectors: List[Dict[str, Any]]) -> int:
+        """write() and wait for its batches without blocking the event loop; raises if any of them failed"""
+        futures = self.write(vectors)
+        results = await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+        return sum(results)
+
+    def _write(self, batch: List[Dict[str, Any]], size: int) -> int:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.index.upsert(vectors=batch)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self._stats["failed_batches"] += 1
+                        self._stats["failed_vectors"] += len(batch)
+                    print(f"Failed to upsert {len(batch)} vectors to {self.name}: {e}")
+                    raise
+                delay = random.uniform(0, VECTOR_WRITE_RETRY_BASE_DELAY * 2 ** attempt)
+                with self._lock:
+                    self._stats["retries"] += 1
+                print(f"Upsert of {len(batch)} vectors to {self.name} failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["vectors"] += len(batch)
+            self._stats["bytes"] += size
+        return len(batch)
+
+    def _flush_periodically(self) -> None:
+        """Send partial batches once their oldest vector has waited flush_interval"""
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                if self._stopping:
+                    self._flusher = None
+                    return
+                oldest = self._oldest
+                if oldest is None:
+                    self._wakeup.clear()
+                    continue
+                wait = oldest + self.flush_interval - time.monotonic()
+                if wait <= 0:
+                    self._submit_buffer()
+                    continue
+            time.sleep(wait)
+
+    def _pending(self) -> List[Future]:
+        with self._lock:
+            if self._buffer:
+                self._submit_buffer()
+            return list(self._in_flight)
+
+    def flush(self) -> int:
+        """Send the buffer and wait for every in-flight batch; raises if any of them failed"""
+        futures = self._pending()
+        return sum(future.result() for future in futures)
+
+    async def flush_async(self) -> int:
+        """flush() without blocking the event loop"""
+        futures = self._pending()
+        results = await asyncio.gather(*[asyncio.wrap_future(future) for future in futures])
+        return sum(results)
+
+    def close(self) -> None:
+        """Flush, then stop the worker threads; failures are logged by _write"""
+        try:
+            self.flush()
+        except Exception:
+            pass
+        with self._lock:
+            self._stopping = True
+            executor, self._executor = self._executor, None
+        self._wakeup.set()
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot of buffered and written vector counts"""
+        with self._lock:
+            return {
+                "buffered": len(self._buffer),
+                "in_flight": len(self._in_flight),
+                "batch_size": self.batch_size,
+                "max_batch_bytes": self.max_batch_bytes,
+                **self._stats,
+            }
+
+
+_writers: Dict[str, VectorWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_vector_writer(name: str, index: Any) -> VectorWriter:
+    """Return the process-wide writer for the index called `name`, creating it on first use"""
+    with _writers_lock:
+        writer = _writers.get(name)
+        if writer is None:
+            writer = VectorWriter(index, name=name)
+            _writers[name] = writer
+        return writer
+
+
+def close_vector_writers() -> None:
+    """Flush and close every writer created by get_vector_writer"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.close()
+
+
+def vector_writer_metrics() -> Dict[str, Dict[str, Any]]:
+    with _writers_lock:
+        return {name: writer.metrics() for name, writer in _writers.items()}
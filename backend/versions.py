@@ -0,0 +1,88 @@
+# app/versions.py
+import uuid
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from functools import wraps
+from typing import Callable, Dict, Optional, Tuple
+
+# Resources whose reads are cached by version. Time-series writes (ingest,
+# clear, dataset delete) change the readings, the tag catalog and the dataset
+# counts together.
+TIME_SERIES_RESOURCES = ("timeseries", "tags", "datasets")
+
+# Sent with every versioned response so browsers revalidate each poll rather
+# than heuristically reusing the body off Last-Modified
+VERSIONED_CACHE_CONTROL = "no-cache"
+
+
+class ResourceVersions:
+    """
+    Per-resource version counters bumped by the storage write paths, so read
+    endpoints can answer conditional GETs without querying Postgres. The
+    counters live in this process: like the upload jobs, they assume a single
+    worker serving all writes. ETags carry a per-process token, so ones issued
+    before a restart never match. `on_bump` is called with the bumped
+    resources, e.g. to invalidate cached reads.
+    """
+
+    def __init__(self, on_bump: Optional[Callable[..., None]] = None):
+        self.on_bump = on_bump
+        self._token = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._started = datetime.now(timezone.utc)
+        self._versions: Dict[str, Tuple[int, datetime]] = {}
+
+    def bump(self, *resources: str) -> None:
+        """Mark `resources` as changed; call once the write has committed (or failed)"""
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            for resource in resources:
+                version, _ = self._versions.get(resource, (0, self._started))
+                self._versions[resource] = (version + 1, now)
+        if self.on_bump:
+            self.on_bump(*resources)
+
+    def get(self, resource: str) -> Tuple[int, datetime]:
+        """(version, last modified) of `resource`"""
+        with self._lock:
+            return self._versions.get(resource, (0, self._started))
+
+    def headers(self, resource: str) -> Dict[str, str]:
+        """ETag, Last-Modified and Cache-Control of the current version of `resource`"""
+        version, modified = self.get(resource)
+        return {
+            "ETag": f'W/"{resource}-{self._token}-{version}"',
+            "Last-Modified": format_datetime(modified.replace(microsecond=0), usegmt=True),
+            "Cache-Control": VERSIONED_CACHE_CONTROL,
+        }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against `etag`"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
+
+
+def bumps(*resources: str):
+    """
+    Decorate an async DatabaseStorage write method to bump `resources` once it
+    returns or raises; a failed write may still have committed part of its work
+    """
+    def decorator(method):
+        @wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                self.versions.bump(*resources)
+        return wrapper
+    return decorator
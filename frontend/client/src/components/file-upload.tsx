@@ -4,14 +4,7 @@ import { Button } from "@/components/ui/button";
 import { Progress } from "@/components/ui/progress";
 import { CloudUpload, CheckCircle, AlertCircle, X } from "lucide-react";
 import { useToast } from "@/hooks/use-toast";
-import api from "@/lib/api";
-
-interface UploadResult {
-  success: boolean;
-  rowsProcessed: number;
-  rowsInserted: number;
-  errors?: string[];
-}
+import api, { waitForUploadJob, type UploadJob, type UploadResult } from "@/lib/api";
 
 interface FileUploadProps {
   
@@ -45,11 +38,14 @@ export function FileUpload({ onFileUploaded}: FileUploadProps) {
           'Content-Type': 'multipart/form-data',
         },
       });
-      
+
+      // The server processes the file as a background job; poll until it finishes
+      const job = response.data as UploadJob;
+      const result = await waitForUploadJob(job.id);
+
       clearInterval(progressInterval);
       setUploadProgress(100);
-      
-      const result = response.data as UploadResult;
+
       setUploadResult(result);
       
       toast({
@@ -19,4 +19,42 @@ api.interceptors.response.use(
   }
 );
 
-export default api;
\ No newline at end of file
+export interface UploadResult {
+  success: boolean;
+  rowsProcessed: number;
+  rowsInserted: number;
+  errors?: string[];
+}
+
+export interface UploadJob {
+  id: string;
+  filename: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+  phase?: 'parse' | 'insert' | 'embed' | 'index' | null;
+  rowsProcessed: number;
+  rowsInserted: number;
+  rowsPerSecond: number;
+  errors: string[];
+  result?: UploadResult | null;
+}
+
+// Poll an upload job until it finishes and return its result
+export async function waitForUploadJob(
+  jobId: string,
+  onUpdate?: (job: UploadJob) => void,
+  intervalMs = 1000,
+): Promise<UploadResult> {
+  for (;;) {
+    const { data: job } = await api.get<UploadJob>(`/api/upload/jobs/${jobId}`);
+    onUpdate?.(job);
+    if (job.status === 'succeeded' && job.result) {
+      return job.result;
+    }
+    if (job.status === 'failed' || job.status === 'cancelled') {
+      throw new Error(job.errors[0] || `Upload ${job.status}`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
+
+export default api;
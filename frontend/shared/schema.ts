@@ -206,6 +206,47 @@ export interface TagInfo {
   minRange: number;
   maxRange: number;
   color: string;
+  firstTimestamp?: string | null;
+  lastTimestamp?: string | null;
+  numPoints?: number;
+}
+
+// /api/timeseries?format=columnar: metadata once per tag, readings as
+// parallel arrays of epoch-ms timestamps and raw values
+export interface TimeSeriesColumns {
+  tags: Array<{
+    tagId: string;
+    tagLabel?: string;
+    unit?: string;
+    minRange?: number;
+    maxRange?: number;
+    color?: string;
+    timestamps: number[];
+    values: number[];
+  }>;
+}
+
+export interface Dataset {
+  id: number;
+  name: string;
+  description?: string | null;
+  createdAt: string;
+  tagCount: number;
+  numPoints: number;
+}
+
+// /api/rules/evaluate: consecutive violating readings of a rule, merged
+export interface RuleViolation {
+  ruleId: number;
+  tagId: string;
+  condition: string;
+  severity: string;
+  description?: string | null;
+  startTime: string;
+  endTime: string;
+  pointCount: number;
+  minValue: number;
+  maxValue: number;
 }
 
 export interface ChartDataPoint {